@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Face recognition system - benchmarks
+
+Usage:
+    python benchmark.py prefilter <image_folder>
+    python benchmark.py profiles <labelled_folder>   (one sub-folder of images per person)
+    python benchmark.py quantization [--synthetic N] [--queries Q]
+    python benchmark.py metadata [--encodings N] [--per-person P]
+    python benchmark.py encoding <group_photo> [--counts 1,2,4,...]
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from config import FACE_RECOGNITION_CONFIG, GALLERY_CONFIG
+from face_recognition.batch_recognizer import IMAGE_EXTENSIONS
+from face_recognition.profiles import profile_names, get_profile
+
+def list_images(folder):
+    """All image files under a folder, sorted"""
+    paths = []
+    for root, dirs, files in os.walk(folder):
+        for filename in files:
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(root, filename))
+    return sorted(paths)
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    intersection = (right - left) * (bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+def benchmark_prefilter(detector, image_paths):
+    """Compare the pre-filtered detection path against plain dlib detection"""
+    baseline_faces = 0
+    recalled_faces = 0
+    rejected_images = 0
+    missed_images = 0
+    baseline_time = 0.0
+    prefilter_time = 0.0
+
+    for path in image_paths:
+        image = detector.load_image(path)
+
+        start = time.perf_counter()
+        baseline = detector.locate_faces(image, prefilter=False)
+        baseline_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        filtered = detector.locate_faces(image, prefilter=True)
+        prefilter_time += time.perf_counter() - start
+
+        baseline_faces += len(baseline)
+        recalled_faces += sum(1 for box in baseline
+                              if any(box_iou(box, other) >= 0.5 for other in filtered))
+        if not filtered:
+            rejected_images += 1
+            if baseline:
+                missed_images += 1
+
+    count = max(len(image_paths), 1)
+    print(f"Images:                    {len(image_paths)}")
+    print(f"Rejected by pre-filter:    {rejected_images} ({missed_images} of them had faces)")
+    print(f"Face recall vs. baseline:  {recalled_faces}/{baseline_faces} "
+          f"({recalled_faces / max(baseline_faces, 1):.1%})")
+    print(f"Baseline detection:        {baseline_time / count * 1000:.1f} ms/image")
+    print(f"Pre-filtered detection:    {prefilter_time / count * 1000:.1f} ms/image")
+
+def load_labelled_set(folder):
+    """{person name: [image paths]} from one sub-folder per person"""
+    people = {}
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isdir(path):
+            images = list_images(path)
+            if images:
+                people[name] = images
+    return people
+
+def calibrate_profiles(detector, people):
+    """Latency and identification accuracy of every profile on a labelled image set.
+
+    The first usable image of each person is enrolled; the rest are queries.
+    """
+    tolerance = FACE_RECOGNITION_CONFIG['tolerance']
+    print(f"{'profile':<10} {'ms/img':>8} {'p95 ms':>8} {'detected':>9} "
+          f"{'correct':>8} {'wrong':>6} {'rejected':>9}")
+
+    for profile in profile_names():
+        timings = []
+        detected = 0
+        total = 0
+        gallery, gallery_labels, queries = [], [], []
+
+        for name, paths in people.items():
+            for path in paths:
+                image = detector.load_image(path)
+                start = time.perf_counter()
+                _, encodings = detector.detect_faces_in_image(path, image=image, profile=profile)
+                timings.append(time.perf_counter() - start)
+                total += 1
+                if len(encodings) != 1:
+                    continue
+                detected += 1
+                if name not in gallery_labels:
+                    gallery.append(encodings[0])
+                    gallery_labels.append(name)
+                else:
+                    queries.append((name, encodings[0]))
+
+        correct = wrong = rejected = 0
+        if gallery:
+            gallery = np.array(gallery)
+            for name, encoding in queries:
+                distances = np.linalg.norm(gallery - encoding, axis=1)
+                best = int(np.argmin(distances))
+                if distances[best] > tolerance:
+                    rejected += 1
+                elif gallery_labels[best] == name:
+                    correct += 1
+                else:
+                    wrong += 1
+
+        query_count = max(len(queries), 1)
+        print(f"{profile:<10} {np.mean(timings) * 1000:>8.1f} {np.percentile(timings, 95) * 1000:>8.1f} "
+              f"{detected / max(total, 1):>9.1%} {correct / query_count:>8.1%} "
+              f"{wrong / query_count:>6.1%} {rejected / query_count:>9.1%}")
+
+def check_quantization(encodings, query_count, k=5):
+    """Accuracy, speed and memory of the quantized gallery scan against the exact scan.
+
+    Queries are gallery encodings with small noise added, so each has a clear
+    nearest neighbour as in real repeat sightings.
+    """
+    from face_recognition.gallery import GallerySnapshot, PersonTable
+
+    rng = np.random.default_rng(0)
+    count = len(encodings)
+    ids = np.arange(count, dtype=np.int64)
+    sample = rng.choice(count, size=min(query_count, count), replace=False)
+    queries = encodings[sample] + rng.normal(0, 0.02, size=(len(sample), encodings.shape[1]))
+    tolerance = FACE_RECOGNITION_CONFIG['tolerance']
+    configured = GALLERY_CONFIG['quantization']
+
+    results = {}
+    try:
+        for mode in (None, 'float16', 'int8'):
+            GALLERY_CONFIG['quantization'] = mode
+            exact_dtype = np.float64 if mode is None else np.float32
+            snapshot = GallerySnapshot(0, encodings.astype(exact_dtype), ids.copy(),
+                                       np.zeros(count, dtype=np.int32), PersonTable([{'person_id': 0}]))
+            start = time.perf_counter()
+            neighbours = [snapshot.nearest(query, k) for query in queries]
+            elapsed = time.perf_counter() - start
+            results[mode] = (neighbours, elapsed, snapshot.nbytes)
+    finally:
+        GALLERY_CONFIG['quantization'] = configured
+
+    exact, exact_time, exact_bytes = results[None]
+    print(f"Gallery: {count} encodings, {len(queries)} queries, "
+          f"{GALLERY_CONFIG['rerank_candidates']} re-rank candidates")
+    print(f"{'mode':<8} {'MB':>8} {'ms/query':>9} {'top-1':>7} {f'recall@{k}':>9} "
+          f"{'decision':>9} {'max dist err':>13}")
+    print(f"{'exact':<8} {exact_bytes / 1e6:>8.1f} {exact_time / len(queries) * 1000:>9.2f} "
+          f"{1:>7.1%} {1:>9.1%} {1:>9.1%} {0:>13.2e}")
+    for mode in ('float16', 'int8'):
+        neighbours, elapsed, nbytes = results[mode]
+        top1 = recall = decision = 0
+        max_error = 0.0
+        for (exact_idx, exact_dist), (idx, dist) in zip(exact, neighbours):
+            top1 += idx[0] == exact_idx[0]
+            recall += len(set(idx) & set(exact_idx)) / len(exact_idx)
+            decision += (dist[0] <= tolerance) == (exact_dist[0] <= tolerance)
+            max_error = max(max_error, abs(dist[0] - exact_dist[0]))
+        n = len(queries)
+        print(f"{mode:<8} {nbytes / 1e6:>8.1f} {elapsed / n * 1000:>9.2f} {top1 / n:>7.1%} "
+              f"{recall / n:>9.1%} {decision / n:>9.1%} {max_error:>13.2e}")
+
+def benchmark_encoding(detector, image_path, counts):
+    """Serial vs. pooled encoding time for growing numbers of faces.
+
+    The faces detected in the photo are repeated as needed to reach each count.
+    """
+    import face_recognition
+    from face_recognition.encoding_pool import EncodingPool, fork_available
+    from face_recognition.image_io import decode_image
+
+    settings = get_profile()
+    image = decode_image(image_path, settings['max_size'])[0]
+    faces = detector.locate_faces(image)
+    if not faces:
+        print(f"未检测到人脸: {image_path}")
+        sys.exit(1)
+    if detector.encoding_pool is None and not fork_available():
+        print("当前平台不支持 fork，无法使用编码进程池")
+        sys.exit(1)
+    pool = detector.encoding_pool or EncodingPool()
+
+    print(f"{len(faces)} faces detected, {pool.workers} workers, "
+          f"pool used from {pool.min_faces} faces")
+    print(f"{'faces':>6} {'serial ms':>10} {'pool ms':>9} {'speedup':>8} {'max diff':>9}")
+    for count in counts:
+        locations = (faces * (count // len(faces) + 1))[:count]
+        start = time.perf_counter()
+        serial = face_recognition.face_encodings(image, locations, num_jitters=settings['num_jitters'],
+                                                 model=settings['landmark_model'])
+        serial_time = time.perf_counter() - start
+        start = time.perf_counter()
+        pooled = pool.encode(image, locations, settings['num_jitters'], settings['landmark_model'])
+        pool_time = time.perf_counter() - start
+        # Crops give the landmarker the same pixels, so encodings should agree closely
+        diff = max(float(np.max(np.abs(np.asarray(a) - np.asarray(b)))) for a, b in zip(serial, pooled))
+        print(f"{count:>6} {serial_time * 1000:>10.1f} {pool_time * 1000:>9.1f} "
+              f"{serial_time / pool_time:>7.2f}x {diff:>9.2e}")
+
+def _traced(build):
+    """(result, bytes still allocated, peak bytes) of a build function"""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+def check_metadata(count, per_person):
+    """Memory of per-encoding person info against the person table layout.
+
+    Synthetic persons with per_person encodings each; the encoding matrix is
+    the same for both layouts and is left out.
+    """
+    from face_recognition.gallery import GallerySnapshot
+
+    person_count = max(1, count // per_person)
+    person_ids = np.repeat(np.arange(1, person_count + 1, dtype=np.int64), per_person)[:count]
+    encodings = np.zeros((len(person_ids), 128), dtype=GallerySnapshot.encoding_dtype())
+    encoding_ids = np.arange(len(person_ids), dtype=np.int64)
+
+    def person_info(person_id):
+        # Fresh strings per call, like values fetched from one database row
+        return {
+            'person_id': person_id,
+            'name': f'人员{person_id}',
+            'age': 30 + person_id % 40,
+            'gender': '男' if person_id % 2 else '女',
+            'phone': f'138{person_id:08d}',
+            'email': f'person{person_id}@example.com',
+            'address': f'某市某区某路{person_id}号',
+            # Ten sites over consecutive ids, so rows are already in partition order
+            'site': f'site{(person_id - 1) * 10 // person_count}'
+        }
+
+    def per_encoding():
+        # The previous layout: one info dict per encoding plus a parallel name list
+        infos = tuple(person_info(person_id) for person_id in person_ids.tolist())
+        return infos, [info['name'] for info in infos], person_ids.copy()
+
+    def person_table():
+        persons = {person_id: person_info(person_id) for person_id in range(1, person_count + 1)}
+        return GallerySnapshot.from_arrays(0, encodings, encoding_ids, person_ids, persons)
+
+    print(f"Gallery: {len(person_ids)} encodings, {person_count} persons "
+          f"({per_person} encodings each)")
+    print(f"{'layout':<14} {'MB':>9} {'peak MB':>9} {'bytes/encoding':>15}")
+    for label, build in (('per-encoding', per_encoding), ('person table', person_table)):
+        start = time.perf_counter()
+        result, current, peak = _traced(build)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<14} {current / 1e6:>9.1f} {peak / 1e6:>9.1f} "
+              f"{current / len(person_ids):>15.1f}   ({elapsed:.1f}s)")
+        del result
+
+def main():
+    parser = argparse.ArgumentParser(description="人脸识别系统 - 性能测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    prefilter_parser = subparsers.add_parser('prefilter', help="预筛选召回率与速度")
+    prefilter_parser.add_argument('folder', help="图片文件夹")
+
+    profiles_parser = subparsers.add_parser('profiles', help="各识别档位的耗时与准确率")
+    profiles_parser.add_argument('folder', help="标注图片文件夹（每人一个子文件夹）")
+
+    quantization_parser = subparsers.add_parser('quantization', help="量化人脸库与精确扫描的准确率对比")
+    quantization_parser.add_argument('--synthetic', type=int, default=0,
+                                     help="使用 N 个随机编码代替数据库中的人脸库")
+    quantization_parser.add_argument('--queries', type=int, default=500, help="查询数")
+
+    metadata_parser = subparsers.add_parser('metadata', help="人员信息内存占用（每编码一份 vs 人员表）")
+    metadata_parser.add_argument('--encodings', type=int, default=1000000, help="合成人脸库的编码数")
+    metadata_parser.add_argument('--per-person', type=int, default=20, help="每人的编码数")
+
+    encoding_parser = subparsers.add_parser('encoding', help="多人脸并行编码的加速比")
+    encoding_parser.add_argument('image', help="多人合影图片")
+    encoding_parser.add_argument('--counts', default='1,2,4,8,16,32,48,64',
+                                 help="测试的人脸数（逗号分隔）")
+
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("人脸识别系统 - 性能测试")
+    print("=" * 50)
+
+    if args.command == 'metadata':
+        check_metadata(args.encodings, args.per_person)
+        return
+
+    if args.command == 'quantization' and args.synthetic:
+        # Roughly the spread of dlib face encodings
+        encodings = np.random.default_rng(1).normal(0, 0.09, size=(args.synthetic, 128))
+        check_quantization(encodings, args.queries)
+        return
+
+    from face_recognition.face_detector import FaceDetector
+    detector = FaceDetector()
+
+    if args.command == 'quantization':
+        encodings = np.asarray(detector.gallery.encodings, dtype=np.float64)
+        if not len(encodings):
+            print("人脸库为空，可使用 --synthetic N")
+            sys.exit(1)
+        check_quantization(encodings, args.queries)
+    elif args.command == 'prefilter':
+        image_paths = list_images(args.folder)
+        if not image_paths:
+            print(f"未找到图片: {args.folder}")
+            sys.exit(1)
+        benchmark_prefilter(detector, image_paths)
+    elif args.command == 'encoding':
+        counts = [int(count) for count in args.counts.split(',') if count.strip()]
+        benchmark_encoding(detector, args.image, counts)
+    elif args.command == 'profiles':
+        people = load_labelled_set(args.folder)
+        if not people:
+            print(f"未找到标注图片: {args.folder}")
+            sys.exit(1)
+        calibrate_profiles(detector, people)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Face recognition system - offline clustering of unknown faces
+
+Run periodically (e.g. nightly from cron). Each run only processes unknown
+faces saved since earlier runs; resulting clusters are listed at
+GET /unknown_clusters and enrolled with POST /unknown_clusters/<id>/enroll.
+"""
+
+import sys
+import time
+from database.db_manager import DatabaseManager
+from face_recognition.unknown_clustering import cluster_unknown_faces
+
+def main():
+    print("=" * 50)
+    print("人脸识别系统 - 未识别人脸聚类")
+    print("=" * 50)
+
+    db_manager = DatabaseManager()
+    try:
+        start = time.perf_counter()
+        stats = cluster_unknown_faces(db_manager)
+        elapsed = time.perf_counter() - start
+    except RuntimeError as e:
+        print(f"聚类失败: {e}")
+        sys.exit(1)
+    finally:
+        db_manager.disconnect()
+
+    print(f"Unclustered faces processed: {stats['unclustered']}")
+    print(f"Joined existing clusters:    {stats['joined_existing']} "
+          f"({stats['updated_clusters']} clusters)")
+    print(f"New clusters:                {stats['new_clusters']} "
+          f"({stats['new_cluster_faces']} faces)")
+    print(f"Elapsed:                     {elapsed:.1f} s")
+
+if __name__ == '__main__':
+    main()
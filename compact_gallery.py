@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Face recognition system - gallery compaction
+
+Caps and deduplicates stored encodings per person (COMPACTION_CONFIG) and
+reports the matching-quality impact. Dry run by default.
+
+Usage:
+    python compact_gallery.py [--apply]
+"""
+
+import argparse
+import sys
+from database.db_manager import DatabaseManager
+from face_recognition.compaction import plan_compaction, evaluate_compaction
+
+def print_report(stats):
+    queries = max(stats['queries'], 1)
+    print(f"Persons:                       {stats['persons']}")
+    print(f"Encodings:                     {stats['encodings_before']} -> {stats['encodings_after']} "
+          f"({1 - stats['encodings_after'] / max(stats['encodings_before'], 1):.1%} fewer)")
+    print(f"Removed encodings re-matched:  {stats['queries']}")
+    print(f"  correct top-1 before:        {stats['correct_before'] / queries:.1%}")
+    print(f"  correct top-1 after:         {stats['correct_after'] / queries:.1%}")
+    print(f"  mean distance to own person: {stats['mean_distance_before']:.3f} -> "
+          f"{stats['mean_distance_after']:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="人脸库压缩")
+    parser.add_argument('--apply', action='store_true', help="实际删除多余编码（默认只输出报告）")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("人脸识别系统 - 人脸库压缩")
+    print("=" * 50)
+
+    db_manager = DatabaseManager()
+    try:
+        rows = db_manager.get_all_face_encodings()
+        if rows is None:
+            print("读取人脸编码失败")
+            sys.exit(1)
+        removed = plan_compaction(rows)
+        print_report(evaluate_compaction(rows, removed))
+
+        if not removed:
+            print("无需压缩")
+        elif args.apply:
+            deleted = db_manager.delete_face_encodings(removed)
+            if deleted is None:
+                print("删除失败")
+                sys.exit(1)
+            # Running detectors drop them via the gallery change feed
+            print(f"已删除 {deleted} 个编码")
+        else:
+            print("使用 --apply 执行删除")
+    finally:
+        db_manager.disconnect()
+
+if __name__ == '__main__':
+    main()
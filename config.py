@@ -19,11 +19,180 @@ TEMP_FOLDER = 'temp'
 for folder in [UPLOAD_FOLDER, KNOWN_FACES_FOLDER, TEMP_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
+# 上传文件存储配置（按内容哈希命名并分目录存放，相同文件只存一份）
+UPLOAD_STORE_CONFIG = {
+    'shard_depth': 2,                   # 子目录层数（每层两位十六进制，256个子目录）
+    'ttl_days': 30,                     # 未被引用的文件保留天数
+    'max_bytes': 50 * 1024 ** 3,        # 存储总大小上限，超出时先删除最旧的未引用文件
+    'log_retention_days': 30,           # 最近多少天识别记录引用的图片视为仍在使用
+    'grace_period': 3600,               # 新写入的文件至少保留的秒数（识别尚未记录时不删除）
+    'cleanup_interval': 3600            # 后台清理间隔（秒）
+}
+
 # 人脸识别配置
 FACE_RECOGNITION_CONFIG = {
     'tolerance': 0.6,  # 人脸识别容差
     'model': 'hog',    # 使用hog模型（更快）或cnn模型（更准确）
-    'upsample': 1      # 图像上采样次数
+    'upsample': 1,     # 图像上采样次数
+    # OpenCV Haar 级联预筛选：先用低成本检测拒绝无人脸图片，再只在候选区域运行 dlib
+    'prefilter': False,            # 是否启用预筛选（可用 benchmark.py prefilter 评估召回损失）
+    'prefilter_mode': 'roi',       # 'reject' 只拒绝无人脸图片；'roi' 同时只在候选区域检测
+    'prefilter_scan_size': 640,    # 预筛选时图像最长边（像素）
+    'prefilter_min_neighbors': 3,  # Haar 级联 minNeighbors，越小召回越高
+    'prefilter_margin': 0.5,       # 候选区域向外扩展的比例
+    'prefilter_max_coverage': 0.6, # 候选区域占图像面积超过该比例时直接检测整张图
+    'default_profile': 'balanced'  # 未指定档位时使用的识别档位
+}
+
+# 识别速度/精度档位（/upload 的 profile 参数与桌面版下拉框可选择；
+# 可用 benchmark.py profiles 在本地标注图片集上测量各档位的耗时与准确率）
+#   max_size: 检测时图像最长边（None 为原始分辨率）；JPEG 直接按该尺寸解码
+#   encode_min_face: 检测图中小于该边长(像素)的人脸改用更高分辨率解码后的局部区域编码
+#   landmark_model: 'small'(5点，更快) 或 'large'(68点)
+#   num_jitters: 编码时随机扰动重采样次数，越大越准越慢
+DETECTION_PROFILES = {
+    'realtime': {
+        'max_size': 800,
+        'model': 'hog',
+        'upsample': 0,
+        'landmark_model': 'small',
+        'num_jitters': 1,
+        'encode_min_face': 60
+    },
+    'balanced': {
+        'max_size': None,
+        'model': FACE_RECOGNITION_CONFIG['model'],
+        'upsample': FACE_RECOGNITION_CONFIG['upsample'],
+        'landmark_model': 'small',
+        'num_jitters': 1
+    },
+    'forensic': {
+        'max_size': None,
+        'model': 'cnn',
+        'upsample': 2,
+        'landmark_model': 'large',
+        'num_jitters': 10
+    }
+}
+
+# 人脸质量筛选配置（检测后、编码前评估每个人脸框，过小/模糊/侧脸过大的人脸不编码或仅标注）
+QUALITY_CONFIG = {
+    'enabled': True,
+    'action': 'skip',         # 'skip' 不编码并在结果中注明原因；'flag' 照常编码但在结果中标注
+    'min_face_size': 30,      # 人脸框最短边（原图像素）
+    'min_sharpness': 20.0,    # 人脸区域 Laplacian 方差下限，越小越模糊
+    'sharpness_size': 64,     # 计算清晰度前把人脸区域缩小到的最长边（像素）
+    'max_yaw_ratio': 0.5      # 鼻尖偏离双眼中点的距离/双眼间距（约 tan(偏转角)/2），None 不检查
+}
+
+# 多人脸并行编码配置（合影等人脸较多的图片把各人脸分给多个进程编码，
+# 可用 benchmark.py encoding 测量不同人脸数下的加速比）
+# 仅在支持 fork 的平台（Linux）生效，Windows/macOS 上始终在当前线程编码
+ENCODING_POOL_CONFIG = {
+    'enabled': False,
+    'workers': 0,             # 每个进程的编码进程数，0 表示 CPU 核数；多进程 Web 部署时应设为 CPU 核数/工作进程数
+    'min_faces': 8            # 人脸数达到该值才并行，人脸少的图片仍在当前线程编码
+}
+
+# 人脸库重新编码配置（修改编码设置后运行 reencode_gallery.py，按新设置从原图重新生成全部编码；
+# 中断后再次运行从检查点继续，全部完成后各进程同时切换到新版本）
+REENCODE_CONFIG = {
+    'profile': None,          # 新编码使用的档位，None 为 default_profile
+    'workers': 0,             # 编码进程数，0 表示 CPU 核数
+    'batch_size': 200         # 每批编码数；每批结果与检查点在同一事务中提交
+}
+
+# 内存人脸库配置
+GALLERY_CONFIG = {
+    'quantization': None,     # 首轮扫描的量化表示: None(精确)、'float16' 或 'int8'
+    'rerank_candidates': 32,  # 量化扫描后用 float32 精确重排的候选数
+    'scan_block_size': 65536, # 量化扫描每块的行数（限制临时内存）
+    'search_max_k': 100,      # /search 每个查询最多返回的人员数
+    'load_chunk_size': 10000  # 全量加载时每次从数据库流式读取的编码行数
+}
+
+# 跨请求批量匹配配置（高并发时把多个请求的人脸编码合并为一次矩阵运算）
+MATCH_BATCHING_CONFIG = {
+    'enabled': False,
+    'window_ms': 2,           # 收集同批查询的最长等待时间（毫秒）
+    'max_batch': 64           # 每批最多的查询编码数
+}
+
+# 人脸库压缩配置（compact_gallery.py 与登记时的近重复检查）
+COMPACTION_CONFIG = {
+    'duplicate_threshold': 0.2,    # 两个编码距离不超过该值视为近重复
+    'max_encodings_per_person': 10 # 每人最多保留的编码数
+}
+
+# 人脸库分区配置（persons.site 为站点/分组；/upload 的 scope 参数只搜索指定站点）
+PARTITION_CONFIG = {
+    'fallback_to_global': False   # 指定范围内未匹配时是否再搜索全部人员（可被请求参数覆盖）
+}
+
+# 未识别人脸保存与离线聚类配置（运行 cluster_unknowns.py，结果可一键登记为人员）
+UNKNOWN_FACES_CONFIG = {
+    'persist': True,          # 识别时保存未匹配人脸的编码与位置
+    'cluster_threshold': 0.45,# 聚类距离阈值（比识别容差更严，减少链式误合并）
+    'max_neighbors': 10,      # 每个编码最多连接的近邻数
+    'min_cluster_size': 3,    # 至少多少张人脸才形成聚类
+    'window_days': 30,        # 只对最近若干天内未归类的人脸聚类
+    'block_size': 4096,       # 分块距离计算的块大小（限制临时内存）
+    'fetch_size': 10000,      # 每次从数据库读取的人脸数
+    'enroll_max_encodings': 5 # 聚类登记为人员时保存的代表编码数
+}
+
+# 共享内存人脸库配置（多进程Web服务）
+SHARED_GALLERY_CONFIG = {
+    'enabled': False,         # 启用后工作进程从共享内存读取人脸库，需先运行 gallery_loader.py
+    'name': 'face_gallery'    # 共享内存段名称前缀
+}
+
+# 人脸库变更同步配置（按 gallery_changes 水位增量同步，无需全表重新加载）
+CHANGE_FEED_CONFIG = {
+    'enabled': True,
+    'poll_interval': 2,       # 轮询变更记录的间隔（秒），即最大同步延迟
+    'batch_size': 1000,       # 每次轮询读取的最大变更数
+    'gap_timeout': 10         # 变更 id 出现空洞时等待未提交事务的最长时间（秒）
+}
+
+# 人脸库分片配置（按 person_id 哈希分到多个匹配节点，Web 前端并发查询后合并）
+SHARDING_CONFIG = {
+    'enabled': False,         # 启用后需先为每个节点运行 python matcher_node.py <序号>
+    'nodes': [                # 分片节点地址，序号即分片号，节点数即分片数
+        'http://127.0.0.1:5101',
+        'http://127.0.0.1:5102'
+    ],
+    'timeout': 1.0            # 单个分片的超时（秒），超时的分片不计入结果并在响应中报告
+}
+
+# Web 服务准入控制（超出并发的请求排队，队列满时立即返回 429 并附带 Retry-After）
+ADMISSION_CONFIG = {
+    'max_concurrency': 4,     # 同时进行识别的请求数
+    'max_queue': 16,          # 最多排队的请求数
+    'queue_timeout': 10       # 排队最长等待时间（秒），超时返回 503；客户端可用 X-Request-Timeout 头设置截止时间
+}
+
+# 识别记录合并配置（同一人员在同一来源短时间内的连续识别合并为一条记录）
+RECOGNITION_LOG_CONFIG = {
+    'debounce': True,         # 关闭后每次识别都写入一条记录
+    'window': 30,             # 合并窗口（秒），从首次识别起算，到期后写入数据库
+    'max_pending': 10000      # 内存中最多暂存的记录数，超出时提前写入最早的记录
+}
+
+# 标注图片输出配置（/annotated 与 /upload?annotate=true）
+ANNOTATION_CONFIG = {
+    'format': 'jpeg',         # 输出格式: jpeg 或 webp
+    'quality': 85,            # 压缩质量 (1-100)
+    'max_size': 1280,         # 输出图片最长边（像素）
+    'cache_size': 64          # 缓存的最近上传数量
+}
+
+# 桌面版批量识别/监视文件夹配置
+BATCH_CONFIG = {
+    'workers': 2,             # 并行识别线程数
+    'max_rate': 0,            # 每秒最多提交的图片数，0 表示不限速
+    'poll_interval': 2,       # 监视模式下扫描新文件的间隔（秒）
+    'settle_time': 1          # 文件修改后至少静置多少秒才处理（避免读取未写完的文件）
 }
 
 # Flask配置
@@ -1,6 +1,7 @@
 # Database management module
 import mysql.connector
 from mysql.connector import Error
+import json
 import pickle
 import numpy as np
 from config import DATABASE_CONFIG
@@ -25,50 +26,82 @@ class DatabaseManager:
             self.connection.close()
             print("Database connection closed")
     
-    def add_person(self, name, age=None, gender=None, phone=None, email=None, address=None):
+    def add_person(self, name, age=None, gender=None, phone=None, email=None, address=None,
+                   site=None):
         """Add new person information"""
         try:
             cursor = self.connection.cursor()
             query = """
-            INSERT INTO persons (name, age, gender, phone, email, address)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO persons (name, age, gender, phone, email, address, site)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             """
-            values = (name, age, gender, phone, email, address)
+            values = (name, age, gender, phone, email, address, site)
             cursor.execute(query, values)
-            self.connection.commit()
             person_id = cursor.lastrowid
+            self._log_gallery_change(cursor, 'person', person_id, person_id, 'insert')
+            self.connection.commit()
             cursor.close()
             return person_id
         except Error as e:
+            self.connection.rollback()
             print(f"Error adding person info: {e}")
             return None
     
-    def add_face_encoding(self, person_id, face_encoding, image_path=None):
-        """Add face encoding"""
+    def add_face_encoding(self, person_id, face_encoding, image_path=None, encoding_version=1):
+        """Add face encoding (encoding_version: the encoding settings version it was made with)"""
         try:
             cursor = self.connection.cursor()
             # Convert numpy array to binary data
             encoding_bytes = pickle.dumps(face_encoding)
             query = """
-            INSERT INTO face_encodings (person_id, face_encoding, image_path)
-            VALUES (%s, %s, %s)
+            INSERT INTO face_encodings (person_id, face_encoding, image_path, encoding_version)
+            VALUES (%s, %s, %s, %s)
             """
-            values = (person_id, encoding_bytes, image_path)
+            values = (person_id, encoding_bytes, image_path, encoding_version)
             cursor.execute(query, values)
+            self._log_gallery_change(cursor, 'encoding', cursor.lastrowid, person_id, 'insert')
             self.connection.commit()
             cursor.close()
             return True
         except Error as e:
+            self.connection.rollback()
             print(f"Error adding face encoding: {e}")
             return False
     
+    def delete_face_encodings(self, encoding_ids, batch_size=1000):
+        """Delete face encodings by ID, logging each deletion to the gallery change log"""
+        encoding_ids = list(encoding_ids)
+        deleted = 0
+        try:
+            cursor = self.connection.cursor()
+            for start in range(0, len(encoding_ids), batch_size):
+                batch = encoding_ids[start:start + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f"SELECT id, person_id FROM face_encodings WHERE id IN ({placeholders})",
+                    batch
+                )
+                rows = cursor.fetchall()
+                cursor.execute(f"DELETE FROM face_encodings WHERE id IN ({placeholders})", batch)
+                for encoding_id, person_id in rows:
+                    self._log_gallery_change(cursor, 'encoding', encoding_id, person_id, 'delete')
+                # One transaction per batch keeps lock time short on large galleries
+                self.connection.commit()
+                deleted += len(rows)
+            cursor.close()
+            return deleted
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error deleting face encodings: {e}")
+            return None
+    
     def get_all_face_encodings(self):
-        """Get all face encodings"""
+        """Get all face encodings (None on error, so a failed load is not mistaken for an empty gallery)"""
         try:
             cursor = self.connection.cursor()
             query = """
             SELECT fe.id, fe.person_id, fe.face_encoding, fe.image_path,
-                   p.name, p.age, p.gender, p.phone, p.email, p.address
+                   p.name, p.age, p.gender, p.phone, p.email, p.address, p.site
             FROM face_encodings fe
             JOIN persons p ON fe.person_id = p.id
             """
@@ -76,26 +109,433 @@ class DatabaseManager:
             results = cursor.fetchall()
             cursor.close()
             
-            encodings = []
+            return [self._face_encoding_row_to_dict(row) for row in results]
+        except Error as e:
+            print(f"Error fetching face encodings: {e}")
+            return None
+    
+    def load_gallery_arrays(self, dtype=np.float64, chunk_size=10000, keep_person=None,
+                            watermark_lookback=0):
+        """Stream the whole gallery into preallocated arrays.
+        
+        Per-person counts come first, so every encoding is written straight to
+        its final row of a matrix sized up front: peak memory stays close to the
+        final gallery instead of holding every row as a dict. Rows come out
+        grouped by site (sorted, None first), the order GallerySnapshot keeps
+        them in. keep_person(person_id) can drop persons before anything is
+        allocated for them. Everything, including the change log watermark, is
+        read from one consistent snapshot (the watermark watermark_lookback
+        seconds back, see _gallery_watermark). Returns a dict, or None on error.
+        """
+        try:
+            # End any open transaction so the snapshot starts now
+            self.connection.commit()
+            self.connection.start_transaction(consistent_snapshot=True, readonly=True)
+            cursor = self.connection.cursor()
+            watermark = self._gallery_watermark(cursor, watermark_lookback)
+            
+            cursor.execute("""
+            SELECT p.id, p.name, p.age, p.gender, p.phone, p.email, p.address, p.site,
+                   COUNT(*)
+            FROM persons p
+            JOIN face_encodings fe ON fe.person_id = p.id
+            GROUP BY p.id
+            """)
+            persons = {}
+            site_counts = {}
+            for row in cursor.fetchall():
+                if keep_person is not None and not keep_person(row[0]):
+                    continue
+                persons[row[0]] = {
+                    'person_id': row[0],
+                    'name': row[1],
+                    'age': row[2],
+                    'gender': row[3],
+                    'phone': row[4],
+                    'email': row[5],
+                    'address': row[6],
+                    'site': row[7]
+                }
+                site = row[7] or ''
+                site_counts[site] = site_counts.get(site, 0) + row[8]
+            
+            # Next free row of each site's block
+            next_row = {}
+            count = 0
+            for site in sorted(site_counts):
+                next_row[site] = count
+                count += site_counts[site]
+            
+            encodings = np.empty((count, 128), dtype=dtype)
+            encoding_ids = np.empty(count, dtype=np.int64)
+            person_ids = np.empty(count, dtype=np.int64)
+            # Unbuffered cursor: rows arrive chunk by chunk instead of all at once
+            cursor.execute("SELECT id, person_id, face_encoding FROM face_encodings")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for encoding_id, person_id, encoding_bytes in rows:
+                    person = persons.get(person_id)
+                    if person is None:
+                        continue
+                    site = person['site'] or ''
+                    index = next_row[site]
+                    next_row[site] = index + 1
+                    encodings[index] = pickle.loads(encoding_bytes)
+                    encoding_ids[index] = encoding_id
+                    person_ids[index] = person_id
+            cursor.close()
+            self.connection.commit()
+            
+            return {
+                'encodings': encodings,
+                'encoding_ids': encoding_ids,
+                'person_ids': person_ids,
+                'persons': persons,
+                'watermark': watermark
+            }
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error streaming face encodings: {e}")
+            return None
+    
+    def _face_encoding_row_to_dict(self, row):
+        """Convert a face_encodings JOIN persons row into a dict"""
+        encoding_data = pickle.loads(row[2])  # Deserialize face encoding
+        return {
+            'encoding_id': row[0],
+            'person_id': row[1],
+            'face_encoding': encoding_data,
+            'image_path': row[3],
+            'name': row[4],
+            'age': row[5],
+            'gender': row[6],
+            'phone': row[7],
+            'email': row[8],
+            'address': row[9],
+            'site': row[10]
+        }
+    
+    def get_face_encodings_by_ids(self, encoding_ids):
+        """Get face encodings (with person info) for the given encoding IDs (None on error)"""
+        if not encoding_ids:
+            return []
+        try:
+            cursor = self.connection.cursor()
+            placeholders = ', '.join(['%s'] * len(encoding_ids))
+            query = f"""
+            SELECT fe.id, fe.person_id, fe.face_encoding, fe.image_path,
+                   p.name, p.age, p.gender, p.phone, p.email, p.address, p.site
+            FROM face_encodings fe
+            JOIN persons p ON fe.person_id = p.id
+            WHERE fe.id IN ({placeholders})
+            ORDER BY fe.id
+            """
+            cursor.execute(query, list(encoding_ids))
+            results = cursor.fetchall()
+            cursor.close()
+            
+            return [self._face_encoding_row_to_dict(row) for row in results]
+        except Error as e:
+            print(f"Error fetching face encodings: {e}")
+            return None
+    
+    def get_persons_by_ids(self, person_ids):
+        """Get gallery-relevant person info for the given person IDs (None on error)"""
+        if not person_ids:
+            return {}
+        try:
+            cursor = self.connection.cursor()
+            placeholders = ', '.join(['%s'] * len(person_ids))
+            query = f"""
+            SELECT id, name, age, gender, phone, email, address, site
+            FROM persons
+            WHERE id IN ({placeholders})
+            """
+            cursor.execute(query, list(person_ids))
+            results = cursor.fetchall()
+            cursor.close()
+            
+            persons = {}
             for row in results:
-                encoding_data = pickle.loads(row[2])  # Deserialize face encoding
-                person_info = {
-                    'encoding_id': row[0],
-                    'person_id': row[1],
-                    'face_encoding': encoding_data,
-                    'image_path': row[3],
-                    'name': row[4],
-                    'age': row[5],
-                    'gender': row[6],
-                    'phone': row[7],
-                    'email': row[8],
-                    'address': row[9]
+                persons[row[0]] = {
+                    'person_id': row[0],
+                    'name': row[1],
+                    'age': row[2],
+                    'gender': row[3],
+                    'phone': row[4],
+                    'email': row[5],
+                    'address': row[6],
+                    'site': row[7]
                 }
-                encodings.append(person_info)
-            return encodings
+            return persons
+        except Error as e:
+            print(f"Error fetching person info: {e}")
+            return None
+    
+    def _log_gallery_change(self, cursor, entity, entity_id, person_id, operation):
+        """Append to the gallery change log inside the caller's transaction"""
+        query = """
+        INSERT INTO gallery_changes (entity, entity_id, person_id, operation)
+        VALUES (%s, %s, %s, %s)
+        """
+        cursor.execute(query, (entity, entity_id, person_id, operation))
+    
+    def _gallery_watermark(self, cursor, lookback=0):
+        """Change log watermark for a full load.
+        
+        With lookback, the last change older than lookback seconds instead of
+        the newest: a change from a transaction still uncommitted now already has
+        a lower id than the newest, and would fall below the newest forever.
+        Starting the feed behind it lets the feed's gap handling wait for it;
+        changes replayed from the window are already in the load, and applying
+        them again is harmless.
+        """
+        if not lookback:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM gallery_changes")
+            return cursor.fetchone()[0]
+        # Walks back from the newest id, so only the window's rows are read
+        cursor.execute("""
+        SELECT id FROM gallery_changes
+        WHERE changed_at < NOW(3) - INTERVAL %s SECOND
+        ORDER BY id DESC
+        LIMIT 1
+        """, (lookback,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def get_latest_gallery_change_id(self, lookback=0):
+        """Get the gallery change log watermark (lookback: see _gallery_watermark)"""
+        try:
+            # End any open snapshot so changes committed by other connections are visible
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            watermark = self._gallery_watermark(cursor, lookback)
+            cursor.close()
+            return watermark
+        except Error as e:
+            print(f"Error fetching gallery change watermark: {e}")
+            return None
+    
+    def get_gallery_changes(self, since_id, limit=1000):
+        """Get gallery changes newer than the given change ID, oldest first"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            query = """
+            SELECT id, entity, entity_id, person_id, operation, changed_at
+            FROM gallery_changes
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+            """
+            cursor.execute(query, (since_id, limit))
+            results = cursor.fetchall()
+            cursor.close()
+            
+            changes = []
+            for row in results:
+                changes.append({
+                    'id': row[0],
+                    'entity': row[1],
+                    'entity_id': row[2],
+                    'person_id': row[3],
+                    'operation': row[4],
+                    'changed_at': row[5]
+                })
+            return changes
+        except Error as e:
+            print(f"Error fetching gallery changes: {e}")
+            return None
+    
+    def get_active_encoding_version(self):
+        """(version, settings) of the active encoding settings; settings is None
+        for version 1, the profile defaults in use before any re-encoding job"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT version, settings FROM encoding_versions WHERE status = 'active'")
+            row = cursor.fetchone()
+            cursor.close()
+            if row is None:
+                return 1, None
+            return row[0], json.loads(row[1])
+        except Error as e:
+            print(f"Error fetching active encoding version: {e}")
+            return None
+    
+    def _encoding_version_row_to_dict(self, row):
+        """Convert an encoding_versions row into a dictionary"""
+        return {
+            'version': row[0],
+            'settings': json.loads(row[1]),
+            'status': row[2],
+            'last_encoding_id': row[3],
+            'encoded': row[4],
+            'failed': row[5],
+            'created_at': row[6],
+            'activated_at': row[7]
+        }
+    
+    def get_encoding_versions(self):
+        """All encoding versions, newest first"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            cursor.execute("""
+            SELECT version, settings, status, last_encoding_id, encoded, failed,
+                   created_at, activated_at
+            FROM encoding_versions
+            ORDER BY version DESC
+            """)
+            results = cursor.fetchall()
+            cursor.close()
+            return [self._encoding_version_row_to_dict(row) for row in results]
+        except Error as e:
+            print(f"Error fetching encoding versions: {e}")
+            return None
+    
+    def create_encoding_version(self, settings):
+        """Start a re-encoding job for new settings; returns the new version or None"""
+        try:
+            cursor = self.connection.cursor()
+            # Version 1 is the implicit one every pre-existing encoding carries
+            cursor.execute("SELECT COALESCE(MAX(version), 1) + 1 FROM encoding_versions")
+            version = cursor.fetchone()[0]
+            cursor.execute("""
+            INSERT INTO encoding_versions (version, settings, status)
+            VALUES (%s, %s, 'building')
+            """, (version, json.dumps(settings, sort_keys=True)))
+            self.connection.commit()
+            cursor.close()
+            return version
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error creating encoding version: {e}")
+            return None
+    
+    def get_face_encodings_after(self, after_id, limit):
+        """(id, image_path, encoding) of the next limit encodings past after_id, in id order"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            cursor.execute("""
+            SELECT id, image_path, face_encoding FROM face_encodings
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+            """, (after_id, limit))
+            results = cursor.fetchall()
+            cursor.close()
+            return [(row[0], row[1], pickle.loads(row[2])) for row in results]
         except Error as e:
             print(f"Error fetching face encodings: {e}")
-            return []
+            return None
+    
+    def save_reencoded_batch(self, version, encodings, last_encoding_id, failed):
+        """Stage one batch of re-encoded (encoding_id, encoding) pairs and move the
+        job's checkpoint past it, in one transaction, so a resumed job neither
+        skips nor repeats a batch"""
+        try:
+            cursor = self.connection.cursor()
+            if encodings:
+                cursor.executemany("""
+                INSERT INTO face_encodings_staging (version, encoding_id, face_encoding)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE face_encoding = VALUES(face_encoding)
+                """, [(version, encoding_id, pickle.dumps(encoding))
+                      for encoding_id, encoding in encodings])
+            cursor.execute("""
+            UPDATE encoding_versions
+            SET last_encoding_id = %s, encoded = encoded + %s, failed = failed + %s
+            WHERE version = %s AND status = 'building'
+            """, (last_encoding_id, len(encodings), failed, version))
+            if cursor.rowcount != 1:
+                # The job was activated or replaced meanwhile
+                self.connection.rollback()
+                cursor.close()
+                return False
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error saving re-encoded batch: {e}")
+            return False
+    
+    def activate_encoding_version(self, version):
+        """Swap the staged encodings of a finished job into face_encodings and make
+        its settings active, in one transaction.
+        
+        Readers see either every old encoding or every new one. One 'reload'
+        change tells detectors to reload the gallery instead of fetching each
+        encoding through the change feed. Encodings that could not be re-encoded
+        keep their old version. Returns the number of encodings replaced, or None.
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT status FROM encoding_versions WHERE version = %s FOR UPDATE", (version,)
+            )
+            row = cursor.fetchone()
+            if row is None or row[0] != 'building':
+                self.connection.rollback()
+                cursor.close()
+                return None
+            cursor.execute("""
+            UPDATE face_encodings fe
+            JOIN face_encodings_staging s ON s.encoding_id = fe.id AND s.version = %s
+            SET fe.face_encoding = s.face_encoding, fe.encoding_version = s.version
+            """, (version,))
+            replaced = cursor.rowcount
+            cursor.execute("DELETE FROM face_encodings_staging WHERE version = %s", (version,))
+            cursor.execute("UPDATE encoding_versions SET status = 'retired' WHERE status = 'active'")
+            cursor.execute("""
+            UPDATE encoding_versions SET status = 'active', activated_at = CURRENT_TIMESTAMP
+            WHERE version = %s
+            """, (version,))
+            self._log_gallery_change(cursor, 'gallery', version, 0, 'reload')
+            self.connection.commit()
+            cursor.close()
+            return replaced
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error activating encoding version: {e}")
+            return None
+    
+    def abandon_encoding_version(self, version):
+        """Give up an unfinished re-encoding job and drop its staged encodings"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+            UPDATE encoding_versions SET status = 'abandoned'
+            WHERE version = %s AND status = 'building'
+            """, (version,))
+            abandoned = cursor.rowcount == 1
+            cursor.execute("DELETE FROM face_encodings_staging WHERE version = %s", (version,))
+            self.connection.commit()
+            cursor.close()
+            return abandoned
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error abandoning encoding version: {e}")
+            return False
+    
+    def count_stale_face_encodings(self, version):
+        """Number of encodings not made with the given encoding version"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT COUNT(*) FROM face_encodings WHERE encoding_version <> %s", (version,)
+            )
+            result = cursor.fetchone()
+            cursor.close()
+            return result[0]
+        except Error as e:
+            print(f"Error counting stale face encodings: {e}")
+            return None
     
     def get_person_by_id(self, person_id):
         """Get person info by ID"""
@@ -116,22 +556,24 @@ class DatabaseManager:
                     'email': result[5],
                     'address': result[6],
                     'created_at': result[7],
-                    'updated_at': result[8]
+                    'updated_at': result[8],
+                    'site': result[9]
                 }
             return None
         except Error as e:
             print(f"Error fetching person info: {e}")
             return None
     
-    def add_recognition_log(self, person_id, confidence, image_path):
+    def add_recognition_log(self, person_id, confidence, image_path, source=None):
         """Add recognition log"""
         try:
             cursor = self.connection.cursor()
             query = """
-            INSERT INTO recognition_logs (person_id, confidence, image_path)
-            VALUES (%s, %s, %s)
+            INSERT INTO recognition_logs
+                (person_id, confidence, image_path, source, first_seen, last_seen)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP(3), CURRENT_TIMESTAMP(3))
             """
-            values = (person_id, confidence, image_path)
+            values = (person_id, confidence, image_path, source)
             cursor.execute(query, values)
             self.connection.commit()
             cursor.close()
@@ -140,19 +582,62 @@ class DatabaseManager:
             print(f"Error adding recognition log: {e}")
             return False
     
-    def get_recognition_logs(self, limit=50):
-        """Get recognition logs"""
+    def add_recognition_logs(self, records):
+        """Add merged recognition logs in one transaction.
+        
+        records: (person_id, confidence, image_path, source, first_seen,
+        last_seen, hit_count) tuples, times as datetimes.
+        """
+        if not records:
+            return True
         try:
             cursor = self.connection.cursor()
             query = """
+            INSERT INTO recognition_logs
+                (person_id, confidence, image_path, source, first_seen, last_seen, hit_count,
+                 recognition_time)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            # recognition_time is when the sighting began, as for single-hit logs
+            cursor.executemany(query, [tuple(record) + (record[4],) for record in records])
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error adding recognition logs: {e}")
+            return False
+    
+    def get_recognition_logs(self, limit=50, after_id=None, before_id=None, oldest_first=False):
+        """Get recognition logs, newest first (optionally only newer/older than a log ID).
+        
+        With oldest_first, the limit rows closest above after_id come back
+        oldest first, instead of the newest rows past it."""
+        try:
+            # Commit ends the read snapshot so rows written by other connections show up
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            conditions = []
+            values = []
+            if after_id is not None:
+                conditions.append("rl.id > %s")
+                values.append(after_id)
+            if before_id is not None:
+                conditions.append("rl.id < %s")
+                values.append(before_id)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            # Ordering by the primary key walks the index instead of sorting the table
+            query = f"""
             SELECT rl.id, rl.person_id, rl.confidence, rl.image_path, rl.recognition_time,
-                   p.name, p.age, p.gender
+                   p.name, p.age, p.gender, rl.source, rl.first_seen, rl.last_seen, rl.hit_count
             FROM recognition_logs rl
             LEFT JOIN persons p ON rl.person_id = p.id
-            ORDER BY rl.recognition_time DESC
+            {where}
+            ORDER BY rl.id {'ASC' if oldest_first else 'DESC'}
             LIMIT %s
             """
-            cursor.execute(query, (limit,))
+            values.append(limit)
+            cursor.execute(query, values)
             results = cursor.fetchall()
             cursor.close()
             
@@ -166,7 +651,11 @@ class DatabaseManager:
                     'recognition_time': row[4],
                     'name': row[5],
                     'age': row[6],
-                    'gender': row[7]
+                    'gender': row[7],
+                    'source': row[8],
+                    'first_seen': row[9],
+                    'last_seen': row[10],
+                    'hit_count': row[11]
                 }
                 logs.append(log)
             return logs
@@ -174,6 +663,215 @@ class DatabaseManager:
             print(f"Error fetching recognition logs: {e}")
             return []
     
+    def add_unknown_face(self, face_encoding, image_path, face_location):
+        """Save an unrecognized face for offline clustering"""
+        try:
+            cursor = self.connection.cursor()
+            top, right, bottom, left = face_location
+            query = """
+            INSERT INTO unknown_faces (face_encoding, image_path, face_top, face_right, face_bottom, face_left)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """
+            values = (pickle.dumps(face_encoding), image_path, top, right, bottom, left)
+            cursor.execute(query, values)
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error adding unknown face: {e}")
+            return False
+    
+    def get_unclustered_unknown_faces(self, window_days, after_id=0, limit=10000):
+        """Get (id, encoding) pairs of recent unknown faces not yet in a cluster, by id"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            query = """
+            SELECT id, face_encoding
+            FROM unknown_faces
+            WHERE cluster_id IS NULL
+              AND created_at >= NOW() - INTERVAL %s DAY
+              AND id > %s
+            ORDER BY id
+            LIMIT %s
+            """
+            cursor.execute(query, (window_days, after_id, limit))
+            results = cursor.fetchall()
+            cursor.close()
+            return [(row[0], pickle.loads(row[1])) for row in results]
+        except Error as e:
+            print(f"Error fetching unknown faces: {e}")
+            return None
+    
+    def get_unknown_clusters(self, min_size=1, limit=None):
+        """Get clusters not yet enrolled as a person, largest first"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            query = """
+            SELECT id, centroid, size, created_at, updated_at
+            FROM unknown_clusters
+            WHERE enrolled_person_id IS NULL AND size >= %s
+            ORDER BY size DESC, id
+            """
+            values = [min_size]
+            if limit is not None:
+                query += " LIMIT %s"
+                values.append(limit)
+            cursor.execute(query, values)
+            results = cursor.fetchall()
+            cursor.close()
+            
+            clusters = []
+            for row in results:
+                clusters.append({
+                    'id': row[0],
+                    'centroid': pickle.loads(row[1]),
+                    'size': row[2],
+                    'created_at': row[3],
+                    'updated_at': row[4]
+                })
+            return clusters
+        except Error as e:
+            print(f"Error fetching unknown clusters: {e}")
+            return None
+    
+    def save_unknown_clusters(self, updated_clusters, new_clusters):
+        """Store one clustering pass in a single transaction.
+        
+        updated_clusters: [(cluster_id, centroid, size, [unknown face ids])] for existing clusters
+        new_clusters: [(centroid, size, [unknown face ids])]
+        """
+        try:
+            cursor = self.connection.cursor()
+            assignments = []
+            for cluster_id, centroid, size, face_ids in updated_clusters:
+                cursor.execute(
+                    "UPDATE unknown_clusters SET centroid = %s, size = %s WHERE id = %s",
+                    (pickle.dumps(centroid), size, cluster_id)
+                )
+                assignments.extend((cluster_id, face_id) for face_id in face_ids)
+            for centroid, size, face_ids in new_clusters:
+                cursor.execute(
+                    "INSERT INTO unknown_clusters (centroid, size) VALUES (%s, %s)",
+                    (pickle.dumps(centroid), size)
+                )
+                cluster_id = cursor.lastrowid
+                assignments.extend((cluster_id, face_id) for face_id in face_ids)
+            cursor.executemany(
+                "UPDATE unknown_faces SET cluster_id = %s WHERE id = %s",
+                assignments
+            )
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error saving unknown clusters: {e}")
+            return False
+    
+    def get_unknown_cluster_faces(self, cluster_id, limit=None):
+        """Get the unknown faces assigned to a cluster"""
+        try:
+            cursor = self.connection.cursor()
+            query = """
+            SELECT id, face_encoding, image_path, face_top, face_right, face_bottom, face_left, created_at
+            FROM unknown_faces
+            WHERE cluster_id = %s
+            ORDER BY id
+            """
+            values = [cluster_id]
+            if limit is not None:
+                query += " LIMIT %s"
+                values.append(limit)
+            cursor.execute(query, values)
+            results = cursor.fetchall()
+            cursor.close()
+            
+            faces = []
+            for row in results:
+                faces.append({
+                    'id': row[0],
+                    'face_encoding': pickle.loads(row[1]),
+                    'image_path': row[2],
+                    'face_location': (row[3], row[4], row[5], row[6]),
+                    'created_at': row[7]
+                })
+            return faces
+        except Error as e:
+            print(f"Error fetching unknown cluster faces: {e}")
+            return []
+    
+    def enroll_unknown_cluster(self, cluster_id, person_info, faces, encoding_version=1):
+        """Create a person from a cluster with the given faces' encodings, in one transaction
+        (the encodings must have been made with encoding_version's settings)"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(
+                "SELECT enrolled_person_id FROM unknown_clusters WHERE id = %s FOR UPDATE",
+                (cluster_id,)
+            )
+            row = cursor.fetchone()
+            if row is None or row[0] is not None:
+                # Missing, or enrolled already by someone else
+                self.connection.rollback()
+                cursor.close()
+                return None
+            
+            cursor.execute("""
+            INSERT INTO persons (name, age, gender, phone, email, address, site)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (person_info['name'], person_info.get('age'), person_info.get('gender'),
+                  person_info.get('phone'), person_info.get('email'), person_info.get('address'),
+                  person_info.get('site')))
+            person_id = cursor.lastrowid
+            self._log_gallery_change(cursor, 'person', person_id, person_id, 'insert')
+            
+            for face in faces:
+                cursor.execute("""
+                INSERT INTO face_encodings (person_id, face_encoding, image_path, encoding_version)
+                VALUES (%s, %s, %s, %s)
+                """, (person_id, pickle.dumps(face['face_encoding']), face['image_path'],
+                      encoding_version))
+                self._log_gallery_change(cursor, 'encoding', cursor.lastrowid, person_id, 'insert')
+            
+            cursor.execute(
+                "UPDATE unknown_clusters SET enrolled_person_id = %s WHERE id = %s",
+                (person_id, cluster_id)
+            )
+            self.connection.commit()
+            cursor.close()
+            return person_id
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error enrolling unknown cluster: {e}")
+            return None
+    
+    def get_referenced_image_paths(self, since_days, prefix=''):
+        """Image paths (under prefix) still referenced by encodings, unknown faces
+        or recognition logs from the last since_days days"""
+        try:
+            self.connection.commit()
+            cursor = self.connection.cursor()
+            pattern = prefix.replace('%', '\\%').replace('_', '\\_') + '%'
+            query = """
+            SELECT image_path FROM face_encodings WHERE image_path LIKE %s
+            UNION
+            SELECT image_path FROM unknown_faces
+            WHERE image_path LIKE %s
+              AND (cluster_id IS NOT NULL OR created_at >= NOW() - INTERVAL %s DAY)
+            UNION
+            SELECT image_path FROM recognition_logs
+            WHERE image_path LIKE %s AND recognition_time >= NOW() - INTERVAL %s DAY
+            """
+            cursor.execute(query, (pattern, pattern, since_days, pattern, since_days))
+            paths = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+            return paths
+        except Error as e:
+            print(f"Error fetching referenced image paths: {e}")
+            return None
+    
     def update_person(self, person_id, **kwargs):
         """Update person information"""
         try:
@@ -190,11 +888,13 @@ class DatabaseManager:
                 values.append(person_id)
                 query = f"UPDATE persons SET {', '.join(set_clauses)} WHERE id = %s"
                 cursor.execute(query, values)
+                self._log_gallery_change(cursor, 'person', person_id, person_id, 'update')
                 self.connection.commit()
                 cursor.close()
                 return True
             return False
         except Error as e:
+            self.connection.rollback()
             print(f"Error updating person info: {e}")
             return False
     
@@ -204,9 +904,11 @@ class DatabaseManager:
             cursor = self.connection.cursor()
             query = "DELETE FROM persons WHERE id = %s"
             cursor.execute(query, (person_id,))
+            self._log_gallery_change(cursor, 'person', person_id, person_id, 'delete')
             self.connection.commit()
             cursor.close()
             return True
         except Error as e:
+            self.connection.rollback()
             print(f"Error deleting person info: {e}")
             return False
@@ -12,7 +12,9 @@ CREATE TABLE IF NOT EXISTS persons (
     email VARCHAR(100),
     address TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    site VARCHAR(50),  -- 所属站点/分组（人脸库分区），NULL 表示只参与全局搜索
+    INDEX idx_persons_site (site)
 );
 
 -- 人脸特征表
@@ -22,9 +24,31 @@ CREATE TABLE IF NOT EXISTS face_encodings (
     face_encoding BLOB NOT NULL,
     image_path VARCHAR(500),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    encoding_version INT NOT NULL DEFAULT 1,  -- 生成该编码的编码设置版本（encoding_versions.version）
     FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE CASCADE
 );
 
+-- 编码设置版本表（reencode_gallery.py 的任务与检查点；status 为 building/active/retired/abandoned）
+CREATE TABLE IF NOT EXISTS encoding_versions (
+    version INT PRIMARY KEY,
+    settings TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    last_encoding_id INT NOT NULL DEFAULT 0,
+    encoded INT NOT NULL DEFAULT 0,
+    failed INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    activated_at TIMESTAMP NULL
+);
+
+-- 重新编码结果暂存表（版本激活时一次性替换 face_encodings 中的编码）
+CREATE TABLE IF NOT EXISTS face_encodings_staging (
+    version INT NOT NULL,
+    encoding_id INT NOT NULL,
+    face_encoding BLOB NOT NULL,
+    PRIMARY KEY (version, encoding_id),
+    FOREIGN KEY (encoding_id) REFERENCES face_encodings(id) ON DELETE CASCADE
+);
+
 -- 识别记录表
 CREATE TABLE IF NOT EXISTS recognition_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -32,5 +56,44 @@ CREATE TABLE IF NOT EXISTS recognition_logs (
     confidence FLOAT,
     image_path VARCHAR(500),
     recognition_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    source VARCHAR(500),
+    first_seen TIMESTAMP(3) NULL,
+    last_seen TIMESTAMP(3) NULL,
+    hit_count INT NOT NULL DEFAULT 1,
     FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE SET NULL
-);
\ No newline at end of file
+);
+
+-- 人脸库变更记录表（各进程按 id 水位增量同步）
+CREATE TABLE IF NOT EXISTS gallery_changes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    entity VARCHAR(20) NOT NULL,
+    entity_id INT NOT NULL,
+    person_id INT NOT NULL,
+    operation VARCHAR(10) NOT NULL,
+    changed_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3)
+);
+
+-- 未识别人脸表（离线聚类后可一键登记为人员）
+CREATE TABLE IF NOT EXISTS unknown_faces (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    face_encoding BLOB NOT NULL,
+    image_path VARCHAR(500),
+    face_top INT,
+    face_right INT,
+    face_bottom INT,
+    face_left INT,
+    cluster_id INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_unknown_cluster (cluster_id, created_at)
+);
+
+-- 未识别人脸聚类表
+CREATE TABLE IF NOT EXISTS unknown_clusters (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    centroid BLOB NOT NULL,
+    size INT NOT NULL DEFAULT 0,
+    enrolled_person_id INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (enrolled_person_id) REFERENCES persons(id) ON DELETE SET NULL
+);
@@ -0,0 +1,141 @@
+# Content-addressed upload storage
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from config import UPLOAD_STORE_CONFIG
+
+_TMP_DIR = '.tmp'
+
+
+class UploadStore:
+    """Stores uploads as <root>/ab/cd/<sha256><ext>.
+
+    Identical uploads share one file, and the nested shard directories keep
+    every directory small however many files there are. A background cleaner
+    removes old files that nothing in the database refers to.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, _TMP_DIR)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._cleaner = None
+
+    def path_for(self, digest, ext):
+        depth = UPLOAD_STORE_CONFIG['shard_depth']
+        shards = [digest[i * 2:i * 2 + 2] for i in range(depth)]
+        return os.path.join(self.root, *shards, digest + ext)
+
+    def save(self, stream, filename):
+        """Store an uploaded file object (e.g. a werkzeug FileStorage); returns its path"""
+        ext = os.path.splitext(filename)[1].lower()
+        digest = hashlib.sha256()
+        # Hash while writing so the upload is read once
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            path = self.path_for(digest.hexdigest(), ext)
+            if os.path.exists(path):
+                # Duplicate: refresh its age so the cleaner keeps it
+                os.utime(path)
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _files(self):
+        """(mtime, size, path) of every stored file, including pre-store flat uploads"""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root and _TMP_DIR in dirnames:
+                dirnames.remove(_TMP_DIR)
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def cleanup(self, db_manager):
+        """Delete unreferenced files past the TTL, then oldest unreferenced files
+        until the store fits max_bytes. Returns a stats dict."""
+        referenced = db_manager.get_referenced_image_paths(
+            UPLOAD_STORE_CONFIG['log_retention_days'], os.path.join(self.root, '')
+        )
+        if referenced is None:
+            # Never delete blind
+            raise RuntimeError("读取引用的图片路径失败")
+        referenced = {os.path.normpath(path) for path in referenced}
+
+        now = time.time()
+        expire_before = now - UPLOAD_STORE_CONFIG['ttl_days'] * 86400
+        # Uploads still being recognized are not logged yet; never touch fresh files
+        grace_before = now - UPLOAD_STORE_CONFIG['grace_period']
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        stats = {'files': len(files), 'bytes': total, 'deleted': 0, 'freed': 0}
+
+        for mtime, size, path in files:
+            over_size = total > UPLOAD_STORE_CONFIG['max_bytes']
+            if mtime >= grace_before or (mtime >= expire_before and not over_size):
+                # Sorted by age, so nothing later qualifies either
+                break
+            if os.path.normpath(path) in referenced:
+                continue
+            try:
+                # A duplicate upload may have refreshed it since the walk
+                if os.stat(path).st_mtime != mtime:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            stats['deleted'] += 1
+            stats['freed'] += size
+
+        self._remove_stale_tmp(grace_before)
+        return stats
+
+    def _remove_stale_tmp(self, before):
+        """Temp files left behind by interrupted uploads"""
+        for filename in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, filename)
+            try:
+                if os.stat(path).st_mtime < before:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def start_cleaner(self, db_manager):
+        """Run cleanup every cleanup_interval seconds on a daemon thread.
+        db_manager must be a connection owned by the cleaner."""
+        if self._cleaner is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(UPLOAD_STORE_CONFIG['cleanup_interval'])
+                try:
+                    stats = self.cleanup(db_manager)
+                    if stats['deleted']:
+                        print(f"Upload store cleanup: deleted {stats['deleted']} files, "
+                              f"freed {stats['freed'] / 1e6:.1f} MB")
+                except Exception as e:
+                    print(f"Upload store cleanup error: {e}")
+
+        self._cleaner = threading.Thread(target=run, daemon=True)
+        self._cleaner.start()
@@ -1,12 +1,21 @@
 # Windows desktop application
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import os
 import threading
 from face_recognition.face_detector import FaceDetector
+from face_recognition.image_io import LRUCache, load_thumbnail
+from face_recognition.batch_recognizer import BatchRecognizer
+from face_recognition.profiles import profile_names
+from face_recognition.quality import SKIP_REASON_TEXT
 from database.db_manager import DatabaseManager
-from config import UPLOAD_FOLDER
+from config import UPLOAD_FOLDER, FACE_RECOGNITION_CONFIG
+
+# Preview area size, recognition log page size and how many pages the log view holds
+PREVIEW_SIZE = (600, 400)
+LOG_PAGE_SIZE = 100
+LOG_WINDOW_PAGES = 5
 
 class FaceRecognitionApp:
     def __init__(self, root):
@@ -22,6 +31,20 @@ class FaceRecognitionApp:
         # Currently selected image path
         self.current_image_path = None
         
+        # Decoded preview thumbnails keyed by (path, mtime)
+        self.thumbnail_cache = LRUCache(32)
+        
+        # Running batch / watch-folder job
+        self.batch = None
+        
+        # Recognition log window: IDs of the top/bottom rows shown and paging state
+        self.newest_log_id = None
+        self.oldest_log_id = None
+        self.has_older_logs = True
+        self.has_newer_logs = False   # rows above the window were evicted
+        self.logs_loading = False
+        self.logs_refresh_pending = False
+        
         # Create UI
         self.create_widgets()
         
@@ -66,13 +89,30 @@ class FaceRecognitionApp:
         ttk.Button(control_frame, text="刷新数据库", 
                   command=self.refresh_database).grid(row=4, column=0, pady=5, sticky=tk.W+tk.E)
         
+        # Batch recognition buttons
+        ttk.Button(control_frame, text="批量识别文件夹", 
+                  command=self.start_batch).grid(row=5, column=0, pady=5, sticky=tk.W+tk.E)
+        self.cancel_batch_button = ttk.Button(control_frame, text="取消批量识别", 
+                                             command=self.cancel_batch, state=tk.DISABLED)
+        self.cancel_batch_button.grid(row=6, column=0, pady=5, sticky=tk.W+tk.E)
+        
+        # Speed/accuracy profile
+        ttk.Label(control_frame, text="识别档位").grid(row=7, column=0, pady=(10, 0), sticky=tk.W)
+        self.profile_var = tk.StringVar(value=FACE_RECOGNITION_CONFIG['default_profile'])
+        ttk.Combobox(control_frame, textvariable=self.profile_var, values=profile_names(), 
+                    state='readonly').grid(row=8, column=0, pady=5, sticky=tk.W+tk.E)
+        
         # Separator
-        ttk.Separator(control_frame, orient='horizontal').grid(row=5, column=0, sticky=tk.W+tk.E, pady=10)
+        ttk.Separator(control_frame, orient='horizontal').grid(row=9, column=0, sticky=tk.W+tk.E, pady=10)
         
         # Status label
         self.status_label = ttk.Label(control_frame, text="就绪", 
                                      foreground="green")
-        self.status_label.grid(row=6, column=0, pady=5)
+        self.status_label.grid(row=10, column=0, pady=5)
+        
+        # Batch progress bar
+        self.batch_progress = ttk.Progressbar(control_frame, mode='determinate')
+        self.batch_progress.grid(row=11, column=0, pady=5, sticky=tk.W+tk.E)
         
         # Right display area
         display_frame = ttk.LabelFrame(main_frame, text="显示区域", padding="10")
@@ -112,7 +152,7 @@ class FaceRecognitionApp:
         self.notebook.add(self.logs_frame, text="识别记录")
         
         # Create treeview for logs
-        columns = ('时间', '姓名', '年龄', '性别', '置信度')
+        columns = ('时间', '姓名', '年龄', '性别', '置信度', '次数')
         self.logs_tree = ttk.Treeview(self.logs_frame, columns=columns, show='headings')
         
         # Set column headings
@@ -121,12 +161,12 @@ class FaceRecognitionApp:
             self.logs_tree.column(col, width=120)
         
         # Add scrollbar
-        logs_scrollbar = ttk.Scrollbar(self.logs_frame, orient=tk.VERTICAL, 
-                                     command=self.logs_tree.yview)
-        self.logs_tree.configure(yscrollcommand=logs_scrollbar.set)
+        self.logs_scrollbar = ttk.Scrollbar(self.logs_frame, orient=tk.VERTICAL, 
+                                          command=self.logs_tree.yview)
+        self.logs_tree.configure(yscrollcommand=self._on_logs_scroll)
         
         self.logs_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        logs_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.logs_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Load recognition logs
         self.load_recognition_logs()
@@ -147,33 +187,43 @@ class FaceRecognitionApp:
             self.update_status("图片已选择")
     
     def display_image(self, image_path):
-        """Display image"""
+        """Display image (decoded off the UI thread)"""
         try:
-            # Open image
-            image = Image.open(image_path)
-            
-            # Calculate scale to fit the display area
-            max_width = 600
-            max_height = 400
-            
-            width, height = image.size
-            scale = min(max_width/width, max_height/height, 1)
-            
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            
-            # Resize image
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Convert to PhotoImage
-            photo = ImageTk.PhotoImage(image)
-            
-            # Update image label
-            self.image_label.configure(image=photo, text="")
-            self.image_label.image = photo  # Keep reference
-            
-        except Exception as e:
+            key = (image_path, os.path.getmtime(image_path))
+        except OSError as e:
             messagebox.showerror("错误", f"无法显示图片: {str(e)}")
+            return
+        
+        thumbnail = self.thumbnail_cache.get(key)
+        if thumbnail is not None:
+            self._show_thumbnail(image_path, thumbnail)
+            return
+        
+        self.image_label.configure(image='', text="正在加载图片...")
+        self.image_label.image = None
+        threading.Thread(target=self._load_thumbnail_thread, 
+                         args=(image_path, key), daemon=True).start()
+    
+    def _load_thumbnail_thread(self, image_path, key):
+        """Thumbnail decode thread"""
+        try:
+            thumbnail = load_thumbnail(image_path, *PREVIEW_SIZE)
+            self.thumbnail_cache.put(key, thumbnail)
+            self.root.after(0, self._show_thumbnail, image_path, thumbnail)
+        except Exception as e:
+            self.root.after(0, self._show_error, f"无法显示图片: {str(e)}")
+    
+    def _show_thumbnail(self, image_path, thumbnail):
+        """Show a decoded thumbnail unless another image was selected meanwhile"""
+        if image_path != self.current_image_path:
+            return
+        
+        # Convert to PhotoImage (must happen on the Tk thread)
+        photo = ImageTk.PhotoImage(thumbnail)
+        
+        # Update image label
+        self.image_label.configure(image=photo, text="")
+        self.image_label.image = photo  # Keep reference
     
     def recognize_faces(self):
         """Recognize faces"""
@@ -182,15 +232,16 @@ class FaceRecognitionApp:
             return
         
         # Run recognition in a new thread to avoid freezing the UI
-        threading.Thread(target=self._recognize_faces_thread, daemon=True).start()
+        threading.Thread(target=self._recognize_faces_thread, 
+                         args=(self.profile_var.get(),), daemon=True).start()
     
-    def _recognize_faces_thread(self):
+    def _recognize_faces_thread(self, profile):
         """Face recognition thread"""
         try:
             self.update_status("正在识别人脸...")
             
             # Perform face recognition
-            results = self.face_detector.recognize_faces(self.current_image_path)
+            results = self.face_detector.recognize_faces(self.current_image_path, profile=profile)
             
             # 在主线程中更新界面
             self.root.after(0, self._update_recognition_results, results)
@@ -226,6 +277,8 @@ class FaceRecognitionApp:
                     result_text += f"  地址: {result['address']}\n"
                 if result.get('confidence'):
                     result_text += f"  置信度: {result['confidence']:.2f}\n"
+            elif result.get('skipped'):
+                result_text += f"  状态: 未识别（{SKIP_REASON_TEXT[result['skip_reason']]}，已跳过）\n"
             else:
                 result_text += "  状态: 未识别的人脸\n"
             
@@ -288,7 +341,6 @@ class FaceRecognitionApp:
             
             if success:
                 self.root.after(0, self._show_success, message)
-                self.root.after(0, self.refresh_database)
             else:
                 self.root.after(0, self._show_error, message)
                 
@@ -301,29 +353,181 @@ class FaceRecognitionApp:
         self.notebook.select(2)  # 切换到记录标签页
     
     def load_recognition_logs(self):
-        """Load recognition logs"""
+        """Load recognition logs newer than the ones already shown"""
+        if self.logs_loading:
+            # Run once the page load in flight has finished
+            self.logs_refresh_pending = True
+            return
+        if self.has_newer_logs:
+            # Scrolled away from the newest rows: restart the window at the newest page
+            self._fetch_logs('reset')
+        else:
+            self._fetch_logs('newest', after_id=self.newest_log_id)
+    
+    def _load_older_logs(self):
+        """Load the next page of older recognition logs"""
+        if self.has_older_logs and self.oldest_log_id is not None and not self.logs_loading:
+            self._fetch_logs('older', before_id=self.oldest_log_id)
+    
+    def _load_newer_logs(self):
+        """Load back the page just above the window, evicted while scrolling down"""
+        if self.has_newer_logs and not self.logs_loading:
+            self._fetch_logs('newer', after_id=self.newest_log_id)
+    
+    def _on_logs_scroll(self, first, last):
+        """Fetch pages on demand as the view nears either end of the window"""
+        self.logs_scrollbar.set(first, last)
+        if float(last) > 0.95:
+            self._load_older_logs()
+        elif float(first) < 0.05:
+            self._load_newer_logs()
+    
+    def _fetch_logs(self, kind, after_id=None, before_id=None):
+        self.logs_loading = True
+        threading.Thread(target=self._fetch_logs_thread, 
+                         args=(kind, after_id, before_id), daemon=True).start()
+    
+    def _fetch_logs_thread(self, kind, after_id, before_id):
+        """Recognition log query thread"""
         try:
-            # Clear existing records
-            for item in self.logs_tree.get_children():
-                self.logs_tree.delete(item)
-            
-            # Retrieve logs
-            logs = self.db_manager.get_recognition_logs(100)
+            if kind in ('newest', 'reset') and self.face_detector.log_debouncer is not None:
+                # Write sightings still being merged so the newest page is complete
+                self.face_detector.log_debouncer.flush()
+            # The page right above the window, not the newest rows past it
+            logs = self.db_manager.get_recognition_logs(
+                LOG_PAGE_SIZE, after_id=after_id, before_id=before_id,
+                oldest_first=kind == 'newer'
+            )
+            if kind == 'newer':
+                logs.reverse()
+            self.root.after(0, self._insert_logs, logs, kind)
+        except Exception as e:
+            self.root.after(0, self._finish_logs_load)
+            self.root.after(0, self._show_error, f"加载识别记录时发生错误: {str(e)}")
+    
+    def _insert_logs(self, logs, kind):
+        """Insert fetched logs (newest first) above or below the rows shown"""
+        try:
+            tree = self.logs_tree
+            if kind == 'reset' or (kind == 'newest' and self.newest_log_id is not None
+                                   and len(logs) == LOG_PAGE_SIZE):
+                # More new rows than one page: restart the window at the newest page
+                tree.delete(*tree.get_children())
+                self.newest_log_id = None
+                self.has_older_logs = True
+                self.has_newer_logs = False
             
-            # Insert logs into the treeview
-            for log in logs:
-                self.logs_tree.insert('', 'end', values=(
-                    log['recognition_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                    log['name'] or '未知',
-                    log['age'] or '-',
-                    log['gender'] or '-',
-                    f"{log['confidence']:.2f}" if log['confidence'] else '-'
-                ))
+            if kind == 'older':
+                # Append older pages below what is already shown
+                for log in logs:
+                    tree.insert('', 'end', iid=str(log['id']), values=self._log_values(log))
+                if len(logs) < LOG_PAGE_SIZE:
+                    self.has_older_logs = False
+                self._evict_logs(from_top=True)
+            else:
+                # Insert new rows above the current top, keeping newest first
+                for log in reversed(logs):
+                    tree.insert('', 0, iid=str(log['id']), values=self._log_values(log))
+                if kind == 'newer':
+                    # Keep the rows the user was looking at in view
+                    tree.yview_scroll(len(logs), 'units')
+                    if len(logs) < LOG_PAGE_SIZE:
+                        self.has_newer_logs = False
+                elif self.newest_log_id is None and len(logs) < LOG_PAGE_SIZE:
+                    self.has_older_logs = False
+                self._evict_logs(from_top=False)
             
-            self.update_status(f"已加载 {len(logs)} 条识别记录")
+            children = tree.get_children()
+            self.newest_log_id = int(children[0]) if children else None
+            self.oldest_log_id = int(children[-1]) if children else None
             
-        except Exception as e:
-            self._show_error(f"加载识别记录时发生错误: {str(e)}")
+            self.update_status(f"已加载 {len(children)} 条识别记录")
+        finally:
+            self._finish_logs_load()
+    
+    def _evict_logs(self, from_top):
+        """Keep at most LOG_WINDOW_PAGES pages in the view, dropping rows at the
+        end away from where the user is scrolling; they are fetched again on demand"""
+        children = self.logs_tree.get_children()
+        excess = len(children) - LOG_PAGE_SIZE * LOG_WINDOW_PAGES
+        if excess <= 0:
+            return
+        if from_top:
+            self.logs_tree.delete(*children[:excess])
+            # The rows in view moved up by as many rows; follow them
+            self.logs_tree.yview_scroll(-excess, 'units')
+            self.has_newer_logs = True
+        else:
+            self.logs_tree.delete(*children[-excess:])
+            self.has_older_logs = True
+    
+    def _finish_logs_load(self):
+        self.logs_loading = False
+        if self.logs_refresh_pending:
+            self.logs_refresh_pending = False
+            self.load_recognition_logs()
+    
+    def _log_values(self, log):
+        return (
+            log['recognition_time'].strftime('%Y-%m-%d %H:%M:%S'),
+            log['name'] or '未知',
+            log['age'] or '-',
+            log['gender'] or '-',
+            f"{log['confidence']:.2f}" if log['confidence'] else '-',
+            log['hit_count'] or 1
+        )
+    
+    def start_batch(self):
+        """Start batch recognition of a folder"""
+        if self.batch is not None:
+            messagebox.showwarning("警告", "批量识别正在进行中")
+            return
+        
+        folder = filedialog.askdirectory(title="选择图片文件夹")
+        if not folder:
+            return
+        
+        report_path = filedialog.asksaveasfilename(
+            title="保存识别报告",
+            defaultextension=".jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("CSV", "*.csv")]
+        )
+        if not report_path:
+            return
+        
+        watch = messagebox.askyesno("批量识别", "处理完现有图片后是否继续监视文件夹中的新图片？")
+        
+        self.batch = BatchRecognizer(
+            self.face_detector, folder, report_path, watch=watch, recursive=True,
+            profile=self.profile_var.get(),
+            on_progress=lambda done, total, path: self.root.after(0, self._update_batch_progress, done, total),
+            on_done=lambda batch: self.root.after(0, self._finish_batch, batch)
+        )
+        self.cancel_batch_button.configure(state=tk.NORMAL)
+        self.batch_progress.configure(value=0, maximum=1)
+        self.batch.start()
+        self.update_status("批量识别已开始")
+    
+    def cancel_batch(self):
+        """Cancel the running batch"""
+        if self.batch is not None:
+            self.batch.cancel()
+            self.update_status("正在取消批量识别...")
+    
+    def _update_batch_progress(self, done, total):
+        """Update batch progress"""
+        if self.batch is None:
+            return
+        self.batch_progress.configure(value=done, maximum=max(total, 1))
+        self.update_status(f"批量识别: {done}/{total}")
+    
+    def _finish_batch(self, batch):
+        """Batch finished or cancelled"""
+        self.batch = None
+        self.cancel_batch_button.configure(state=tk.DISABLED)
+        state = "已取消" if batch.cancelled else "完成"
+        self.update_status(f"批量识别{state}: {batch.completed}/{batch.total}，失败 {batch.failed}")
+        self.load_recognition_logs()
     
     def refresh_database(self):
         """Refresh database"""
@@ -383,7 +587,8 @@ class PersonInfoDialog:
             ('gender', '性别', 'combo'),
             ('phone', '电话', 'text'),
             ('email', '邮箱', 'text'),
-            ('address', '地址', 'text')
+            ('address', '地址', 'text'),
+            ('site', '站点/分组', 'text')
         ]
         
         self.entries = {}
@@ -427,7 +632,8 @@ class PersonInfoDialog:
             'gender': self.entries['gender'].get() or None,
             'phone': self.entries['phone'].get().strip() or None,
             'email': self.entries['email'].get().strip() or None,
-            'address': self.entries['address'].get().strip() or None
+            'address': self.entries['address'].get().strip() or None,
+            'site': self.entries['site'].get().strip() or None
         }
         
         # Validate age
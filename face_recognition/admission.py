@@ -0,0 +1,113 @@
+# Admission control for expensive requests
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from config import ADMISSION_CONFIG
+
+
+class Overloaded(Exception):
+    """The request was not admitted; retry_after is a suggested wait in seconds"""
+
+    def __init__(self, message, retry_after, queue_full):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.queue_full = queue_full
+
+
+class DeadlineExpired(Exception):
+    """The caller's deadline passed before processing could start"""
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded wait queue in front of it.
+
+    Requests beyond max_concurrency wait in line; once max_queue requests are
+    waiting, new ones are turned away at once instead of piling up, so admitted
+    requests keep a predictable latency under overload. Waiters are admitted
+    in arrival order: a finishing request hands its slot to the oldest one.
+    """
+
+    def __init__(self, max_concurrency=None, max_queue=None, queue_timeout=None):
+        self.max_concurrency = max_concurrency or ADMISSION_CONFIG['max_concurrency']
+        self.max_queue = ADMISSION_CONFIG['max_queue'] if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or ADMISSION_CONFIG['queue_timeout']
+        self.active = 0
+        self.rejected = 0
+        self.expired = 0
+        # Moving average of processing time, for Retry-After estimates
+        self._service_time = 1.0
+        self._lock = threading.Lock()
+        # One event per queued request, oldest first; set when it is handed a slot
+        self._waiters = deque()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained"""
+        backlog = self.waiting + self.active
+        return max(1, int(round(backlog * self._service_time / self.max_concurrency)))
+
+    @contextmanager
+    def slot(self, deadline=None):
+        """Hold a processing slot for the body of the with block.
+
+        deadline is a time.monotonic() value; requests still queued when it
+        passes are dropped. Yields the seconds spent waiting in the queue.
+        """
+        enqueued = time.monotonic()
+        with self._lock:
+            if deadline is not None and deadline <= enqueued:
+                self.expired += 1
+                raise DeadlineExpired("请求已超过截止时间")
+            ticket = None
+            if self.active < self.max_concurrency and not self._waiters:
+                self.active += 1
+            elif len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded("服务繁忙，请稍后重试", self.retry_after(), queue_full=True)
+            else:
+                ticket = threading.Event()
+                self._waiters.append(ticket)
+
+        if ticket is not None:
+            give_up = enqueued + self.queue_timeout
+            if deadline is not None:
+                give_up = min(give_up, deadline)
+            if not ticket.wait(max(0.0, give_up - time.monotonic())):
+                with self._lock:
+                    # A slot may have been handed over just as the wait timed out
+                    if not ticket.is_set():
+                        self._waiters.remove(ticket)
+                        if deadline is not None and give_up == deadline:
+                            self.expired += 1
+                            raise DeadlineExpired("请求排队期间已超过截止时间")
+                        self.rejected += 1
+                        raise Overloaded("排队超时，请稍后重试", self.retry_after(), queue_full=False)
+
+        started = time.monotonic()
+        try:
+            yield started - enqueued
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+                if self._waiters:
+                    # The slot passes straight to the oldest waiter; active stays the same
+                    self._waiters.popleft().set()
+                else:
+                    self.active -= 1
+
+    def status(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'rejected': self.rejected,
+                'expired': self.expired,
+                'avg_processing_ms': round(self._service_time * 1000, 1)
+            }
@@ -0,0 +1,173 @@
+# Batch / watch-folder recognition
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import BATCH_CONFIG
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}
+
+CSV_FIELDS = ['image_path', 'face_index', 'name', 'person_id', 'confidence',
+              'top', 'right', 'bottom', 'left', 'skip_reason', 'error']
+
+
+class RecognitionReport:
+    """Thread-safe CSV or JSONL writer for batch results"""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._csv = None
+        if self.format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            if self._file.tell() == 0:
+                self._csv.writeheader()
+
+    def write(self, image_path, results, error=None):
+        with self._lock:
+            if self._csv is not None:
+                if error or not results:
+                    self._csv.writerow({'image_path': image_path, 'error': error or ''})
+                for i, result in enumerate(results):
+                    top, right, bottom, left = result['face_location']
+                    self._csv.writerow({
+                        'image_path': image_path,
+                        'face_index': i,
+                        'name': result['name'],
+                        'person_id': result.get('person_id'),
+                        'confidence': f"{result['confidence']:.4f}",
+                        'top': top, 'right': right, 'bottom': bottom, 'left': left,
+                        'skip_reason': result.get('skip_reason') or result.get('quality_flag') or '',
+                        'error': ''
+                    })
+            else:
+                record = {'image_path': image_path, 'faces': results}
+                if error:
+                    record['error'] = error
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class BatchRecognizer:
+    """Recognizes every image in a folder on a bounded worker pool, optionally
+    watching it for new files until cancelled"""
+
+    def __init__(self, face_detector, folder, report_path, watch=False, recursive=False,
+                 profile=None, on_progress=None, on_done=None):
+        self.face_detector = face_detector
+        self.profile = profile
+        self.folder = folder
+        self.report_path = report_path
+        self.watch = watch
+        self.recursive = recursive
+        self.on_progress = on_progress
+        self.on_done = on_done
+
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self._seen = set()
+        self._cancelled = threading.Event()
+        self._counter_lock = threading.Lock()
+        # Bounds in-flight work so a huge folder does not queue thousands of futures
+        self._slots = threading.Semaphore(BATCH_CONFIG['workers'] * 2)
+        self._last_submit = 0.0
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _scan(self):
+        """New, fully written image files in the folder, oldest first"""
+        now = time.time()
+        found = []
+        for root, dirs, files in os.walk(self.folder):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if path in self._seen or os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                # Skip files that may still be being copied in
+                if now - mtime < BATCH_CONFIG['settle_time']:
+                    continue
+                found.append((mtime, path))
+            if not self.recursive:
+                break
+        found.sort()
+        return [path for _, path in found]
+
+    def _throttle(self):
+        max_rate = BATCH_CONFIG['max_rate']
+        if max_rate:
+            wait = self._last_submit + 1.0 / max_rate - time.time()
+            if wait > 0:
+                self._cancelled.wait(wait)
+        self._last_submit = time.time()
+
+    def _run(self):
+        report = RecognitionReport(self.report_path)
+        try:
+            with ThreadPoolExecutor(max_workers=BATCH_CONFIG['workers']) as executor:
+                while not self.cancelled:
+                    paths = self._scan()
+                    with self._counter_lock:
+                        self.total += len(paths)
+                    self._notify(None)
+
+                    for path in paths:
+                        self._seen.add(path)
+                        while not self._slots.acquire(timeout=0.5):
+                            if self.cancelled:
+                                break
+                        if self.cancelled:
+                            break
+                        self._throttle()
+                        executor.submit(self._recognize_one, path, report)
+
+                    if not self.watch:
+                        break
+                    self._cancelled.wait(BATCH_CONFIG['poll_interval'])
+        finally:
+            report.close()
+            if self.on_done:
+                self.on_done(self)
+
+    def _recognize_one(self, image_path, report):
+        try:
+            if self.cancelled:
+                return
+            try:
+                results = self.face_detector.recognize_faces(image_path, profile=self.profile,
+                                                             source=self.folder, raise_errors=True)
+                report.write(image_path, results)
+                failed = False
+            except Exception as e:
+                report.write(image_path, [], error=str(e))
+                failed = True
+            with self._counter_lock:
+                self.completed += 1
+                self.failed += failed
+            self._notify(image_path)
+        finally:
+            self._slots.release()
+
+    def _notify(self, image_path):
+        if self.on_progress:
+            self.on_progress(self.completed, self.total, image_path)
@@ -0,0 +1,92 @@
+# Cross-request micro-batching of gallery matching
+import queue
+import threading
+import time
+import numpy as np
+from config import MATCH_BATCHING_CONFIG
+
+
+class _MatchRequest:
+    __slots__ = ('snapshot', 'encodings', 'k', 'result', 'error', 'done')
+
+    def __init__(self, snapshot, encodings, k):
+        self.snapshot = snapshot
+        self.encodings = encodings
+        self.k = k
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Gathers match queries from concurrent requests for a few milliseconds
+    and runs each group against the gallery as one matrix-matrix scan.
+
+    Queries are only batched with others against the same snapshot, so every
+    request still sees one consistent gallery version.
+    """
+
+    def __init__(self, window_ms=None, max_batch=None):
+        self.window = (MATCH_BATCHING_CONFIG['window_ms'] if window_ms is None else window_ms) / 1000.0
+        self.max_batch = max_batch or MATCH_BATCHING_CONFIG['max_batch']
+        self.batches = 0
+        self.queries = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def nearest(self, snapshot, encodings, k=1):
+        """snapshot.nearest_batch(encodings, k), computed together with concurrent callers"""
+        request = _MatchRequest(snapshot, np.atleast_2d(np.asarray(encodings, dtype=np.float64)), k)
+        if not len(request.encodings):
+            return []
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        """Block for one request, then gather more until the window closes or the batch is full"""
+        batch = [self._queue.get()]
+        size = len(batch[0].encodings)
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.encodings)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for request in batch:
+                groups.setdefault((id(request.snapshot), request.k), []).append(request)
+
+            for requests in groups.values():
+                try:
+                    stacked = np.concatenate([request.encodings for request in requests])
+                    results = requests[0].snapshot.nearest_batch(stacked, requests[0].k)
+                    offset = 0
+                    for request in requests:
+                        request.result = results[offset:offset + len(request.encodings)]
+                        offset += len(request.encodings)
+                except Exception as e:
+                    for request in requests:
+                        request.error = e
+                self.batches += 1
+                self.queries += sum(len(request.encodings) for request in requests)
+                for request in requests:
+                    request.done.set()
+
+    def status(self):
+        """Batches run and query encodings matched; avg_batch is encodings per batch"""
+        return {
+            'batches': self.batches,
+            'queries': self.queries,
+            'avg_batch': round(self.queries / self.batches, 2) if self.batches else 0
+        }
@@ -0,0 +1,150 @@
+# Incremental gallery synchronisation from the gallery_changes log
+import time
+from datetime import datetime
+import numpy as np
+from config import CHANGE_FEED_CONFIG
+from face_recognition.gallery import person_info_from_row
+
+
+class GalleryDelta:
+    """Net effect of a batch of gallery changes, ready to apply to an in-memory gallery"""
+
+    def __init__(self):
+        self.removed_person_ids = set()
+        self.removed_encoding_ids = set()
+        self.updated_persons = {}   # person_id -> person info
+        self.added_rows = []        # rows shaped like DatabaseManager.get_all_face_encodings
+        self.reload = False         # every encoding changed (a re-encoding job was activated)
+
+    def is_empty(self):
+        return not (self.reload or self.removed_person_ids or self.removed_encoding_ids
+                    or self.updated_persons or self.added_rows)
+
+
+class GalleryChangeFeed:
+    """Polls the gallery change log past a watermark and turns new rows into deltas"""
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.watermark = 0
+        self.last_poll_time = None
+        self.last_applied_change_time = None
+        self.last_apply_lag = None
+        self._gap_since = None
+
+    def start_at(self, watermark):
+        """Reset the watermark, e.g. to the value read just before a full load"""
+        self.watermark = watermark or 0
+        self._gap_since = None
+
+    def poll(self):
+        """Fetch changes past the watermark; returns a GalleryDelta or None on error"""
+        changes = self.db_manager.get_gallery_changes(self.watermark, CHANGE_FEED_CONFIG['batch_size'])
+        if changes is None:
+            return None
+        self.last_poll_time = time.time()
+
+        # AUTO_INCREMENT ids are assigned before commit, so a lower id can still appear
+        # after a higher one. Stop at a gap until it fills or gap_timeout expires.
+        ready = []
+        expected = self.watermark + 1
+        for change in changes:
+            if change['id'] != expected:
+                if self._gap_since is None:
+                    self._gap_since = self.last_poll_time
+                if self.last_poll_time - self._gap_since < CHANGE_FEED_CONFIG['gap_timeout']:
+                    break
+            self._gap_since = None
+            ready.append(change)
+            expected = change['id'] + 1
+
+        delta = self._build_delta(ready)
+        if delta is None:
+            # Leave the watermark alone so these changes are read again next poll
+            return None
+        if ready:
+            self.watermark = ready[-1]['id']
+            self.last_applied_change_time = ready[-1]['changed_at']
+            if isinstance(self.last_applied_change_time, datetime):
+                self.last_apply_lag = (datetime.now() - self.last_applied_change_time).total_seconds()
+        return delta
+
+    def _build_delta(self, changes):
+        delta = GalleryDelta()
+        added_encoding_ids = set()
+        updated_person_ids = set()
+
+        for change in changes:
+            person_id = change['person_id']
+            if change['entity'] == 'person':
+                if change['operation'] == 'delete':
+                    delta.removed_person_ids.add(person_id)
+                    updated_person_ids.discard(person_id)
+                elif change['operation'] == 'update':
+                    updated_person_ids.add(person_id)
+            elif change['entity'] == 'encoding':
+                if change['operation'] in ('delete', 'update'):
+                    delta.removed_encoding_ids.add(change['entity_id'])
+                if change['operation'] in ('insert', 'update'):
+                    added_encoding_ids.add(change['entity_id'])
+                elif change['operation'] == 'delete':
+                    added_encoding_ids.discard(change['entity_id'])
+            elif change['entity'] == 'gallery' and change['operation'] == 'reload':
+                delta.reload = True
+
+        if delta.reload:
+            # The caller reloads everything; nothing to fetch row by row
+            return delta
+
+        # Rows of persons deleted in the meantime no longer join, so they drop out here
+        delta.added_rows = self.db_manager.get_face_encodings_by_ids(sorted(added_encoding_ids))
+        delta.updated_persons = self.db_manager.get_persons_by_ids(sorted(updated_person_ids))
+        if delta.added_rows is None or delta.updated_persons is None:
+            return None
+        return delta
+
+    def status(self):
+        """Observable consistency state of this feed"""
+        now = time.time()
+        return {
+            'watermark': self.watermark,
+            'poll_interval': CHANGE_FEED_CONFIG['poll_interval'],
+            'seconds_since_poll': None if self.last_poll_time is None else now - self.last_poll_time,
+            'last_applied_change_time': self.last_applied_change_time,
+            'last_apply_lag': self.last_apply_lag,
+            'waiting_on_gap': self._gap_since is not None
+        }
+
+
+def apply_delta_to_arrays(gallery, delta):
+    """Apply a GalleryDelta to gallery arrays shaped like DatabaseManager.load_gallery_arrays
+    output, returning new arrays; added rows go at the end, whatever their site"""
+    added_ids = [row['encoding_id'] for row in delta.added_rows]
+    keep = ~np.isin(gallery['person_ids'], list(delta.removed_person_ids))
+    keep &= ~np.isin(gallery['encoding_ids'], list(delta.removed_encoding_ids) + added_ids)
+
+    encodings = np.concatenate([
+        gallery['encodings'][keep],
+        np.array([row['face_encoding'] for row in delta.added_rows],
+                 dtype=gallery['encodings'].dtype).reshape(-1, gallery['encodings'].shape[1])
+    ])
+    encoding_ids = np.concatenate([gallery['encoding_ids'][keep], np.array(added_ids, dtype=np.int64)])
+    person_ids = np.concatenate([
+        gallery['person_ids'][keep],
+        np.array([row['person_id'] for row in delta.added_rows], dtype=np.int64)
+    ])
+
+    persons = dict(gallery['persons'])
+    for row in delta.added_rows:
+        persons[row['person_id']] = person_info_from_row(row)
+    for person_id, info in delta.updated_persons.items():
+        if person_id in persons:
+            persons[person_id] = dict(persons[person_id], **info)
+    # Persons left without encodings drop out, as they would from a full load
+    persons = {person_id: persons[person_id] for person_id in np.unique(person_ids).tolist()}
+    return {
+        'encodings': encodings,
+        'encoding_ids': encoding_ids,
+        'person_ids': person_ids,
+        'persons': persons
+    }
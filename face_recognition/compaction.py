@@ -0,0 +1,85 @@
+# Per-person gallery compaction
+from collections import defaultdict
+import numpy as np
+from config import COMPACTION_CONFIG, FACE_RECOGNITION_CONFIG
+from face_recognition.unknown_clustering import representative_subset
+
+
+def plan_compaction(rows):
+    """Encoding IDs to delete so each person keeps a capped, duplicate-free subset.
+
+    rows are DatabaseManager.get_all_face_encodings rows. Kept encodings are the
+    person's medoid plus the encodings farthest from those already kept, which
+    preserves the spread of appearances (glasses, lighting, age) rather than
+    the most frequent one.
+    """
+    by_person = defaultdict(list)
+    for row in rows:
+        by_person[row['person_id']].append(row)
+
+    removed = []
+    for person_rows in by_person.values():
+        if len(person_rows) < 2:
+            continue
+        keep = set(representative_subset(
+            [row['face_encoding'] for row in person_rows],
+            COMPACTION_CONFIG['max_encodings_per_person'],
+            COMPACTION_CONFIG['duplicate_threshold']
+        ))
+        removed.extend(row['encoding_id'] for i, row in enumerate(person_rows) if i not in keep)
+    return removed
+
+
+def evaluate_compaction(rows, removed_ids):
+    """Matching-quality impact of removing encodings.
+
+    Every removed encoding is a real sighting of its person, so each one is
+    matched as a query against the gallery before compaction (minus itself)
+    and after compaction. Returns a stats dict; the mean distances are to the
+    query's own person's closest encoding.
+    """
+    tolerance = FACE_RECOGNITION_CONFIG['tolerance']
+    removed_ids = set(removed_ids)
+    encodings = np.array([row['face_encoding'] for row in rows], dtype=np.float64).reshape(-1, 128)
+    person_ids = np.array([row['person_id'] for row in rows], dtype=np.int64)
+    kept = np.array([row['encoding_id'] not in removed_ids for row in rows], dtype=bool)
+
+    stats = {
+        'encodings_before': len(rows),
+        'encodings_after': int(kept.sum()),
+        'persons': len(set(person_ids.tolist())),
+        'queries': 0,
+        'correct_before': 0,
+        'correct_after': 0,
+        'mean_distance_before': 0.0,
+        'mean_distance_after': 0.0
+    }
+    distance_before = distance_after = 0.0
+    for index in np.flatnonzero(~kept):
+        distances = np.linalg.norm(encodings - encodings[index], axis=1)
+        distances[index] = np.inf
+        same_person = person_ids == person_ids[index]
+        before = int(np.argmin(distances))
+        correct_before = person_ids[before] == person_ids[index] and distances[before] <= tolerance
+        distance_before += distances[same_person].min()
+        distances[~kept] = np.inf
+        after = int(np.argmin(distances))
+        correct_after = person_ids[after] == person_ids[index] and distances[after] <= tolerance
+        distance_after += distances[same_person].min()
+
+        stats['queries'] += 1
+        stats['correct_before'] += bool(correct_before)
+        stats['correct_after'] += bool(correct_after)
+
+    if stats['queries']:
+        stats['mean_distance_before'] = distance_before / stats['queries']
+        stats['mean_distance_after'] = distance_after / stats['queries']
+    return stats
+
+
+def is_near_duplicate(encoding, gallery):
+    """(index, distance) of a gallery encoding within duplicate_threshold, or None"""
+    indices, distances = gallery.nearest(encoding, exact=True)
+    if len(indices) and distances[0] <= COMPACTION_CONFIG['duplicate_threshold']:
+        return int(indices[0]), float(distances[0])
+    return None
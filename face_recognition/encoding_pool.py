@@ -0,0 +1,103 @@
+# Parallel per-face encoding for images with many faces
+import math
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import face_recognition
+from config import ENCODING_POOL_CONFIG
+from face_recognition.image_io import crop_face
+
+
+def _encode_crops(faces, num_jitters, model):
+    """Worker: one encoding per (crop, location) pair"""
+    return [face_recognition.face_encodings(crop, [location], num_jitters=num_jitters,
+                                            model=model)[0]
+            for crop, location in faces]
+
+
+def _ready():
+    return os.getpid()
+
+
+def fork_available():
+    """Whether worker processes can be forked safely here.
+
+    Windows has no fork, and on macOS system frameworks (Tk among them) are not
+    fork-safe once initialized.
+    """
+    return 'fork' in multiprocessing.get_all_start_methods() and sys.platform != 'darwin'
+
+
+def configured_workers():
+    """Worker count from ENCODING_POOL_CONFIG, defaulting to the CPUs this process may use"""
+    if ENCODING_POOL_CONFIG['workers']:
+        return ENCODING_POOL_CONFIG['workers']
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class EncodingPool:
+    """Splits the faces of one image across worker processes.
+
+    dlib computes landmarks and the embedding one face at a time and keeps the
+    GIL while doing so, so the work goes to processes; each worker is sent only
+    its faces' crops, never the whole image. Results keep the input order.
+    """
+
+    def __init__(self, workers=None, min_faces=None):
+        self.workers = workers or configured_workers()
+        self.min_faces = min_faces or ENCODING_POOL_CONFIG['min_faces']
+        # Forked workers inherit the loaded models instead of re-importing the
+        # application's main module (the default start method differs by Python version)
+        self._executor = ProcessPoolExecutor(self.workers,
+                                             mp_context=multiprocessing.get_context('fork'))
+        # Fork every worker now, while the caller has not started its own threads yet
+        self._executor.submit(_ready).result()
+
+    def wants(self, face_count):
+        """Whether this many faces are worth shipping to the workers"""
+        return face_count >= self.min_faces
+
+    def encode(self, image, locations, num_jitters=1, model='small'):
+        """face_recognition.face_encodings(image, locations), spread over the workers"""
+        return self.encode_crops([crop_face(image, location) for location in locations],
+                                 num_jitters, model)
+
+    def encode_crops(self, faces, num_jitters=1, model='small'):
+        """Encodings for (crop, location) pairs, in order"""
+        if not faces:
+            return []
+        # One contiguous chunk per worker keeps the round trips few
+        size = math.ceil(len(faces) / self.workers)
+        futures = [self._executor.submit(_encode_crops, faces[start:start + size], num_jitters, model)
+                   for start in range(0, len(faces), size)]
+        encodings = []
+        for future in futures:
+            encodings.extend(future.result())
+        return encodings
+
+    def close(self):
+        self._executor.shutdown()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """The process-wide EncodingPool, or None if it is disabled or cannot run here.
+
+    Every FaceDetector in a process shares one pool, so a process never runs
+    more than configured_workers() encoding processes.
+    """
+    global _shared_pool
+    if (not ENCODING_POOL_CONFIG['enabled'] or not fork_available()
+            or configured_workers() <= 1):
+        return None
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = EncodingPool()
+        return _shared_pool
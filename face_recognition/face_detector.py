@@ -1,154 +1,640 @@
 # Core face recognition module
 import face_recognition
 import cv2
+import math
 import numpy as np
 from PIL import Image
 import os
-from config import FACE_RECOGNITION_CONFIG
+import threading
+import time
+from config import (FACE_RECOGNITION_CONFIG, SHARED_GALLERY_CONFIG, CHANGE_FEED_CONFIG,
+                    UNKNOWN_FACES_CONFIG, PARTITION_CONFIG, SHARDING_CONFIG,
+                    COMPACTION_CONFIG, MATCH_BATCHING_CONFIG, GALLERY_CONFIG,
+                    RECOGNITION_LOG_CONFIG, QUALITY_CONFIG)
 from database.db_manager import DatabaseManager
+from face_recognition.shared_gallery import SharedGalleryReader
+from face_recognition.change_feed import GalleryChangeFeed
+from face_recognition.gallery import GallerySnapshot
+from face_recognition.image_io import (draw_results, fit_within, scale_location, decode_image,
+                                       validate_face_locations, clamp_face_locations, crop_face)
+from face_recognition.profiles import get_profile
+from face_recognition.prefilter import propose_face_regions
+from face_recognition.quality import assess_faces, SKIP_REASON_TEXT
+from face_recognition.unknown_clustering import representative_subset
+from face_recognition.compaction import is_near_duplicate
+from face_recognition.sharding import ShardClient, shard_of
+from face_recognition.batching import MicroBatcher
+from face_recognition.log_debouncer import RecognitionLogDebouncer
+from face_recognition.encoding_pool import shared_pool
 
 class FaceDetector:
-    def __init__(self):
+    def __init__(self, shard=None):
+        """shard: (index, count) to hold only that shard of the gallery (matcher nodes)"""
+        # Forks its workers, so it goes before any of this detector's threads start
+        self.encoding_pool = shared_pool() if shard is None else None
         self.db_manager = DatabaseManager()
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.known_face_info = []
+        self.gallery = GallerySnapshot.empty()
+        self.shared_gallery = None
+        self.change_feed = None
+        self.gallery_db_manager = None
+        self.shard = shard
+        self.shard_client = None
+        self.match_batcher = MicroBatcher() if MATCH_BATCHING_CONFIG['enabled'] else None
+        self.log_debouncer = None
+        if RECOGNITION_LOG_CONFIG['debounce'] and shard is None:
+            # Own connection: records are written from the debouncer's thread
+            self.log_debouncer = RecognitionLogDebouncer(DatabaseManager())
+        # Serializes gallery writers (loads, deltas, shared-memory remaps); readers never take it
+        self._sync_lock = threading.Lock()
+        # The MySQL connection is not thread-safe; guards it against concurrent callers
+        self._db_lock = threading.Lock()
+        
+        if SHARDING_CONFIG['enabled'] and shard is None:
+            # Front end: the matcher nodes hold and follow the gallery
+            self.shard_client = ShardClient()
+            return
+        
+        if SHARED_GALLERY_CONFIG['enabled'] and shard is None:
+            # The gallery loader process follows the change feed for all workers
+            self.shared_gallery = SharedGalleryReader(SHARED_GALLERY_CONFIG['name'])
+        else:
+            # Separate connection for full loads and change polls, used only under
+            # _sync_lock: a long streamed load must not hold the request connection
+            self.gallery_db_manager = DatabaseManager()
+            if CHANGE_FEED_CONFIG['enabled']:
+                self.change_feed = GalleryChangeFeed(self.gallery_db_manager)
+        
         self.load_known_faces()
+        
+        if self.change_feed is not None:
+            threading.Thread(target=self._poll_gallery_changes, daemon=True).start()
+    
+    @property
+    def known_face_encodings(self):
+        return self.gallery.encodings
+    
+    @property
+    def known_face_names(self):
+        return self.gallery.names
+    
+    @property
+    def known_face_info(self):
+        # Built on demand; matching itself only looks up info for the final matches
+        gallery = self.gallery
+        return [gallery.info(index) for index in range(len(gallery))]
+    
+    def _owns(self, person_id):
+        return self.shard is None or shard_of(person_id, self.shard[1]) == self.shard[0]
     
     def load_known_faces(self):
         """Load known faces from the database"""
+        if self.shard_client is not None:
+            return
+        if self.shared_gallery is not None:
+            self.sync_shared_gallery()
+            return
+        with self._sync_lock:
+            self._load_known_faces()
+    
+    def _load_known_faces(self):
+        """Full load into a new snapshot; returns False (keeping the old one) on failure"""
         try:
-            face_data = self.db_manager.get_all_face_encodings()
-            self.known_face_encodings = []
-            self.known_face_names = []
-            self.known_face_info = []
-            
-            for data in face_data:
-                self.known_face_encodings.append(data['face_encoding'])
-                self.known_face_names.append(data['name'])
-                self.known_face_info.append({
-                    'person_id': data['person_id'],
-                    'name': data['name'],
-                    'age': data['age'],
-                    'gender': data['gender'],
-                    'phone': data['phone'],
-                    'email': data['email'],
-                    'address': data['address']
-                })
-            print(f"Loaded {len(self.known_face_encodings)} known faces")
+            # Streamed into the final arrays; the watermark is read in the same snapshot
+            data = self.gallery_db_manager.load_gallery_arrays(
+                GallerySnapshot.encoding_dtype(), GALLERY_CONFIG['load_chunk_size'],
+                keep_person=self._owns if self.shard is not None else None,
+                watermark_lookback=CHANGE_FEED_CONFIG['gap_timeout']
+            )
+            if data is None:
+                raise RuntimeError("streaming the gallery failed")
+            # Built off to the side; requests keep matching against the old snapshot
+            self.gallery = GallerySnapshot.from_arrays(self.gallery.version + 1, data['encodings'],
+                                                       data['encoding_ids'], data['person_ids'],
+                                                       data['persons'])
+            if self.change_feed is not None:
+                self.change_feed.start_at(data['watermark'])
+            print(f"Loaded {len(self.gallery)} known faces (gallery version {self.gallery.version})")
+            return True
         except Exception as e:
             print(f"Error loading known faces: {e}")
+            return False
     
-    def detect_faces_in_image(self, image_path):
-        """Detect faces in an image"""
+    def sync_gallery_changes(self):
+        """Apply gallery changes since the last sync (full reload if the change feed is off)"""
+        if self.change_feed is None:
+            self.load_known_faces()
+            return
+        with self._sync_lock:
+            watermark = self.change_feed.watermark
+            try:
+                delta = self.change_feed.poll()
+                if delta is not None:
+                    delta.added_rows = [row for row in delta.added_rows if self._owns(row['person_id'])]
+                if delta is None or delta.is_empty():
+                    return
+                if delta.reload:
+                    # Every encoding was replaced at once; swap in a fresh load the same way
+                    if not self._load_known_faces():
+                        # Keep the current gallery; the reload change is read again next poll
+                        self.change_feed.start_at(watermark)
+                    return
+                self.gallery = self.gallery.with_delta(self.gallery.version + 1, delta)
+                print(f"Applied gallery changes up to {self.change_feed.watermark}, "
+                      f"{len(self.gallery)} known faces (gallery version {self.gallery.version})")
+            except Exception as e:
+                print(f"Error syncing gallery changes: {e}")
+                # The changes were not applied; read them again next poll
+                self.change_feed.start_at(watermark)
+    
+    def _poll_gallery_changes(self):
+        """Background loop bounding how stale this detector's gallery can get"""
+        while True:
+            time.sleep(CHANGE_FEED_CONFIG['poll_interval'])
+            self.sync_gallery_changes()
+    
+    def gallery_status(self):
+        """Gallery size and consistency state"""
+        gallery = self.gallery
+        if self.shard_client is not None:
+            return {'shards': self.shard_client.status()}
+        status = {'known_faces': len(gallery), 'gallery_version': gallery.version}
+        if self.shard is not None:
+            status['shard'] = {'index': self.shard[0], 'count': self.shard[1]}
+        if self.shared_gallery is not None:
+            status['shared_generation'] = self.shared_gallery.generation
+        if self.change_feed is not None:
+            status['change_feed'] = self.change_feed.status()
+        if self.match_batcher is not None:
+            status['match_batching'] = self.match_batcher.status()
+        return status
+    
+    def sync_shared_gallery(self):
+        """Remap the shared-memory gallery if the loader published a new generation"""
+        # Matching stays lock-free: while one thread remaps, the others keep
+        # matching against the snapshot they already have
+        if not self._sync_lock.acquire(blocking=False):
+            return
         try:
-            # Load image
-            image = face_recognition.load_image_file(image_path)
+            if self.shared_gallery.refresh():
+                reader = self.shared_gallery
+                # The generation is the version, so it is comparable across workers
+                self.gallery = GallerySnapshot.from_arrays(reader.generation, reader.encodings,
+                                                           reader.encoding_ids, reader.person_ids,
+                                                           reader.persons)
+                print(f"Mapped shared gallery generation {reader.generation} "
+                      f"with {len(self.gallery)} known faces")
+        except Exception as e:
+            print(f"Error mapping shared gallery: {e}")
+        finally:
+            self._sync_lock.release()
+    
+    def load_image(self, image_path):
+        """Decode an image file into an upright full-resolution RGB array"""
+        return decode_image(image_path)[0]
+    
+    def detect_faces_in_image(self, image_path, image=None, profile=None, face_locations=None):
+        """Detect faces in an image (pass the decoded array to skip loading).
+        
+        Caller-supplied face_locations, as (top, right, bottom, left) in original
+        pixels, skip detection; only landmarking and encoding run on them.
+        Faces the quality gate skips are left out.
+        """
+        face_locations, face_encodings, _ = self._detect_and_encode(
+            image_path, image, profile, face_locations
+        )
+        kept = [i for i, encoding in enumerate(face_encodings) if encoding is not None]
+        return [face_locations[i] for i in kept], [face_encodings[i] for i in kept]
+    
+    def _detect_and_encode(self, image_path, image=None, profile=None, face_locations=None,
+                           raise_errors=False):
+        """(face_locations, face_encodings, assessments) for every detected face.
+        
+        assessments holds the quality gate's verdict per face (None entries if
+        the gate is off); faces it skips have None for their encoding. Decode
+        and detection errors give no faces, or propagate with raise_errors.
+        """
+        try:
+            settings = get_profile(profile)
             
-            # Detect face locations
-            face_locations = face_recognition.face_locations(
-                image, 
-                model=FACE_RECOGNITION_CONFIG['model'],
-                number_of_times_to_upsample=FACE_RECOGNITION_CONFIG['upsample']
-            )
+            # Work at the profile's resolution; locations are reported in original pixels
+            if image is None:
+                # Decode straight to the working size
+                working_image, scale, (height, width) = decode_image(image_path, settings['max_size'])
+            else:
+                working_image, scale = fit_within(image, settings['max_size'])
+                height, width = image.shape[:2]
+            
+            if face_locations is not None:
+                face_locations = clamp_face_locations(
+                    validate_face_locations(face_locations), height, width
+                )
+                working_height, working_width = working_image.shape[:2]
+                working_locations = clamp_face_locations(
+                    [scale_location(location, scale) for location in face_locations],
+                    working_height, working_width
+                )
+            else:
+                # Detect face locations
+                working_locations = self.locate_faces(working_image, profile=profile)
+            
+            # Cheap quality checks first, so hopeless faces never reach the encoder
+            assessments = [None] * len(working_locations)
+            encode_indices = list(range(len(working_locations)))
+            if QUALITY_CONFIG['enabled'] and working_locations:
+                assessments = assess_faces(
+                    working_image, working_locations, scale,
+                    lambda img, locations: face_recognition.face_landmarks(
+                        img, locations, model=settings['landmark_model']
+                    )
+                )
+                if QUALITY_CONFIG['action'] == 'skip':
+                    encode_indices = [i for i, assessment in enumerate(assessments)
+                                      if assessment['reason'] is None]
             
             # Get face encodings
-            face_encodings = face_recognition.face_encodings(image, face_locations)
+            face_encodings = [None] * len(working_locations)
+            encoded = self._encode_faces(
+                image_path, image, working_image, scale,
+                [working_locations[i] for i in encode_indices], settings
+            )
+            for i, encoding in zip(encode_indices, encoded):
+                face_encodings[i] = encoding
             
-            return face_locations, face_encodings
+            if face_locations is None or len(working_locations) != len(face_locations):
+                face_locations = [scale_location(location, 1 / scale) for location in working_locations]
+            
+            return face_locations, face_encodings, assessments
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Face detection error: {e}")
-            return [], []
+            return [], [], []
+    
+    def _encode_faces(self, image_path, image, working_image, scale, working_locations, settings):
+        """Encodings for the working-image locations, in order.
+        
+        Faces smaller than the profile's encode_min_face in the working image
+        are encoded from a higher-resolution decode, cropped around each face,
+        instead of from their few working pixels.
+        """
+        def encode(img, locations):
+            if self.encoding_pool is not None and self.encoding_pool.wants(len(locations)):
+                return self.encoding_pool.encode(
+                    img, locations, settings['num_jitters'], settings['landmark_model']
+                )
+            return face_recognition.face_encodings(
+                img, locations, num_jitters=settings['num_jitters'], model=settings['landmark_model']
+            )
+        
+        min_face = settings.get('encode_min_face')
+        small = [i for i, (top, right, bottom, left) in enumerate(working_locations)
+                 if min_face and scale < 1.0 and min(bottom - top, right - left) < min_face]
+        if not working_locations:
+            return []
+        if not small:
+            return encode(working_image, working_locations)
+        
+        encodings = [None] * len(working_locations)
+        large = [i for i in range(len(working_locations)) if i not in small]
+        for i, encoding in zip(large, encode(working_image, [working_locations[i] for i in large])):
+            encodings[i] = encoding
+        
+        # Decode only as large as the smallest face needs (JPEG scales are cheap)
+        smallest = min(min(working_locations[i][2] - working_locations[i][0],
+                           working_locations[i][1] - working_locations[i][3]) for i in small)
+        if image is not None:
+            hires, hires_scale = image, 1.0
+        else:
+            wanted_scale = min(1.0, scale * min_face / max(smallest, 1))
+            longest = max(working_image.shape[:2]) / scale
+            hires, hires_scale, _ = decode_image(image_path, math.ceil(longest * wanted_scale))
+        
+        # Landmarks need some context around the box
+        faces = [crop_face(hires, scale_location(working_locations[i], hires_scale / scale))
+                 for i in small]
+        if self.encoding_pool is not None and self.encoding_pool.wants(len(faces)):
+            encoded = self.encoding_pool.encode_crops(
+                faces, settings['num_jitters'], settings['landmark_model']
+            )
+        else:
+            encoded = [encode(crop, [location])[0] for crop, location in faces]
+        for i, encoding in zip(small, encoded):
+            encodings[i] = encoding
+        return encodings
+    
+    def locate_faces(self, image, prefilter=None, profile=None):
+        """Face locations in an RGB array, optionally gated by the OpenCV pre-filter"""
+        settings = get_profile(profile)
+        if prefilter is None:
+            prefilter = FACE_RECOGNITION_CONFIG['prefilter']
+        if not prefilter:
+            return self._dlib_face_locations(image, settings)
+        
+        regions = propose_face_regions(image)
+        if not regions:
+            return []
+        
+        height, width = image.shape[:2]
+        coverage = sum((bottom - top) * (right - left) for top, right, bottom, left in regions)
+        if (FACE_RECOGNITION_CONFIG['prefilter_mode'] == 'reject'
+                or coverage > FACE_RECOGNITION_CONFIG['prefilter_max_coverage'] * height * width):
+            return self._dlib_face_locations(image, settings)
+        
+        # Run the expensive detector only on the candidate crops
+        face_locations = []
+        for top, right, bottom, left in regions:
+            crop = np.ascontiguousarray(image[top:bottom, left:right])
+            for t, r, b, l in self._dlib_face_locations(crop, settings):
+                face_locations.append((t + top, r + left, b + top, l + left))
+        return face_locations
     
-    def recognize_faces(self, image_path):
-        """Recognize faces and return results"""
+    def _dlib_face_locations(self, image, settings):
+        return face_recognition.face_locations(
+            image, 
+            model=settings['model'],
+            number_of_times_to_upsample=settings['upsample']
+        )
+    
+    def recognize_faces(self, image_path, image=None, profile=None, face_locations=None,
+                        scope=None, fallback=None, source=None, raise_errors=False,
+                        with_version=False):
+        """Recognize faces and return results.
+        
+        scope: optional list of sites; only their persons are matched. With
+        fallback, faces not matched in scope are matched against everyone.
+        source names where the image came from (camera, client, folder);
+        repeat sightings from one source are merged in recognition_logs.
+        With raise_errors, an unreadable image or a failed detection raises
+        instead of looking like an image without faces.
+        With with_version, returns (results, gallery_version), so callers learn
+        which gallery state was used even when no face was found.
+        """
+        gallery_version = None
+        
+        def done(results):
+            return (results, gallery_version) if with_version else results
+        
         try:
-            face_locations, face_encodings = self.detect_faces_in_image(image_path)
+            if self.shared_gallery is not None:
+                self.sync_shared_gallery()
             
-            if not face_encodings:
-                return []
+            # Match every face in this image against one consistent snapshot
+            gallery = self.gallery
+            gallery_version = None if self.shard_client is not None else gallery.version
+            if fallback is None:
+                fallback = PARTITION_CONFIG['fallback_to_global']
+            
+            face_locations, face_encodings, assessments = self._detect_and_encode(
+                image_path, image, profile, face_locations, raise_errors
+            )
+            
+            if not face_locations:
+                return done([])
+            
+            # Faces the quality gate skipped are reported but never matched
+            encoded = [i for i, encoding in enumerate(face_encodings) if encoding is not None]
+            matches = [None] * len(face_encodings)
+            shards = None
+            if encoded:
+                encodings = [face_encodings[i] for i in encoded]
+                if self.shard_client is not None:
+                    found, shards = self.shard_client.match(encodings, scope, fallback)
+                    gallery_version = shards['versions']
+                else:
+                    found = self._match_local(gallery, encodings, scope, fallback)
+                for i, match in zip(encoded, found):
+                    matches[i] = match
             
             results = []
             
             for i, face_encoding in enumerate(face_encodings):
-                # Compare with known faces
-                matches = face_recognition.compare_faces(
-                    self.known_face_encodings, 
-                    face_encoding, 
-                    tolerance=FACE_RECOGNITION_CONFIG['tolerance']
-                )
-                
-                face_distances = face_recognition.face_distance(
-                    self.known_face_encodings, 
-                    face_encoding
-                )
+                assessment = assessments[i]
+                quality = None
+                if assessment is not None:
+                    quality = {key: assessment[key] for key in ('size', 'sharpness', 'yaw')}
                 
-                best_match_index = np.argmin(face_distances)
-                
-                if matches[best_match_index]:
+                if face_encoding is None:
+                    results.append({
+                        'name': '未知',
+                        'confidence': 0,
+                        'face_location': face_locations[i],
+                        'person_id': None,
+                        'gallery_version': gallery_version,
+                        'skipped': True,
+                        'skip_reason': assessment['reason'],
+                        'quality': quality
+                    })
+                elif matches[i] is not None:
                     # Found matching face
-                    confidence = 1 - face_distances[best_match_index]
-                    person_info = self.known_face_info[best_match_index].copy()
+                    info, distance, in_scope = matches[i]
+                    confidence = 1 - distance
+                    person_info = {key: info[key] for key in info
+                                   if key not in ('distance', 'confidence', 'match')}
                     person_info['confidence'] = confidence
                     person_info['face_location'] = face_locations[i]
+                    person_info['gallery_version'] = gallery_version
+                    if scope:
+                        person_info['in_scope'] = in_scope
+                    if shards is not None:
+                        person_info['shards'] = shards
+                    if quality is not None:
+                        person_info['quality'] = quality
+                        if assessment['reason']:
+                            person_info['quality_flag'] = assessment['reason']
                     
                     # Record recognition log
-                    self.db_manager.add_recognition_log(
-                        person_info['person_id'], 
-                        confidence, 
-                        image_path
-                    )
+                    if self.log_debouncer is not None:
+                        self.log_debouncer.record(
+                            person_info['person_id'],
+                            confidence,
+                            image_path,
+                            source
+                        )
+                    else:
+                        with self._db_lock:
+                            self.db_manager.add_recognition_log(
+                                person_info['person_id'], 
+                                confidence, 
+                                image_path,
+                                source
+                            )
                     
                     results.append(person_info)
                 else:
-                    # Unrecognized face
-                    results.append({
+                    # Unrecognized face; kept for offline clustering unless flagged as poor
+                    flagged = assessment is not None and assessment['reason']
+                    if UNKNOWN_FACES_CONFIG['persist'] and not flagged:
+                        with self._db_lock:
+                            self.db_manager.add_unknown_face(
+                                face_encoding,
+                                image_path,
+                                face_locations[i]
+                            )
+                    
+                    result = {
                         'name': '未知',
                         'confidence': 0,
                         'face_location': face_locations[i],
-                        'person_id': None
-                    })
+                        'person_id': None,
+                        'gallery_version': gallery_version
+                    }
+                    if shards is not None:
+                        # A partial answer may have missed the person's shard
+                        result['shards'] = shards
+                    if quality is not None:
+                        result['quality'] = quality
+                        if flagged:
+                            result['quality_flag'] = assessment['reason']
+                    results.append(result)
             
-            return results
+            return done(results)
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Face recognition error: {e}")
-            return []
+            return done([])
+    
+    def _match_local(self, gallery, encodings, scope, fallback):
+        """Best match within tolerance per encoding as (info, distance, in_scope) or None"""
+        tolerance = FACE_RECOGNITION_CONFIG['tolerance']
+        scoped = gallery.scoped(scope) if scope else gallery
+        matches = []
+        for indices, distances in self._nearest_batch(scoped, encodings):
+            if len(indices) and distances[0] <= tolerance:
+                matches.append((scoped.info(indices[0]), distances[0], True))
+            else:
+                matches.append(None)
+        
+        if scope and fallback:
+            missing = [i for i, match in enumerate(matches) if match is None]
+            if missing:
+                nearest = self._nearest_batch(gallery, [encodings[i] for i in missing])
+                for i, (indices, distances) in zip(missing, nearest):
+                    if len(indices) and distances[0] <= tolerance:
+                        matches[i] = (gallery.info(indices[0]), distances[0], False)
+        return matches
+    
+    def _nearest_batch(self, snapshot, encodings):
+        """Nearest gallery encoding for each encoding, batched with concurrent requests if enabled"""
+        if self.match_batcher is not None:
+            return self.match_batcher.nearest(snapshot, encodings)
+        return snapshot.nearest_batch(encodings)
+    
+    def search(self, encodings, k=5, scope=None):
+        """Top-k candidate persons for each 128-d encoding, without detection.
+        
+        Returns (results, gallery_version, shards); results holds one list per
+        encoding. scope optionally limits candidates to the given sites. shards
+        is the scatter-gather status in sharded mode, otherwise None.
+        """
+        encodings = np.asarray(encodings, dtype=np.float64)
+        if encodings.ndim == 1:
+            encodings = encodings[None, :]
+        if encodings.ndim != 2 or encodings.shape[1] != 128:
+            raise ValueError("每个人脸编码必须是128维向量")
+        if not np.all(np.isfinite(encodings)):
+            raise ValueError("人脸编码包含无效数值")
+        if k < 1:
+            raise ValueError("k 必须为正整数")
+        
+        if self.shard_client is not None:
+            results, shards = self.shard_client.search(encodings, k, scope)
+            return results, shards['versions'], shards
+        
+        if self.shared_gallery is not None:
+            # Pick up a generation published since the last match
+            self.sync_shared_gallery()
+        gallery = self.gallery
+        if scope:
+            gallery = gallery.scoped(scope)
+        tolerance = FACE_RECOGNITION_CONFIG['tolerance']
+        results = []
+        for encoding in encodings:
+            candidates = []
+            for index, distance in gallery.search(encoding, k):
+                candidate = gallery.info(index)
+                candidate['distance'] = distance
+                candidate['confidence'] = 1 - distance
+                candidate['match'] = distance <= tolerance
+                candidates.append(candidate)
+            results.append(candidates)
+        return results, gallery.version, None
+    
+    def _near_duplicate(self, encoding):
+        """(name, distance) of an enrolled near-duplicate of the encoding, or None"""
+        if self.shard_client is not None:
+            results, _, _ = self.search([encoding], 1)
+            if results[0] and results[0][0]['distance'] <= COMPACTION_CONFIG['duplicate_threshold']:
+                return results[0][0]['name'], results[0][0]['distance']
+            return None
+        if self.shared_gallery is not None:
+            self.sync_shared_gallery()
+        # One snapshot for both steps; a sync may swap self.gallery in between
+        gallery = self.gallery
+        duplicate = is_near_duplicate(encoding, gallery)
+        if duplicate is not None:
+            index, distance = duplicate
+            return gallery.info(index)['name'], distance
+        return None
     
     def add_new_person(self, image_path, person_info):
         """Add a new person and their face information"""
         try:
+            with self._db_lock:
+                active = self.db_manager.get_active_encoding_version()
+            if active is None:
+                return False, "读取编码设置版本失败"
+            # Enroll with the active encoding settings so the gallery stays on one version
+            encoding_version, settings = active
+            
             # Detect faces
-            face_locations, face_encodings = self.detect_faces_in_image(image_path)
+            face_locations, face_encodings, assessments = self._detect_and_encode(
+                image_path, profile=settings
+            )
+            skipped = [assessments[i]['reason'] for i, encoding in enumerate(face_encodings)
+                       if encoding is None]
+            face_encodings = [encoding for encoding in face_encodings if encoding is not None]
             
             if not face_encodings:
+                if skipped:
+                    return False, f"人脸质量不足（{SKIP_REASON_TEXT[skipped[0]]}），请换一张清晰的正脸照片"
                 return False, "未检测到人脸"
             
             if len(face_encodings) > 1:
                 return False, "图像中包含多个人脸，请上传只包含一个人脸的照片"
             
-            # Add person info to the database
-            person_id = self.db_manager.add_person(
-                name=person_info['name'],
-                age=person_info.get('age'),
-                gender=person_info.get('gender'),
-                phone=person_info.get('phone'),
-                email=person_info.get('email'),
-                address=person_info.get('address')
-            )
-            
-            if not person_id:
-                return False, "添加人员信息失败"
+            # A near-identical encoding means this face is already enrolled
+            duplicate = self._near_duplicate(face_encodings[0])
+            if duplicate is not None:
+                name, distance = duplicate
+                return False, f"该人脸与已登记人员 {name} 几乎相同（距离 {distance:.3f}）"
             
-            # Add face encoding
-            success = self.db_manager.add_face_encoding(
-                person_id, 
-                face_encodings[0], 
-                image_path
-            )
+            with self._db_lock:
+                # Add person info to the database
+                person_id = self.db_manager.add_person(
+                    name=person_info['name'],
+                    age=person_info.get('age'),
+                    gender=person_info.get('gender'),
+                    phone=person_info.get('phone'),
+                    email=person_info.get('email'),
+                    address=person_info.get('address'),
+                    site=person_info.get('site') or None
+                )
+                
+                if not person_id:
+                    return False, "添加人员信息失败"
+                
+                # Add face encoding
+                success = self.db_manager.add_face_encoding(
+                    person_id, 
+                    face_encodings[0], 
+                    image_path,
+                    encoding_version
+                )
             
             if success:
-                # Reload known faces
-                self.load_known_faces()
+                # Pick up the new encoding
+                self.sync_gallery_changes()
                 return True, f"成功添加人员: {person_info['name']}"
             else:
                 return False, "添加人脸编码失败"
@@ -157,6 +643,59 @@ class FaceDetector:
             print(f"Error adding new person: {e}")
             return False, f"添加失败: {str(e)}"
     
+    def enroll_unknown_cluster(self, cluster_id, person_info):
+        """Enroll a cluster of unknown faces as a new person in one step"""
+        try:
+            with self._db_lock:
+                active = self.db_manager.get_active_encoding_version()
+                if active is None:
+                    return False, "读取编码设置版本失败"
+                faces = self.db_manager.get_unknown_cluster_faces(cluster_id)
+            if not faces:
+                return False, "聚类不存在或没有人脸"
+            encoding_version, settings = active
+            
+            # A few well-spread encodings instead of every sighting; the rest
+            # stand in for any whose source image is gone
+            max_encodings = UNKNOWN_FACES_CONFIG['enroll_max_encodings']
+            chosen = representative_subset([face['face_encoding'] for face in faces], max_encodings)
+            candidates = chosen + [i for i in range(len(faces)) if i not in chosen]
+            
+            # The stored encodings were made with whatever profile recognized them;
+            # re-encode with the active settings so the rows really are that version
+            enrolled = []
+            for i in candidates:
+                if len(enrolled) >= max_encodings:
+                    break
+                encoding = self._reencode_unknown_face(faces[i], settings)
+                if encoding is not None:
+                    enrolled.append(dict(faces[i], face_encoding=encoding))
+            if not enrolled:
+                return False, "聚类人脸的原图均已不可用，无法按当前编码设置登记"
+            
+            with self._db_lock:
+                person_id = self.db_manager.enroll_unknown_cluster(
+                    cluster_id, person_info, enrolled, encoding_version
+                )
+            
+            if not person_id:
+                return False, "登记失败（聚类可能已被登记）"
+            
+            self.sync_gallery_changes()
+            return True, f"成功添加人员: {person_info['name']}（{len(enrolled)}个人脸编码）"
+        except Exception as e:
+            print(f"Error enrolling unknown cluster: {e}")
+            return False, f"登记失败: {str(e)}"
+    
+    def _reencode_unknown_face(self, face, settings):
+        """Encoding of a saved unknown face from its source image with settings, or None"""
+        if not face['image_path'] or not os.path.exists(face['image_path']):
+            return None
+        _, face_encodings, _ = self._detect_and_encode(
+            face['image_path'], profile=settings, face_locations=[face['face_location']]
+        )
+        return face_encodings[0] if face_encodings else None
+    
     def get_face_encoding_from_image(self, image_path):
         """Extract face encoding from an image"""
         try:
@@ -172,28 +711,13 @@ class FaceDetector:
         except Exception as e:
             return None, f"Error extracting face encoding: {str(e)}"
     
-    def draw_face_boxes(self, image_path, results, output_path=None):
-        """Draw face boxes and labels on an image"""
+    def draw_face_boxes(self, image_path, results, output_path=None, image=None):
+        """Draw face boxes and labels on an image (pass the decoded RGB array to skip loading)"""
         try:
             # Load image
-            image = cv2.imread(image_path)
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            for result in results:
-                if 'face_location' in result:
-                    top, right, bottom, left = result['face_location']
-                    
-                    # Draw face box
-                    color = (0, 255, 0) if result['name'] != '未知' else (0, 0, 255)
-                    cv2.rectangle(image_rgb, (left, top), (right, bottom), color, 2)
-                    
-                    # Add label
-                    label = f"{result['name']}"
-                    if 'confidence' in result and result['confidence'] > 0:
-                        label += f" ({result['confidence']:.2f})"
-                    
-                    cv2.putText(image_rgb, label, (left, top - 10), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+            if image is None:
+                image = self.load_image(image_path)
+            image_rgb = draw_results(image.copy(), results)
             
             if output_path:
                 cv2.imwrite(output_path, cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR))
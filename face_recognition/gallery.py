@@ -0,0 +1,439 @@
+# Immutable in-memory gallery snapshots
+import numpy as np
+from config import GALLERY_CONFIG
+
+_ENCODING_DIM = 128
+
+
+def person_info_from_row(row):
+    """Person info dict from a DatabaseManager.get_all_face_encodings row"""
+    return {
+        'person_id': row['person_id'],
+        'name': row['name'],
+        'age': row['age'],
+        'gender': row['gender'],
+        'phone': row['phone'],
+        'email': row['email'],
+        'address': row['address'],
+        'site': row.get('site')
+    }
+
+
+def _readonly(array):
+    array.setflags(write=False)
+    return array
+
+
+def _exact_dtype():
+    # Quantized galleries only touch exact vectors for re-ranking, so float32 is enough
+    return np.float64 if GALLERY_CONFIG['quantization'] is None else np.float32
+
+
+class QuantizedEncodings:
+    """Compact copy of the encoding matrix for the approximate first-pass scan"""
+
+    def __init__(self, encodings, mode):
+        self.mode = mode
+        encodings = np.asarray(encodings, dtype=np.float32)
+        if mode == 'int8':
+            # Symmetric per-dimension scale
+            self.scale = np.maximum(np.abs(encodings).max(axis=0), 1e-12) / 127.0
+            self.codes = np.round(encodings / self.scale).astype(np.int8)
+        elif mode == 'float16':
+            self.scale = np.ones(encodings.shape[1], dtype=np.float32)
+            self.codes = encodings.astype(np.float16)
+        else:
+            raise ValueError(f"Unknown quantization: {mode}")
+        self.scale = self.scale.astype(np.float32)
+        # Squared norms of the dequantized rows, for |q - x|^2 = |q|^2 + |x|^2 - 2 q.x
+        self.norms = self._norms(self.codes)
+
+    def _norms(self, codes):
+        """Squared norms of dequantized codes, computed block by block"""
+        norms = np.empty(len(codes), dtype=np.float32)
+        for start, block in self._blocks(codes):
+            norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+        return norms
+
+    def _blocks(self, codes=None):
+        """Dequantized float32 blocks of the matrix, bounding temporary memory"""
+        codes = self.codes if codes is None else codes
+        block_size = GALLERY_CONFIG['scan_block_size']
+        for start in range(0, len(codes), block_size):
+            yield start, codes[start:start + block_size].astype(np.float32) * self.scale
+
+    def _with_codes(self, codes, norms):
+        """Quantized matrix of other rows in this one's mode and scale"""
+        view = object.__new__(QuantizedEncodings)
+        view.mode = self.mode
+        view.scale = self.scale
+        view.codes = codes
+        view.norms = norms
+        return view
+
+    def updated(self, keep, encodings):
+        """Copy with only the rows selected by keep, plus encodings quantized in
+        this matrix's scale appended; existing rows are not quantized again.
+
+        Returns None if an int8 code of the new rows would overflow this scale,
+        in which case the whole matrix has to be quantized afresh.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.codes.shape[1])
+        if self.mode == 'int8':
+            scaled = np.round(encodings / self.scale)
+            if np.any(np.abs(scaled) > 127):
+                return None
+            codes = scaled.astype(np.int8)
+        else:
+            codes = encodings.astype(np.float16)
+        return self._with_codes(np.concatenate([self.codes[keep], codes]),
+                                np.concatenate([self.norms[keep], self._norms(codes)]))
+
+    def take(self, order):
+        """Copy with the rows in the given order"""
+        return self._with_codes(self.codes[order], self.norms[order])
+
+    def approximate_distances(self, encodings):
+        """Approximate squared distances, shape (len(encodings), gallery size)"""
+        queries = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        distances = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        for start, block in self._blocks():
+            end = start + len(block)
+            distances[:, start:end] = (query_norms[:, None] + self.norms[None, start:end]
+                                       - 2.0 * queries @ block.T)
+        return distances
+
+    def rows(self, start, end):
+        """Quantized view of a contiguous row range, sharing this one's memory"""
+        return self._with_codes(self.codes[start:end], self.norms[start:end])
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.norms.nbytes + self.scale.nbytes
+
+
+def _site_key(info):
+    return info.get('site') or ''
+
+
+def sort_rows_by_site(rows):
+    """Rows in partition order, so a snapshot built from them needs no reordering"""
+    return sorted(rows, key=_site_key)
+
+
+_PERSON_FIELDS = ('name', 'age', 'gender', 'phone', 'email', 'address', 'site')
+
+
+class PersonTable:
+    """Person info held once per person, column by column.
+
+    Gallery rows point into it by position, so a person with many encodings
+    costs one int32 per encoding; info dicts are only built for the rows a
+    request actually returns.
+    """
+
+    __slots__ = ('ids', 'columns', 'sites', 'site_ranks')
+
+    def __init__(self, infos):
+        """infos: one person info dict per person, in ascending person_id order"""
+        self.ids = np.array([info['person_id'] for info in infos], dtype=np.int64)
+        self.columns = {field: [info.get(field) for info in infos] for field in _PERSON_FIELDS}
+        keys = [_site_key(info) for info in infos]
+        # Partition order: rows are grouped by rank of their person's site
+        self.sites = sorted(set(keys))
+        ranks = {site: rank for rank, site in enumerate(self.sites)}
+        self.site_ranks = np.array([ranks[key] for key in keys], dtype=np.int32)
+
+    def info(self, position):
+        """Person info dict of the person at a table position"""
+        info = {'person_id': int(self.ids[position])}
+        for field, column in self.columns.items():
+            info[field] = column[position]
+        return info
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class GallerySnapshot:
+    """A consistent, never-mutated version of the known-face gallery.
+
+    Readers grab a reference once and match against it; writers build a new
+    snapshot off to the side and swap the reference.
+
+    Rows are kept grouped by site, so each partition is a contiguous slice and
+    partition views share the snapshot's arrays instead of copying them.
+    Person info lives in a PersonTable; person_index maps each row to it.
+    """
+
+    __slots__ = ('version', 'encodings', 'encoding_ids', 'person_index', 'persons', 'quantized',
+                 'partitions', '_scoped', '_norms')
+
+    def __init__(self, version, encodings, encoding_ids, person_index, persons, quantized=None):
+        """quantized: QuantizedEncodings of the same rows to reuse, instead of
+        quantizing encodings again (when quantization is enabled)"""
+        person_index = np.asarray(person_index, dtype=np.int32)
+        ranks = persons.site_ranks[person_index]
+        if len(ranks) > 1 and np.any(ranks[1:] < ranks[:-1]):
+            order = np.argsort(ranks, kind='stable')
+            encodings, encoding_ids, person_index = encodings[order], encoding_ids[order], person_index[order]
+            ranks = ranks[order]
+            if quantized is not None:
+                quantized = quantized.take(order)
+
+        self.version = version
+        self.encodings = _readonly(encodings)
+        self.encoding_ids = _readonly(encoding_ids)
+        self.person_index = _readonly(person_index)
+        self.persons = persons
+        self.quantized = None
+        if GALLERY_CONFIG['quantization'] and len(encoding_ids):
+            if quantized is None or quantized.mode != GALLERY_CONFIG['quantization']:
+                quantized = QuantizedEncodings(encodings, GALLERY_CONFIG['quantization'])
+            self.quantized = quantized
+
+        self.partitions = {}
+        self._scoped = {}
+        self._norms = None
+        if len(ranks):
+            starts = np.flatnonzero(np.r_[True, ranks[1:] != ranks[:-1]])
+            ends = np.r_[starts[1:], len(ranks)]
+            for start, end in zip(starts, ends):
+                site = persons.sites[ranks[start]]
+                if site:
+                    self.partitions[site] = self._rows(start, end)
+
+    def _rows(self, start, end):
+        """Single-partition snapshot viewing a contiguous row range of this one"""
+        view = object.__new__(GallerySnapshot)
+        view.version = self.version
+        view.encodings = self.encodings[start:end]
+        view.encoding_ids = self.encoding_ids[start:end]
+        view.person_index = self.person_index[start:end]
+        view.persons = self.persons
+        view.quantized = self.quantized.rows(start, end) if self.quantized is not None else None
+        view.partitions = {}
+        view._scoped = {}
+        view._norms = None
+        return view
+
+    def scoped(self, sites):
+        """Snapshot holding only the given sites' persons; unknown sites are empty"""
+        key = frozenset(sites)
+        scoped = self._scoped.get(key)
+        if scoped is None:
+            parts = [self.partitions[site] for site in sorted(key) if site in self.partitions]
+            if len(parts) == 1:
+                scoped = parts[0]
+            elif not parts:
+                scoped = GallerySnapshot.empty(self.version)
+            else:
+                scoped = GallerySnapshot(self.version,
+                                         np.concatenate([p.encodings for p in parts]),
+                                         np.concatenate([p.encoding_ids for p in parts]),
+                                         np.concatenate([p.person_index for p in parts]),
+                                         self.persons)
+            # Derived data of an immutable snapshot; a racing duplicate build is harmless.
+            # Bounded because scopes come from clients.
+            if len(self._scoped) < 64:
+                self._scoped[key] = scoped
+        return scoped
+
+    @classmethod
+    def empty(cls, version=0):
+        return cls(version,
+                   np.empty((0, _ENCODING_DIM), dtype=_exact_dtype()),
+                   np.empty((0,), dtype=np.int64),
+                   np.empty((0,), dtype=np.int32),
+                   PersonTable([]))
+
+    @classmethod
+    def from_rows(cls, version, rows):
+        """Build a snapshot from DatabaseManager.get_all_face_encodings rows"""
+        if not rows:
+            return cls.empty(version)
+        rows = sort_rows_by_site(rows)
+        return cls.from_arrays(version,
+                               np.array([row['face_encoding'] for row in rows], dtype=_exact_dtype()),
+                               np.array([row['encoding_id'] for row in rows], dtype=np.int64),
+                               np.array([row['person_id'] for row in rows], dtype=np.int64),
+                               {row['person_id']: person_info_from_row(row) for row in rows})
+
+    @classmethod
+    def from_arrays(cls, version, encodings, encoding_ids, person_ids, persons, quantized=None):
+        """Build a snapshot from per-row arrays and a person_id -> info mapping
+        (e.g. DatabaseManager.load_gallery_arrays output) without copying the
+        encodings; each person's info is stored once"""
+        unique_ids, person_index = np.unique(np.asarray(person_ids, dtype=np.int64),
+                                             return_inverse=True)
+        table = PersonTable([persons[person_id] for person_id in unique_ids.tolist()])
+        return cls(version, encodings, np.asarray(encoding_ids, dtype=np.int64),
+                   person_index, table, quantized)
+
+    @staticmethod
+    def encoding_dtype():
+        """dtype snapshots store exact encodings in, to load straight into"""
+        return _exact_dtype()
+
+    def with_delta(self, version, delta):
+        """New snapshot with a change_feed.GalleryDelta applied; self is left untouched.
+
+        Kept rows reuse their quantized codes; only added rows are quantized.
+        """
+        added_ids = [row['encoding_id'] for row in delta.added_rows]
+        removed_persons = np.isin(self.persons.ids, list(delta.removed_person_ids))
+        keep = ~removed_persons[self.person_index]
+        keep &= ~np.isin(self.encoding_ids, list(delta.removed_encoding_ids) + added_ids)
+        kept = np.flatnonzero(keep)
+
+        persons = {}
+        for position in np.unique(self.person_index[kept]).tolist():
+            persons[int(self.persons.ids[position])] = self.persons.info(position)
+        for row in delta.added_rows:
+            persons[row['person_id']] = person_info_from_row(row)
+        persons.update(delta.updated_persons)
+
+        added_encodings = np.array([row['face_encoding'] for row in delta.added_rows],
+                                   dtype=_exact_dtype()).reshape(-1, _ENCODING_DIM)
+        quantized = None
+        if self.quantized is not None:
+            quantized = self.quantized.updated(keep, added_encodings)
+        return GallerySnapshot.from_arrays(
+            version,
+            np.concatenate([self.encodings[kept], added_encodings]),
+            np.concatenate([self.encoding_ids[kept], np.array(added_ids, dtype=np.int64)]),
+            np.concatenate([self.persons.ids[self.person_index[kept]],
+                            np.array([row['person_id'] for row in delta.added_rows], dtype=np.int64)]),
+            persons,
+            quantized
+        )
+
+    def info(self, index):
+        """Person info dict for one gallery row, built on demand"""
+        return self.persons.info(self.person_index[index])
+
+    @property
+    def person_ids(self):
+        """Person id of every row, computed from person_index"""
+        return self.persons.ids[self.person_index]
+
+    def nearest(self, encoding, k=1, exact=False):
+        """Indices and exact distances of the k nearest encodings, closest first.
+
+        With quantization enabled the whole gallery is scanned in compact form and
+        only the best rerank_candidates rows are re-ranked on exact vectors.
+        """
+        count = len(self)
+        k = min(k, count)
+        if k == 0:
+            return np.empty((0,), dtype=np.int64), np.empty((0,), dtype=np.float64)
+
+        encoding = np.asarray(encoding, dtype=np.float64)
+        if self.quantized is None or exact:
+            distances = np.linalg.norm(self.encodings - encoding, axis=1)
+            candidates = np.argpartition(distances, k - 1)[:k] if k < count else np.arange(count)
+            distances = distances[candidates]
+        else:
+            approximate = self.quantized.approximate_distances(encoding)[0]
+            shortlist = min(count, max(k, GALLERY_CONFIG['rerank_candidates']))
+            candidates = (np.argpartition(approximate, shortlist - 1)[:shortlist]
+                          if shortlist < count else np.arange(count))
+            distances = np.linalg.norm(self.encodings[candidates] - encoding, axis=1)
+
+        order = np.argsort(distances)[:k]
+        return candidates[order], distances[order]
+
+    def _scan_blocks(self):
+        """(start, float32 block, squared norms) over the whole gallery, compact form if quantized"""
+        if self.quantized is not None:
+            for start, block in self.quantized._blocks():
+                yield start, block, self.quantized.norms[start:start + len(block)]
+            return
+        if self._norms is None:
+            # Derived data of an immutable snapshot; computed once on first batch
+            self._norms = np.einsum('ij,ij->i', self.encodings, self.encodings).astype(np.float32)
+        block_size = GALLERY_CONFIG['scan_block_size']
+        for start in range(0, len(self), block_size):
+            block = self.encodings[start:start + block_size].astype(np.float32)
+            yield start, block, self._norms[start:start + len(block)]
+
+    def nearest_batch(self, encodings, k=1):
+        """nearest() for many encodings at once, as a list of (indices, distances).
+
+        Each gallery block is compared with all queries in one matrix-matrix
+        product; the per-query shortlists are then re-ranked on exact vectors.
+        """
+        queries = np.atleast_2d(np.asarray(encodings, dtype=np.float64))
+        count = len(self)
+        k = min(k, count)
+        if k == 0 or not len(queries):
+            return [(np.empty((0,), dtype=np.int64), np.empty((0,), dtype=np.float64))
+                    for _ in range(len(queries))]
+
+        shortlist = min(count, max(k, GALLERY_CONFIG['rerank_candidates']))
+        compact = queries.astype(np.float32)
+        query_norms = np.einsum('ij,ij->i', compact, compact)
+        best = None
+        for start, block, norms in self._scan_blocks():
+            squared = query_norms[:, None] + norms[None, :] - 2.0 * compact @ block.T
+            take = min(shortlist, squared.shape[1])
+            part = np.argpartition(squared, take - 1, axis=1)[:, :take]
+            block_d, block_i = np.take_along_axis(squared, part, axis=1), part + start
+            if best is None:
+                best = (block_d, block_i)
+                continue
+            # Merge with the shortlist from earlier blocks
+            merged_d = np.concatenate([best[0], block_d], axis=1)
+            merged_i = np.concatenate([best[1], block_i], axis=1)
+            if merged_d.shape[1] > shortlist:
+                keep = np.argpartition(merged_d, shortlist - 1, axis=1)[:, :shortlist]
+                merged_d = np.take_along_axis(merged_d, keep, axis=1)
+                merged_i = np.take_along_axis(merged_i, keep, axis=1)
+            best = (merged_d, merged_i)
+
+        results = []
+        for query, indices in zip(queries, best[1]):
+            distances = np.linalg.norm(self.encodings[indices] - query, axis=1)
+            order = np.argsort(distances)[:k]
+            results.append((indices[order], distances[order]))
+        return results
+
+    def search(self, encoding, k=5):
+        """Top-k persons for one encoding as (encoding index, distance) pairs, one per
+        person at that person's closest encoding, closest first"""
+        count = len(self)
+        if k < 1:
+            return []
+        shortlist = min(count, k * 4)
+        while True:
+            indices, distances = self.nearest(encoding, shortlist)
+            hits = []
+            seen = set()
+            for index, distance in zip(indices, distances):
+                person_id = self.person_index[index]
+                if person_id not in seen:
+                    seen.add(person_id)
+                    hits.append((int(index), float(distance)))
+                    if len(hits) == k:
+                        return hits
+            if shortlist >= count:
+                return hits
+            # Persons with many encodings crowded the shortlist; widen it
+            shortlist = min(count, shortlist * 4)
+
+    @property
+    def names(self):
+        names = self.persons.columns['name']
+        return [names[position] for position in self.person_index.tolist()]
+
+    @property
+    def nbytes(self):
+        """Bytes held by the matching arrays (excluding per-person info)"""
+        total = self.encodings.nbytes + self.encoding_ids.nbytes + self.person_index.nbytes
+        if self.quantized is not None:
+            total += self.quantized.nbytes
+        return total
+
+    def __len__(self):
+        return len(self.encoding_ids)
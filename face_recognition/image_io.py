@@ -0,0 +1,178 @@
+# Image decoding, rendering and encoding helpers
+import math
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+_IMAGE_FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 'image/jpeg'),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 'image/webp')
+}
+
+
+class LRUCache:
+    """Small thread-safe LRU cache"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+def load_thumbnail(image_path, max_width, max_height):
+    """Decode an image straight to preview size.
+
+    For JPEGs, draft mode lets the decoder downscale in the DCT domain, so a
+    20 MP photo never materializes at full resolution.
+    """
+    image = Image.open(image_path)
+    image.draft('RGB', (max_width, max_height))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGB') if image.mode not in ('RGB', 'RGBA', 'L') else image
+    image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+    return image
+
+
+def decode_image(image_path, max_size=None):
+    """Decode an image file to an RGB array, upright per its EXIF orientation.
+
+    With max_size, JPEGs are decoded in the DCT domain at the smallest 1/2^n
+    scale whose longest side still reaches max_size, then resized down to it,
+    so a 12 MP photo never materializes at full resolution. Returns
+    (array, scale, (height, width)), where scale maps original pixels to
+    array pixels and the size is the upright original's.
+    """
+    with Image.open(image_path) as image:
+        width, height = image.size
+        if max_size and max(width, height) > max_size:
+            ratio = max_size / max(width, height)
+            image.draft('RGB', (math.ceil(width * ratio), math.ceil(height * ratio)))
+        upright = ImageOps.exif_transpose(image)
+        if upright.size != image.size:
+            # Rotated by 90 degrees
+            width, height = height, width
+        array = np.array(upright.convert('RGB'))
+    array, _ = fit_within(array, max_size)
+    return array, array.shape[1] / width, (height, width)
+
+
+def fit_within(image, max_size):
+    """Downscale an array so its longest side is at most max_size; returns (image, scale)"""
+    height, width = image.shape[:2]
+    if not max_size or max(height, width) <= max_size:
+        return image, 1.0
+    scale = max_size / max(height, width)
+    resized = cv2.resize(image, (int(width * scale), int(height * scale)),
+                         interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+
+def scale_location(location, scale):
+    """Scale a (top, right, bottom, left) box"""
+    return tuple(int(round(v * scale)) for v in location)
+
+
+def validate_face_locations(locations):
+    """Check caller-supplied (top, right, bottom, left) boxes; returns int tuples or raises ValueError"""
+    if not isinstance(locations, (list, tuple)):
+        raise ValueError("face_locations must be a list of [top, right, bottom, left] boxes")
+    boxes = []
+    for location in locations:
+        if not isinstance(location, (list, tuple)) or len(location) != 4:
+            raise ValueError(f"Invalid face box: {location!r}")
+        try:
+            top, right, bottom, left = (int(round(float(v))) for v in location)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid face box: {location!r}")
+        if bottom <= top or right <= left:
+            raise ValueError(f"Empty face box: {location!r}")
+        boxes.append((top, right, bottom, left))
+    return boxes
+
+
+def clamp_face_locations(locations, height, width, min_size=1):
+    """Clip boxes to the image and drop those left smaller than min_size pixels"""
+    boxes = []
+    for top, right, bottom, left in locations:
+        top, bottom = max(0, top), min(height, bottom)
+        left, right = max(0, left), min(width, right)
+        if bottom - top >= min_size and right - left >= min_size:
+            boxes.append((top, right, bottom, left))
+    return boxes
+
+
+def crop_face(image, location, margin=0.5):
+    """(crop, box within the crop) around a face, with margin * box height of
+    context on each side for landmarking"""
+    height, width = image.shape[:2]
+    top, right, bottom, left = location
+    pad = int((bottom - top) * margin)
+    crop_top, crop_left = max(0, top - pad), max(0, left - pad)
+    crop = image[crop_top:min(height, bottom + pad), crop_left:min(width, right + pad)]
+    return (np.ascontiguousarray(crop),
+            (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left))
+
+
+def draw_results(image_rgb, results, scale=1.0):
+    """Draw face boxes and labels in place on an RGB array"""
+    for result in results:
+        if 'face_location' in result:
+            top, right, bottom, left = scale_location(result['face_location'], scale)
+
+            # Draw face box
+            color = (0, 255, 0) if result['name'] != '未知' else (0, 0, 255)
+            if result.get('skipped'):
+                # Not encoded by the quality gate
+                color = (160, 160, 160)
+            cv2.rectangle(image_rgb, (left, top), (right, bottom), color, 2)
+
+            # Add label
+            label = f"{result['name']}"
+            if result.get('skipped'):
+                label = result['skip_reason']
+            elif 'confidence' in result and result['confidence'] > 0:
+                label += f" ({result['confidence']:.2f})"
+
+            cv2.putText(image_rgb, label, (left, top - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return image_rgb
+
+
+def render_annotated(image_rgb, results, image_format='jpeg', quality=85, max_size=1280,
+                     image_scale=1.0):
+    """Downscale, annotate and compress an already-decoded RGB image.
+
+    image_scale is the array's size relative to the original the result
+    locations refer to (as returned by decode_image). Returns (bytes, mimetype).
+    The source array is not modified.
+    """
+    extension, quality_flag, mimetype = _IMAGE_FORMATS[image_format]
+
+    # Drawing after the resize keeps labels legible and touches fewer pixels
+    canvas, scale = fit_within(image_rgb, max_size)
+    if canvas is image_rgb:
+        canvas = image_rgb.copy()
+
+    draw_results(canvas, results, scale * image_scale)
+
+    ok, buffer = cv2.imencode(extension, cv2.cvtColor(canvas, cv2.COLOR_RGB2BGR),
+                              [quality_flag, int(quality)])
+    if not ok:
+        raise ValueError(f"Could not encode image as {image_format}")
+    return buffer.tobytes(), mimetype
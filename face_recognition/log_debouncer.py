@@ -0,0 +1,137 @@
+# Debounced recognition logging
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import RECOGNITION_LOG_CONFIG
+
+
+class _Sighting:
+    """One pending merged log record"""
+
+    __slots__ = ('person_id', 'source', 'first_seen', 'last_seen', 'hits', 'confidence', 'image_path')
+
+    def __init__(self, person_id, source, now, confidence, image_path):
+        self.person_id = person_id
+        self.source = source
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.confidence = confidence
+        self.image_path = image_path
+
+    def record(self):
+        """Row for DatabaseManager.add_recognition_logs"""
+        return (self.person_id, float(self.confidence), self.image_path, self.source,
+                datetime.fromtimestamp(self.first_seen), datetime.fromtimestamp(self.last_seen),
+                self.hits)
+
+
+class RecognitionLogDebouncer:
+    """Merges repeat sightings of a person from one source into one log record.
+
+    The first sighting opens a record; further sightings within window seconds
+    of it only move its last-seen time, count the hit and keep the best
+    confidence (with that sighting's image). Records are written in batches by
+    a background thread once their window expires. At most max_pending records
+    are held open; beyond that the oldest are closed and written early.
+
+    db_manager must be a connection owned by the debouncer.
+    """
+
+    def __init__(self, db_manager, window=None, max_pending=None):
+        self.db_manager = db_manager
+        self.window = window or RECOGNITION_LOG_CONFIG['window']
+        self.max_pending = max_pending or RECOGNITION_LOG_CONFIG['max_pending']
+        self.sightings = 0
+        self.written = 0
+        self.dropped = 0
+        # (person_id, source) -> _Sighting, oldest first; new keys always go to the end
+        self._pending = OrderedDict()
+        # Closed records waiting for the writer
+        self._ready = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+        atexit.register(self.flush)
+
+    def record(self, person_id, confidence, image_path, source=None):
+        """Note one recognition; written to recognition_logs later, merged"""
+        now = time.time()
+        key = (person_id, source)
+        with self._cond:
+            self.sightings += 1
+            sighting = self._pending.get(key)
+            if sighting is not None and now - sighting.first_seen < self.window:
+                sighting.last_seen = now
+                sighting.hits += 1
+                if confidence > sighting.confidence:
+                    sighting.confidence = confidence
+                    sighting.image_path = image_path
+                return
+
+            if sighting is not None:
+                # Window over but the writer has not got to it yet
+                self._ready.append(self._pending.pop(key))
+            self._pending[key] = _Sighting(person_id, source, now, confidence, image_path)
+            if len(self._pending) > self.max_pending:
+                self._ready.append(self._pending.popitem(last=False)[1])
+            if len(self._ready) > self.max_pending:
+                # The database is not keeping up; shed the oldest rather than grow
+                excess = len(self._ready) - self.max_pending
+                del self._ready[:excess]
+                self.dropped += excess
+            # Wake the writer for closed records, or to time the first open one
+            if self._ready or len(self._pending) == 1:
+                self._cond.notify()
+
+    def _close_expired(self, now):
+        while self._pending:
+            sighting = next(iter(self._pending.values()))
+            if now - sighting.first_seen < self.window:
+                break
+            self._ready.append(self._pending.popitem(last=False)[1])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    self._close_expired(now)
+                    if self._ready:
+                        break
+                    timeout = None
+                    if self._pending:
+                        oldest = next(iter(self._pending.values()))
+                        timeout = oldest.first_seen + self.window - now
+                    self._cond.wait(timeout)
+                batch, self._ready = self._ready, []
+            self._write(batch)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        with self._write_lock:
+            if self.db_manager.add_recognition_logs([sighting.record() for sighting in batch]):
+                self.written += len(batch)
+            else:
+                self.dropped += len(batch)
+
+    def flush(self):
+        """Close and write every open record now (e.g. on shutdown)"""
+        with self._cond:
+            self._ready.extend(self._pending.values())
+            self._pending.clear()
+            batch, self._ready = self._ready, []
+        self._write(batch)
+
+    def status(self):
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'sightings': self.sightings,
+                'written': self.written,
+                'dropped': self.dropped,
+                'window': self.window
+            }
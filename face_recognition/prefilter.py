@@ -0,0 +1,75 @@
+# Cheap OpenCV pre-filter run before the dlib detector
+import threading
+import cv2
+from config import FACE_RECOGNITION_CONFIG
+
+_local = threading.local()
+
+
+def _cascade():
+    """Per-thread Haar cascade (CascadeClassifier is not safe to share across threads)"""
+    cascade = getattr(_local, 'cascade', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        _local.cascade = cascade
+    return cascade
+
+
+def _merge_regions(regions):
+    """Union overlapping (top, right, bottom, left) boxes so crops never overlap"""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        while merged:
+            top, right, bottom, left = merged.pop()
+            i = 0
+            while i < len(merged):
+                t, r, b, l = merged[i]
+                if l <= right and r >= left and t <= bottom and b >= top:
+                    top, right, bottom, left = min(top, t), max(right, r), max(bottom, b), min(left, l)
+                    merged.pop(i)
+                    changed = True
+                else:
+                    i += 1
+            result.append((top, right, bottom, left))
+        merged = result
+    return merged
+
+
+def propose_face_regions(image):
+    """Candidate face regions in full-image (top, right, bottom, left) coordinates.
+
+    Runs a Haar cascade on a small grayscale copy. An empty list means the
+    image very likely has no faces.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, FACE_RECOGNITION_CONFIG['prefilter_scan_size'] / max(height, width))
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)),
+                          interpolation=cv2.INTER_AREA)
+    gray = cv2.equalizeHist(gray)
+
+    detections = _cascade().detectMultiScale(
+        gray,
+        scaleFactor=1.1,
+        minNeighbors=FACE_RECOGNITION_CONFIG['prefilter_min_neighbors'],
+        minSize=(20, 20)
+    )
+
+    margin = FACE_RECOGNITION_CONFIG['prefilter_margin']
+    regions = []
+    for x, y, w, h in detections:
+        # Expand generously: dlib boxes differ from Haar boxes and need context
+        pad_x, pad_y = w * margin, h * margin
+        regions.append((
+            max(0, int((y - pad_y) / scale)),
+            min(width, int((x + w + pad_x) / scale)),
+            min(height, int((y + h + pad_y) / scale)),
+            max(0, int((x - pad_x) / scale))
+        ))
+    return _merge_regions(regions)
@@ -0,0 +1,17 @@
+# Named speed/accuracy profiles for the detection pipeline
+from config import FACE_RECOGNITION_CONFIG, DETECTION_PROFILES
+
+
+def get_profile(name=None):
+    """Settings for a named profile (the configured default when name is empty);
+    a settings dict, such as a stored encoding version's, is returned as is"""
+    if isinstance(name, dict):
+        return name
+    name = name or FACE_RECOGNITION_CONFIG['default_profile']
+    if name not in DETECTION_PROFILES:
+        raise ValueError(f"Unknown profile: {name}")
+    return DETECTION_PROFILES[name]
+
+
+def profile_names():
+    return list(DETECTION_PROFILES)
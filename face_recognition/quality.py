@@ -0,0 +1,93 @@
+# Face quality gate run between detection and encoding
+import cv2
+import numpy as np
+from config import QUALITY_CONFIG
+
+# Skip reasons reported in results
+TOO_SMALL = 'too_small'
+BLURRY = 'blurry'
+EXTREME_POSE = 'extreme_pose'
+
+SKIP_REASON_TEXT = {
+    TOO_SMALL: '人脸过小',
+    BLURRY: '图像模糊',
+    EXTREME_POSE: '侧脸角度过大'
+}
+
+
+def sharpness(image, location):
+    """Variance of the Laplacian over a face box; low values mean blur.
+
+    Boxes larger than sharpness_size are downscaled first so the score does
+    not grow with face size.
+    """
+    top, right, bottom, left = location
+    crop = image[max(0, top):bottom, max(0, left):right]
+    if crop.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(np.ascontiguousarray(crop), cv2.COLOR_RGB2GRAY)
+    size = QUALITY_CONFIG['sharpness_size']
+    if max(gray.shape) > size:
+        factor = size / max(gray.shape)
+        gray = cv2.resize(gray, (max(1, round(gray.shape[1] * factor)),
+                                 max(1, round(gray.shape[0] * factor))),
+                          interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def yaw_ratio(landmarks):
+    """Horizontal offset of the nose tip from the eye midpoint, in eye distances.
+
+    About 0 for a frontal face, growing with head turn (roughly tan(yaw) / 2).
+    None if the landmarks lack eyes or nose.
+    """
+    try:
+        left_eye = np.mean(landmarks['left_eye'], axis=0)
+        right_eye = np.mean(landmarks['right_eye'], axis=0)
+        nose = np.mean(landmarks['nose_tip'], axis=0)
+    except (KeyError, ValueError):
+        return None
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    if eye_distance < 1e-6:
+        return None
+    return float(abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance)
+
+
+def assess_faces(image, locations, scale, face_landmarks):
+    """Quality of each face box in a working image, cheapest checks first.
+
+    scale is working pixels per original pixel, so sizes are judged in the
+    original image. face_landmarks(image, locations) returns landmark dicts;
+    it only runs on boxes that pass the size and sharpness checks. Returns one
+    dict per box with 'size', 'sharpness', 'yaw' and 'reason' (None if the
+    face passes, otherwise a skip reason).
+    """
+    assessments = []
+    for location in locations:
+        top, right, bottom, left = location
+        assessment = {
+            'size': round(min(bottom - top, right - left) / scale, 1),
+            'sharpness': None,
+            'yaw': None,
+            'reason': None
+        }
+        if assessment['size'] < QUALITY_CONFIG['min_face_size']:
+            assessment['reason'] = TOO_SMALL
+        else:
+            assessment['sharpness'] = round(sharpness(image, location), 1)
+            if assessment['sharpness'] < QUALITY_CONFIG['min_sharpness']:
+                assessment['reason'] = BLURRY
+        assessments.append(assessment)
+
+    if QUALITY_CONFIG['max_yaw_ratio'] is not None:
+        pending = [i for i, assessment in enumerate(assessments) if assessment['reason'] is None]
+        if pending:
+            landmarks = face_landmarks(image, [locations[i] for i in pending])
+            for i, marks in zip(pending, landmarks):
+                ratio = yaw_ratio(marks)
+                if ratio is None:
+                    continue
+                assessments[i]['yaw'] = round(ratio, 2)
+                if ratio > QUALITY_CONFIG['max_yaw_ratio']:
+                    assessments[i]['reason'] = EXTREME_POSE
+    return assessments
@@ -0,0 +1,128 @@
+# Scatter-gather matching across gallery shard nodes (see matcher_node.py)
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import requests
+from config import SHARDING_CONFIG, FACE_RECOGNITION_CONFIG
+
+_local = threading.local()
+
+
+def shard_of(person_id, shard_count):
+    """Shard index owning a person (multiplicative hash, so strided IDs still spread)"""
+    return (int(person_id) * 2654435761 & 0xFFFFFFFF) % shard_count
+
+
+def _session():
+    # One keep-alive session per thread; sessions are not safe to share
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+class ShardClient:
+    """Fans queries out to every shard node concurrently and merges the answers.
+
+    Persons never span shards, so a global top-k is the k best of the per-shard
+    top-k lists. Shards that fail or miss the timeout are left out and reported.
+    """
+
+    def __init__(self, nodes=None, timeout=None):
+        self.nodes = list(nodes or SHARDING_CONFIG['nodes'])
+        self.timeout = timeout or SHARDING_CONFIG['timeout']
+        self._executor = ThreadPoolExecutor(max_workers=len(self.nodes) * 4)
+
+    def _post(self, node, path, payload, sent):
+        sent[node] = time.monotonic()
+        response = _session().post(node + path, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _gather(self, path, payload):
+        """({node: response}, status) from all nodes within the timeout"""
+        sent = {}
+        futures = {self._executor.submit(self._post, node, path, payload, sent): node
+                   for node in self.nodes}
+        # The request timeout bounds each call; this guards against a stuck call.
+        # A call's time counts from when a pool thread sends it, not while it
+        # waits for a thread behind other requests' calls.
+        limit = self.timeout * 2
+        pending = set(futures)
+        timed_out = set()
+        while pending:
+            started = [sent[futures[future]] for future in pending if futures[future] in sent]
+            wait_for = max(0.0, min(started) + limit - time.monotonic()) if started else limit
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                now = time.monotonic()
+                expired = {future for future in pending
+                           if futures[future] in sent and now - sent[futures[future]] >= limit}
+                timed_out |= expired
+                pending -= expired
+        responses = {}
+        failed = []
+        for future, node in futures.items():
+            if future in timed_out:
+                failed.append({'node': node, 'error': 'timeout'})
+                continue
+            try:
+                responses[node] = future.result()
+            except Exception as e:
+                failed.append({'node': node, 'error': str(e)})
+        status = {
+            'total': len(self.nodes),
+            'responded': len(responses),
+            'partial': bool(failed),
+            'failed': failed,
+            'versions': {node: response.get('gallery_version') for node, response in responses.items()}
+        }
+        return responses, status
+
+    def search(self, encodings, k=5, scope=None):
+        """Merged top-k candidates per encoding, plus shard status"""
+        payload = {'encodings': np.asarray(encodings, dtype=np.float64).tolist(), 'k': k}
+        if scope:
+            payload['scope'] = list(scope)
+        responses, status = self._gather('/match', payload)
+
+        results = []
+        for i in range(len(payload['encodings'])):
+            candidates = []
+            for response in responses.values():
+                candidates.extend(response['results'][i])
+            candidates.sort(key=lambda candidate: candidate['distance'])
+            results.append(candidates[:k])
+        return results, status
+
+    def match(self, encodings, scope=None, fallback=False):
+        """Best match within tolerance per encoding as (info, distance, in_scope) or None"""
+        tolerance = FACE_RECOGNITION_CONFIG['tolerance']
+        results, status = self.search(encodings, 1, scope)
+        matches = [(r[0], r[0]['distance'], True) if r and r[0]['distance'] <= tolerance else None
+                   for r in results]
+
+        if scope and fallback:
+            missing = [i for i, match in enumerate(matches) if match is None]
+            if missing:
+                fallback_results, fallback_status = self.search([encodings[i] for i in missing], 1)
+                for i, r in zip(missing, fallback_results):
+                    if r and r[0]['distance'] <= tolerance:
+                        matches[i] = (r[0], r[0]['distance'], False)
+                status['failed'] += fallback_status['failed']
+                status['partial'] = status['partial'] or fallback_status['partial']
+        return matches, status
+
+    def status(self):
+        """Gallery status of every node"""
+        futures = {node: self._executor.submit(
+            lambda node: _session().get(node + '/status', timeout=self.timeout).json(), node)
+            for node in self.nodes}
+        statuses = {}
+        for node, future in futures.items():
+            try:
+                statuses[node] = future.result(timeout=self.timeout * 2)
+            except Exception as e:
+                statuses[node] = {'error': str(e)}
+        return statuses
@@ -0,0 +1,235 @@
+# Shared-memory gallery for multi-process deployments
+import json
+import struct
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# Segment header: generation, encoding count, encoding dimension, metadata length
+_HEADER = struct.Struct('<qqqq')
+_ENCODING_DIM = 128
+
+
+def _attach(name):
+    """Attach to an existing segment without letting this process unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers attached segments with the resource tracker
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def _create_persistent(name, size):
+    """Create a segment that outlives this process (not unlinked by the resource tracker)"""
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def _view(segment, dtype, shape, offset=0):
+    """Array view over a segment; np.frombuffer holds a buffer export so the
+    segment cannot be unmapped underneath a live view"""
+    count = int(np.prod(shape))
+    return np.frombuffer(segment.buf, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+
+def _data_segment_name(prefix, generation):
+    return f"{prefix}_{generation}"
+
+
+def _array_layout(count, dim):
+    """Byte offsets of the encoding matrix, encoding id and person id arrays"""
+    encodings_offset = _HEADER.size
+    encoding_ids_offset = encodings_offset + count * dim * 8
+    person_ids_offset = encoding_ids_offset + count * 8
+    metadata_offset = person_ids_offset + count * 8
+    return encodings_offset, encoding_ids_offset, person_ids_offset, metadata_offset
+
+
+class SharedGalleryPublisher:
+    """Owns the shared gallery segments; run by a single loader process per host"""
+
+    def __init__(self, name):
+        self.name = name
+        self.segments = []
+        try:
+            # Outlives the loader, so readers keep watching the same counter across restarts
+            self.control = _create_persistent(name, 8)
+            self.generation = 0
+        except FileExistsError:
+            # A previous loader left the control block behind; continue its generations
+            self.control = _attach(name)
+            self.generation = int(_view(self.control, np.int64, (1,))[0])
+        self._generation_counter = _view(self.control, np.int64, (1,))
+        self._generation_counter[0] = self.generation
+
+    def publish(self, gallery):
+        """Publish gallery arrays shaped like DatabaseManager.load_gallery_arrays output
+        as a new generation"""
+        persons = gallery['persons']
+        person_ids = np.asarray(gallery['person_ids'], dtype=np.int64)
+        count = len(person_ids)
+        # Readers map partitions as slices only if rows are grouped by site
+        sites = {person_id: info.get('site') or '' for person_id, info in persons.items()}
+        ranks = {site: rank for rank, site in enumerate(sorted(set(sites.values())))}
+        row_ranks = np.array([ranks[sites[person_id]] for person_id in person_ids.tolist()],
+                             dtype=np.int32)
+        order = np.argsort(row_ranks, kind='stable')
+        metadata = json.dumps(persons, ensure_ascii=False).encode('utf-8')
+
+        generation = self.generation + 1
+        encodings_offset, encoding_ids_offset, person_ids_offset, metadata_offset = \
+            _array_layout(count, _ENCODING_DIM)
+        segment = shared_memory.SharedMemory(
+            name=_data_segment_name(self.name, generation),
+            create=True,
+            size=metadata_offset + len(metadata)
+        )
+        _HEADER.pack_into(segment.buf, 0, generation, count, _ENCODING_DIM, len(metadata))
+
+        encodings = _view(segment, np.float64, (count, _ENCODING_DIM), encodings_offset)
+        encoding_ids = _view(segment, np.int64, (count,), encoding_ids_offset)
+        shared_person_ids = _view(segment, np.int64, (count,), person_ids_offset)
+        # Gathered straight into the segment, without an intermediate copy
+        np.take(np.asarray(gallery['encodings'], dtype=np.float64), order, axis=0, out=encodings)
+        np.take(np.asarray(gallery['encoding_ids'], dtype=np.int64), order, out=encoding_ids)
+        np.take(person_ids, order, out=shared_person_ids)
+        segment.buf[metadata_offset:metadata_offset + len(metadata)] = metadata
+        del encodings, encoding_ids, shared_person_ids
+
+        # A single aligned 8-byte store; readers switch to the new segment on their next check
+        self._generation_counter[0] = generation
+        self.generation = generation
+        self.segments.append(segment)
+
+        # Keep the previous generation alive for readers that are still attaching to it
+        while len(self.segments) > 2:
+            old = self.segments.pop(0)
+            old.close()
+            old.unlink()
+        return generation
+
+    def close(self):
+        """Unlink the data segments owned by this publisher.
+
+        The control block stays: workers keep their mapping of it, and the next
+        loader continues its generations there, where they will see them.
+        """
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+        del self._generation_counter
+        self.control.close()
+
+
+class SharedGalleryReader:
+    """Maps the current shared gallery generation into a worker process.
+
+    Any thread may call refresh(); one remaps at a time and the others return
+    at once, keeping the generation they already have.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.control = None
+        self.segment = None
+        self.generation = 0
+        self.encodings = np.empty((0, _ENCODING_DIM), dtype=np.float64)
+        self.encoding_ids = np.empty((0,), dtype=np.int64)
+        self.person_ids = np.empty((0,), dtype=np.int64)
+        self.persons = {}
+        self._generation_counter = None
+        self._retired = []
+        # Guards the mapping state (segment, _retired, control) during remaps
+        self._remap_lock = threading.Lock()
+
+    def _current_generation(self):
+        if self._generation_counter is None:
+            try:
+                self.control = _attach(self.name)
+            except FileNotFoundError:
+                return 0
+            self._generation_counter = _view(self.control, np.int64, (1,))
+        return int(self._generation_counter[0])
+
+    def refresh(self):
+        """Remap the gallery if the loader published a new generation; returns True on change.
+
+        Returns False without waiting while another thread is remapping.
+        """
+        if not self._remap_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._refresh()
+        finally:
+            self._remap_lock.release()
+
+    def _refresh(self):
+        generation = self._current_generation()
+        if generation == self.generation or generation == 0:
+            self._release_retired()
+            return False
+
+        try:
+            segment = _attach(_data_segment_name(self.name, generation))
+        except FileNotFoundError:
+            # The loader already moved past this generation, or the control block
+            # was recreated under this name; re-attach to it on the next check
+            self._detach_control()
+            return False
+
+        _, count, dim, metadata_length = _HEADER.unpack_from(segment.buf, 0)
+        encodings_offset, encoding_ids_offset, person_ids_offset, metadata_offset = \
+            _array_layout(count, dim)
+        metadata = bytes(segment.buf[metadata_offset:metadata_offset + metadata_length])
+        persons = {int(pid): info for pid, info in json.loads(metadata.decode('utf-8')).items()}
+
+        old_segment = self.segment
+        self.encodings = _view(segment, np.float64, (count, dim), encodings_offset)
+        self.encoding_ids = _view(segment, np.int64, (count,), encoding_ids_offset)
+        self.person_ids = _view(segment, np.int64, (count,), person_ids_offset)
+        self.persons = persons
+        self.segment = segment
+        self.generation = generation
+
+        if old_segment is not None:
+            self._retired.append(old_segment)
+        self._release_retired()
+        return True
+
+    def _release_retired(self):
+        """Close old segments once no request still holds views into them"""
+        still_busy = []
+        for segment in self._retired:
+            try:
+                segment.close()
+            except BufferError:
+                still_busy.append(segment)
+        self._retired = still_busy
+
+    def close(self):
+        """Drop all views and detach from the shared segments"""
+        with self._remap_lock:
+            self._close()
+
+    def _close(self):
+        self.encodings = np.empty((0, _ENCODING_DIM), dtype=np.float64)
+        self.encoding_ids = np.empty((0,), dtype=np.int64)
+        self.person_ids = np.empty((0,), dtype=np.int64)
+        if self.segment is not None:
+            self._retired.append(self.segment)
+            self.segment = None
+        self._release_retired()
+        self._detach_control()
+
+    def _detach_control(self):
+        if self.control is not None:
+            self._generation_counter = None
+            self.control.close()
+            self.control = None
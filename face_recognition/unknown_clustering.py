@@ -0,0 +1,186 @@
+# Offline clustering of unrecognized face encodings
+import numpy as np
+from config import UNKNOWN_FACES_CONFIG
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 with path halving"""
+
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    def labels(self):
+        """Dense component label per element"""
+        roots = np.array([self.find(i) for i in range(len(self.parent))])
+        return np.unique(roots, return_inverse=True)[1]
+
+
+def blocked_neighbors(queries, targets, threshold, max_neighbors, same_set=False):
+    """Yield (query index, target indices, distances) for targets within threshold.
+
+    Distances are computed block by block as |q|^2 + |t|^2 - 2 q.t, and each
+    block is folded into a running top-max_neighbors per query, so memory stays
+    at block_size^2 floats however many encodings there are or however many of
+    them fall within threshold. At most max_neighbors closest targets are kept
+    per query.
+    """
+    block_size = UNKNOWN_FACES_CONFIG['block_size']
+    queries = np.asarray(queries, dtype=np.float32)
+    targets = np.asarray(targets, dtype=np.float32)
+    query_norms = np.einsum('ij,ij->i', queries, queries)
+    target_norms = np.einsum('ij,ij->i', targets, targets)
+    limit = threshold * threshold
+
+    for q_start in range(0, len(queries), block_size):
+        q_end = min(q_start + block_size, len(queries))
+        best_d = np.full((q_end - q_start, max_neighbors), np.inf, dtype=np.float32)
+        best_i = np.full((q_end - q_start, max_neighbors), -1, dtype=np.int64)
+        for t_start in range(0, len(targets), block_size):
+            t_end = min(t_start + block_size, len(targets))
+            squared = (query_norms[q_start:q_end, None] + target_norms[None, t_start:t_end]
+                       - 2.0 * queries[q_start:q_end] @ targets[t_start:t_end].T)
+            if same_set:
+                # Only pairs (i, j) with j > i; the union is symmetric anyway
+                rows = np.arange(q_start, q_end)[:, None]
+                cols = np.arange(t_start, t_end)[None, :]
+                squared[cols <= rows] = np.inf
+            squared[squared > limit] = np.inf
+            # This block's closest few per query, merged into the running best
+            take = min(max_neighbors, squared.shape[1])
+            part = np.argpartition(squared, take - 1, axis=1)[:, :take]
+            merged_d = np.concatenate([best_d, np.take_along_axis(squared, part, axis=1)], axis=1)
+            merged_i = np.concatenate([best_i, part + t_start], axis=1)
+            keep = np.argpartition(merged_d, max_neighbors - 1, axis=1)[:, :max_neighbors]
+            best_d = np.take_along_axis(merged_d, keep, axis=1)
+            best_i = np.take_along_axis(merged_i, keep, axis=1)
+        order = np.argsort(best_d, axis=1, kind='stable')
+        best_d = np.take_along_axis(best_d, order, axis=1)
+        best_i = np.take_along_axis(best_i, order, axis=1)
+        for offset in range(q_end - q_start):
+            hits = np.isfinite(best_d[offset])
+            if hits.any():
+                yield (q_start + offset, best_i[offset][hits],
+                       np.sqrt(np.maximum(best_d[offset][hits], 0.0)))
+
+
+def cluster_encodings(encodings, threshold=None, max_neighbors=None):
+    """Connected components of the thresholded k-nearest-neighbour graph; returns a label per row"""
+    threshold = threshold or UNKNOWN_FACES_CONFIG['cluster_threshold']
+    max_neighbors = max_neighbors or UNKNOWN_FACES_CONFIG['max_neighbors']
+    sets = UnionFind(len(encodings))
+    for index, neighbors, _ in blocked_neighbors(encodings, encodings, threshold,
+                                                 max_neighbors, same_set=True):
+        for neighbor in neighbors:
+            sets.union(index, neighbor)
+    return sets.labels()
+
+
+def assign_to_centroids(encodings, centroids, threshold=None):
+    """Index of the nearest centroid within threshold for each encoding, or -1"""
+    threshold = threshold or UNKNOWN_FACES_CONFIG['cluster_threshold']
+    assignment = np.full(len(encodings), -1, dtype=np.int64)
+    if len(encodings) and len(centroids):
+        for index, neighbors, _ in blocked_neighbors(encodings, centroids, threshold, 1):
+            assignment[index] = neighbors[0]
+    return assignment
+
+
+def representative_subset(encodings, count, min_distance=0.0):
+    """Indices of up to count encodings covering the set: the medoid first,
+    then repeatedly the member farthest from those already chosen.
+
+    Stops early once every remaining member is within min_distance of a
+    chosen one, so near-duplicates are never picked twice.
+    """
+    encodings = np.asarray(encodings, dtype=np.float64)
+    if len(encodings) <= count and min_distance <= 0:
+        return list(range(len(encodings)))
+    centroid = encodings.mean(axis=0)
+    chosen = [int(np.argmin(np.linalg.norm(encodings - centroid, axis=1)))]
+    nearest = np.linalg.norm(encodings - encodings[chosen[0]], axis=1)
+    while len(chosen) < count:
+        index = int(np.argmax(nearest))
+        if nearest[index] <= min_distance:
+            break
+        chosen.append(index)
+        nearest = np.minimum(nearest, np.linalg.norm(encodings - encodings[index], axis=1))
+    return chosen
+
+
+def _load_unclustered(db_manager):
+    """(ids, encodings) of all recent unclustered unknown faces, read in pages"""
+    ids, encodings = [], []
+    after_id = 0
+    while True:
+        page = db_manager.get_unclustered_unknown_faces(
+            UNKNOWN_FACES_CONFIG['window_days'], after_id, UNKNOWN_FACES_CONFIG['fetch_size']
+        )
+        if page is None:
+            raise RuntimeError("读取未识别人脸失败")
+        if not page:
+            break
+        for face_id, encoding in page:
+            ids.append(face_id)
+            encodings.append(encoding)
+        after_id = page[-1][0]
+    return (np.array(ids, dtype=np.int64),
+            np.array(encodings, dtype=np.float32).reshape(-1, 128))
+
+
+def cluster_unknown_faces(db_manager):
+    """One incremental clustering pass over the unknown_faces table.
+
+    New unknowns first join the nearest existing cluster; the rest are
+    clustered among themselves and groups of at least min_cluster_size become
+    new clusters. Smaller groups stay unclustered and are retried on later
+    passes until they age out of window_days. Returns a stats dict.
+    """
+    clusters = db_manager.get_unknown_clusters()
+    if clusters is None:
+        raise RuntimeError("读取未识别人脸聚类失败")
+    face_ids, encodings = _load_unclustered(db_manager)
+
+    centroids = np.array([c['centroid'] for c in clusters], dtype=np.float32).reshape(-1, 128)
+    assignment = assign_to_centroids(encodings, centroids)
+
+    updated = []
+    for index in np.unique(assignment[assignment >= 0]):
+        members = np.flatnonzero(assignment == index)
+        cluster = clusters[index]
+        size = cluster['size'] + len(members)
+        # Running mean over old and new members
+        centroid = (centroids[index] * cluster['size'] + encodings[members].sum(axis=0)) / size
+        updated.append((cluster['id'], centroid.astype(np.float64), size, face_ids[members].tolist()))
+
+    created = []
+    remaining = np.flatnonzero(assignment < 0)
+    if len(remaining):
+        labels = cluster_encodings(encodings[remaining])
+        counts = np.bincount(labels)
+        for label in np.flatnonzero(counts >= UNKNOWN_FACES_CONFIG['min_cluster_size']):
+            members = remaining[labels == label]
+            created.append((encodings[members].mean(axis=0).astype(np.float64),
+                            len(members), face_ids[members].tolist()))
+
+    if (updated or created) and not db_manager.save_unknown_clusters(updated, created):
+        raise RuntimeError("保存聚类结果失败")
+
+    return {
+        'unclustered': len(face_ids),
+        'joined_existing': int((assignment >= 0).sum()),
+        'updated_clusters': len(updated),
+        'new_clusters': len(created),
+        'new_cluster_faces': sum(size for _, size, _ in created)
+    }
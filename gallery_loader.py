@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Face recognition system - shared gallery loader
+
+Run one instance per host before starting multi-process web workers with
+SHARED_GALLERY_CONFIG['enabled'] = True.
+"""
+
+import sys
+import time
+import numpy as np
+from config import SHARED_GALLERY_CONFIG, CHANGE_FEED_CONFIG, GALLERY_CONFIG
+from database.db_manager import DatabaseManager
+from face_recognition.shared_gallery import SharedGalleryPublisher
+from face_recognition.change_feed import GalleryChangeFeed, apply_delta_to_arrays
+
+def load_all(db_manager, change_feed):
+    """Full gallery arrays, with the change feed started at the watermark of the same snapshot"""
+    # Streamed straight into arrays; the watermark is a gap window back, so
+    # changes still uncommitted now are not skipped
+    gallery = db_manager.load_gallery_arrays(
+        np.float64, GALLERY_CONFIG['load_chunk_size'],
+        watermark_lookback=CHANGE_FEED_CONFIG['gap_timeout']
+    )
+    if gallery is None:
+        # Publishing an empty gallery would make every worker forget every face
+        raise RuntimeError("读取人脸库失败")
+    change_feed.start_at(gallery['watermark'])
+    return gallery
+
+def main():
+    print("=" * 50)
+    print("人脸识别系统 - 共享人脸库加载进程")
+    print("=" * 50)
+
+    db_manager = DatabaseManager()
+    publisher = SharedGalleryPublisher(SHARED_GALLERY_CONFIG['name'])
+
+    change_feed = GalleryChangeFeed(db_manager)
+
+    try:
+        # Full load once; afterwards only deltas from the change feed are applied
+        gallery = load_all(db_manager, change_feed)
+        generation = publisher.publish(gallery)
+        print(f"Published shared gallery generation {generation} "
+              f"with {len(gallery['encoding_ids'])} known faces")
+
+        while True:
+            time.sleep(CHANGE_FEED_CONFIG['poll_interval'])
+            watermark = change_feed.watermark
+            delta = change_feed.poll()
+            if delta is None or delta.is_empty():
+                continue
+            if delta.reload:
+                # A re-encoding job replaced every encoding; start over from a fresh load
+                try:
+                    gallery = load_all(db_manager, change_feed)
+                except RuntimeError as e:
+                    # Keep the last good gallery published; the reload change is read again next poll
+                    print(f"重新加载人脸库失败: {e}")
+                    change_feed.start_at(watermark)
+                    continue
+            else:
+                gallery = apply_delta_to_arrays(gallery, delta)
+            generation = publisher.publish(gallery)
+            print(f"Published shared gallery generation {generation} "
+                  f"(watermark {change_feed.watermark}) with {len(gallery['encoding_ids'])} known faces")
+    except KeyboardInterrupt:
+        print("\n加载进程已停止")
+    except Exception as e:
+        print(f"发布共享人脸库时发生错误: {e}")
+        sys.exit(1)
+    finally:
+        publisher.close()
+        db_manager.disconnect()
+
+if __name__ == '__main__':
+    main()
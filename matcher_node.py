@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Face recognition system - gallery shard matcher node
+
+Holds the persons hashed to one shard and answers match queries from the web
+front end (SHARDING_CONFIG). Start one per entry in SHARDING_CONFIG['nodes']:
+
+    python matcher_node.py 0
+    python matcher_node.py 1
+"""
+
+import sys
+from urllib.parse import urlparse
+from flask import Flask, request, jsonify
+from config import SHARDING_CONFIG, GALLERY_CONFIG
+from face_recognition.face_detector import FaceDetector
+
+app = Flask(__name__)
+face_detector = None
+
+@app.route('/match', methods=['POST'])
+def match():
+    """Top-k persons of this shard for each encoding"""
+    try:
+        data = request.get_json(silent=True) or {}
+        k = int(data.get('k', 1))
+        if k < 1:
+            return jsonify({'error': 'k 必须为正整数'}), 400
+        k = min(k, GALLERY_CONFIG['search_max_k'])
+        results, gallery_version, _ = face_detector.search(data['encodings'], k, data.get('scope'))
+        return jsonify({
+            'results': results,
+            'gallery_version': gallery_version,
+            'shard': face_detector.shard[0]
+        })
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'无效的请求: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'匹配时出错: {str(e)}'}), 500
+
+@app.route('/status', methods=['GET'])
+def status():
+    return jsonify(face_detector.gallery_status())
+
+def main():
+    nodes = SHARDING_CONFIG['nodes']
+    if len(sys.argv) != 2 or not sys.argv[1].isdigit() or int(sys.argv[1]) >= len(nodes):
+        print(f"Usage: python matcher_node.py <0-{len(nodes) - 1}>")
+        sys.exit(1)
+    index = int(sys.argv[1])
+
+    global face_detector
+    face_detector = FaceDetector(shard=(index, len(nodes)))
+    print(f"Shard {index}/{len(nodes)}: {len(face_detector.gallery)} known faces")
+
+    address = urlparse(nodes[index])
+    app.run(host=address.hostname, port=address.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Face recognition system - gallery re-encoding
+
+Re-encodes every stored face from its source image with new encoding settings
+(REENCODE_CONFIG['profile']), in id order, in a process pool. Each batch is
+committed together with the job's checkpoint, so an interrupted run resumes
+where it stopped. Once every encoding is done the new version is activated in
+one transaction and running detectors reload the gallery.
+
+Usage:
+    python reencode_gallery.py [--profile NAME] [--workers N] [--batch-size N]
+    python reencode_gallery.py --status
+    python reencode_gallery.py --abandon
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import face_recognition
+from config import FACE_RECOGNITION_CONFIG, REENCODE_CONFIG
+from database.db_manager import DatabaseManager
+from face_recognition.encoding_pool import configured_workers, fork_available
+from face_recognition.image_io import decode_image
+from face_recognition.profiles import get_profile
+
+STATUS_TEXT = {
+    'building': '进行中',
+    'active': '当前使用',
+    'retired': '已停用',
+    'abandoned': '已放弃'
+}
+
+# Encoding settings of the job, set once per worker process
+_settings = None
+
+def _init_worker(settings):
+    global _settings
+    _settings = settings
+
+def reencode_face(row):
+    """Worker: (encoding_id, new encoding or None, error or None) for one stored encoding"""
+    encoding_id, image_path, old_encoding = row
+    if not image_path or not os.path.exists(image_path):
+        return encoding_id, None, "原图不存在"
+    try:
+        image, _, _ = decode_image(image_path, _settings['max_size'])
+        locations = face_recognition.face_locations(
+            image,
+            model=_settings['model'],
+            number_of_times_to_upsample=_settings['upsample']
+        )
+        if not locations:
+            return encoding_id, None, "未检测到人脸"
+        encodings = face_recognition.face_encodings(
+            image, locations, num_jitters=_settings['num_jitters'], model=_settings['landmark_model']
+        )
+    except Exception as e:
+        return encoding_id, None, f"编码失败: {e}"
+
+    # The image may show several people (encodings enrolled from clusters of
+    # unknown faces come from group photos); keep the face the old encoding was of
+    distances = np.linalg.norm(np.asarray(encodings) - old_encoding, axis=1)
+    best = int(np.argmin(distances))
+    if distances[best] > FACE_RECOGNITION_CONFIG['tolerance']:
+        return encoding_id, None, f"没有与原编码相符的人脸（最近距离 {distances[best]:.3f}）"
+    return encoding_id, encodings[best], None
+
+def reencode(db_manager, job, workers, batch_size):
+    """Re-encode everything past the job's checkpoint; returns True once no encodings remain"""
+    version = job['version']
+    encoded, failed = job['encoded'], job['failed']
+    processed = 0
+    started = time.time()
+
+    def submit(executor, rows):
+        return executor.map(reencode_face, rows, chunksize=max(1, len(rows) // (workers * 4)))
+
+    # Forked workers inherit the loaded models instead of re-importing this script;
+    # elsewhere (Windows, macOS) they start fresh and the initializer sets them up
+    context = multiprocessing.get_context('fork') if fork_available() else None
+    with ProcessPoolExecutor(workers, mp_context=context,
+                             initializer=_init_worker, initargs=(job['settings'],)) as executor:
+        rows = db_manager.get_face_encodings_after(job['last_encoding_id'], batch_size)
+        pending = submit(executor, rows) if rows else None
+        while rows:
+            results = list(pending)
+            # Keep the workers busy with the next batch while this one is written
+            next_rows = db_manager.get_face_encodings_after(rows[-1][0], batch_size)
+            if next_rows is None:
+                return False
+            pending = submit(executor, next_rows) if next_rows else None
+
+            new_encodings = [(encoding_id, encoding) for encoding_id, encoding, _ in results
+                             if encoding is not None]
+            errors = [(encoding_id, error) for encoding_id, _, error in results if error is not None]
+            if not db_manager.save_reencoded_batch(version, new_encodings, rows[-1][0], len(errors)):
+                print("保存重新编码结果失败（任务可能已被放弃）")
+                return False
+            for encoding_id, error in errors:
+                print(f"  编码 {encoding_id}: {error}")
+
+            encoded += len(new_encodings)
+            failed += len(errors)
+            processed += len(rows)
+            rate = processed / max(time.time() - started, 1e-9)
+            print(f"已处理至编码 id {rows[-1][0]}：成功 {encoded}，失败 {failed}（{rate:.1f} 个/秒）")
+            rows = next_rows
+    return rows is not None
+
+def print_status(db_manager, versions):
+    if not versions:
+        print("尚未运行过重新编码，当前为版本 1（默认档位设置）")
+    for version in versions:
+        print(f"版本 {version['version']}  {STATUS_TEXT.get(version['status'], version['status'])}  "
+              f"档位 {version['settings'].get('profile')}  成功 {version['encoded']}  "
+              f"失败 {version['failed']}  检查点 {version['last_encoding_id']}")
+    active = db_manager.get_active_encoding_version()
+    if active is not None:
+        stale = db_manager.count_stale_face_encodings(active[0])
+        print(f"当前版本 {active[0]}，未按当前设置生成的编码: {stale}")
+
+def main():
+    parser = argparse.ArgumentParser(description="人脸库重新编码")
+    parser.add_argument('--profile', help="新编码使用的档位（默认 REENCODE_CONFIG['profile']）")
+    parser.add_argument('--workers', type=int, help="编码进程数（默认 REENCODE_CONFIG['workers']）")
+    parser.add_argument('--batch-size', type=int, default=REENCODE_CONFIG['batch_size'],
+                        help="每批编码数")
+    parser.add_argument('--status', action='store_true', help="只显示各编码版本与进度")
+    parser.add_argument('--abandon', action='store_true', help="放弃未完成的重新编码任务")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("人脸识别系统 - 人脸库重新编码")
+    print("=" * 50)
+
+    db_manager = DatabaseManager()
+    try:
+        versions = db_manager.get_encoding_versions()
+        if versions is None:
+            print("读取编码版本失败")
+            sys.exit(1)
+        if args.status:
+            print_status(db_manager, versions)
+            return
+
+        job = next((version for version in versions if version['status'] == 'building'), None)
+        if args.abandon:
+            if job is None:
+                print("没有未完成的重新编码任务")
+            elif db_manager.abandon_encoding_version(job['version']):
+                print(f"已放弃版本 {job['version']} 的重新编码任务")
+            return
+
+        profile = args.profile or REENCODE_CONFIG['profile'] or FACE_RECOGNITION_CONFIG['default_profile']
+        settings = dict(get_profile(profile), profile=profile)
+        if job is None:
+            active = db_manager.get_active_encoding_version()
+            if active is None:
+                sys.exit(1)
+            if active[1] == settings and db_manager.count_stale_face_encodings(active[0]) == 0:
+                print(f"所有编码已按档位 {profile} 的当前设置生成（版本 {active[0]}），无需重新编码")
+                return
+            version = db_manager.create_encoding_version(settings)
+            if version is None:
+                print("创建重新编码任务失败")
+                sys.exit(1)
+            job = {'version': version, 'settings': settings,
+                   'last_encoding_id': 0, 'encoded': 0, 'failed': 0}
+            print(f"开始重新编码：版本 {version}，档位 {profile}")
+        elif args.profile and job['settings'] != settings:
+            print(f"版本 {job['version']} 的任务尚未完成且设置不同，请先完成该任务或使用 --abandon 放弃")
+            sys.exit(1)
+        else:
+            print(f"从检查点继续版本 {job['version']}（已处理至编码 id {job['last_encoding_id']}）")
+
+        workers = args.workers or REENCODE_CONFIG['workers'] or configured_workers()
+        if not reencode(db_manager, job, workers, args.batch_size):
+            print("重新编码未完成，再次运行将从检查点继续")
+            sys.exit(1)
+
+        # Encodings added while the job ran were picked up by its last batches
+        replaced = db_manager.activate_encoding_version(job['version'])
+        if replaced is None:
+            print("激活新版本失败，再次运行将重试")
+            sys.exit(1)
+        # Running detectors reload the gallery via the change feed
+        print(f"已激活版本 {job['version']}，替换了 {replaced} 个编码")
+        stale = db_manager.count_stale_face_encodings(job['version'])
+        if stale:
+            print(f"{stale} 个编码未能重新编码，仍为旧版本（可用 --status 查看）")
+    except KeyboardInterrupt:
+        print("\n已中断，再次运行将从检查点继续")
+    finally:
+        db_manager.disconnect()
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,17 @@ import mysql.connector
 from mysql.connector import Error
 from config import DATABASE_CONFIG
 
+def add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table; returns True if it was added"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (DATABASE_CONFIG['database'], table, column))
+    if cursor.fetchone()[0]:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
 def create_database():
     """Create database and tables"""
     try:
@@ -40,11 +51,18 @@ def create_database():
                     email VARCHAR(100),
                     address TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    site VARCHAR(50),
+                    INDEX idx_persons_site (site)
                 )
             """)
             print("Persons table created successfully")
             
+            # Migrate databases created before gallery partitions existed
+            if add_column_if_missing(cursor, 'persons', 'site', 'VARCHAR(50)'):
+                cursor.execute("CREATE INDEX idx_persons_site ON persons (site)")
+                print("Added site column to persons table")
+            
             # Create face encodings table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS face_encodings (
@@ -53,11 +71,44 @@ def create_database():
                     face_encoding BLOB NOT NULL,
                     image_path VARCHAR(500),
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    encoding_version INT NOT NULL DEFAULT 1,
                     FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE CASCADE
                 )
             """)
             print("Face encodings table created successfully")
             
+            # Migrate databases created before encodings were versioned
+            if add_column_if_missing(cursor, 'face_encodings', 'encoding_version',
+                                     'INT NOT NULL DEFAULT 1'):
+                print("Added encoding_version column to face_encodings table")
+            
+            # Create encoding versions table (re-encoding jobs and their checkpoints)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS encoding_versions (
+                    version INT PRIMARY KEY,
+                    settings TEXT NOT NULL,
+                    status VARCHAR(20) NOT NULL,
+                    last_encoding_id INT NOT NULL DEFAULT 0,
+                    encoded INT NOT NULL DEFAULT 0,
+                    failed INT NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    activated_at TIMESTAMP NULL
+                )
+            """)
+            print("Encoding versions table created successfully")
+            
+            # Create staging table for re-encoded encodings awaiting activation
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS face_encodings_staging (
+                    version INT NOT NULL,
+                    encoding_id INT NOT NULL,
+                    face_encoding BLOB NOT NULL,
+                    PRIMARY KEY (version, encoding_id),
+                    FOREIGN KEY (encoding_id) REFERENCES face_encodings(id) ON DELETE CASCADE
+                )
+            """)
+            print("Face encodings staging table created successfully")
+            
             # Create recognition logs table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS recognition_logs (
@@ -66,11 +117,67 @@ def create_database():
                     confidence FLOAT,
                     image_path VARCHAR(500),
                     recognition_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    source VARCHAR(500),
+                    first_seen TIMESTAMP(3) NULL,
+                    last_seen TIMESTAMP(3) NULL,
+                    hit_count INT NOT NULL DEFAULT 1,
                     FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE SET NULL
                 )
             """)
             print("Recognition logs table created successfully")
             
+            # Migrate databases created before recognition logs were merged per sighting
+            for column, definition in (('source', 'VARCHAR(500)'),
+                                       ('first_seen', 'TIMESTAMP(3) NULL'),
+                                       ('last_seen', 'TIMESTAMP(3) NULL'),
+                                       ('hit_count', 'INT NOT NULL DEFAULT 1')):
+                if add_column_if_missing(cursor, 'recognition_logs', column, definition):
+                    print(f"Added {column} column to recognition_logs table")
+            
+            # Create gallery change log table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS gallery_changes (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    entity VARCHAR(20) NOT NULL,
+                    entity_id INT NOT NULL,
+                    person_id INT NOT NULL,
+                    operation VARCHAR(10) NOT NULL,
+                    changed_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3)
+                )
+            """)
+            print("Gallery changes table created successfully")
+
+            # Create unknown faces table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS unknown_faces (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    face_encoding BLOB NOT NULL,
+                    image_path VARCHAR(500),
+                    face_top INT,
+                    face_right INT,
+                    face_bottom INT,
+                    face_left INT,
+                    cluster_id INT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_unknown_cluster (cluster_id, created_at)
+                )
+            """)
+            print("Unknown faces table created successfully")
+
+            # Create unknown face clusters table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS unknown_clusters (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    centroid BLOB NOT NULL,
+                    size INT NOT NULL DEFAULT 0,
+                    enrolled_person_id INT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    FOREIGN KEY (enrolled_person_id) REFERENCES persons(id) ON DELETE SET NULL
+                )
+            """)
+            print("Unknown clusters table created successfully")
+            
             cursor.close()
             connection.close()
             print("Database initialization complete!")
@@ -0,0 +1,106 @@
+import threading
+import time
+import pytest
+from face_recognition.admission import AdmissionController, DeadlineExpired, Overloaded
+
+
+def hold_slot(controller, entered, release):
+    with controller.slot():
+        entered.set()
+        release.wait()
+
+
+def busy_controller(max_queue, queue_timeout=5):
+    """Controller with its only slot held by a background thread"""
+    controller = AdmissionController(max_concurrency=1, max_queue=max_queue, queue_timeout=queue_timeout)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(controller, entered, release), daemon=True)
+    holder.start()
+    assert entered.wait(5)
+    return controller, release, holder
+
+
+def test_free_slot_is_admitted_without_waiting():
+    controller = AdmissionController(max_concurrency=2, max_queue=0, queue_timeout=1)
+    with controller.slot() as waited:
+        assert waited < 0.1
+        assert controller.status()['active'] == 1
+    assert controller.status()['active'] == 0
+
+
+def test_full_queue_is_rejected_at_once():
+    controller, release, holder = busy_controller(max_queue=0)
+    started = time.monotonic()
+    with pytest.raises(Overloaded) as excinfo:
+        with controller.slot():
+            pass
+    assert excinfo.value.queue_full
+    assert excinfo.value.retry_after >= 1
+    assert time.monotonic() - started < 0.5
+    release.set()
+    holder.join()
+    assert controller.status()['rejected'] == 1
+
+
+def test_queue_timeout_is_overloaded_not_queue_full():
+    controller, release, holder = busy_controller(max_queue=1, queue_timeout=0.1)
+    with pytest.raises(Overloaded) as excinfo:
+        with controller.slot():
+            pass
+    assert not excinfo.value.queue_full
+    release.set()
+    holder.join()
+    status = controller.status()
+    assert (status['rejected'], status['expired'], status['waiting']) == (1, 0, 0)
+
+
+def test_passed_deadline_is_dropped_before_queueing():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+    with pytest.raises(DeadlineExpired):
+        with controller.slot(deadline=time.monotonic() - 1):
+            pass
+    assert controller.status()['expired'] == 1
+
+
+def test_deadline_passing_in_queue_is_expired():
+    controller, release, holder = busy_controller(max_queue=1, queue_timeout=5)
+    with pytest.raises(DeadlineExpired):
+        with controller.slot(deadline=time.monotonic() + 0.1):
+            pass
+    release.set()
+    holder.join()
+    status = controller.status()
+    assert (status['rejected'], status['expired']) == (0, 1)
+
+
+def test_queued_request_runs_when_slot_frees():
+    controller, release, holder = busy_controller(max_queue=1, queue_timeout=5)
+    threading.Timer(0.1, release.set).start()
+    with controller.slot() as waited:
+        assert waited >= 0.05
+    holder.join()
+    assert controller.status()['rejected'] == 0
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    controller, release, holder = busy_controller(max_queue=5, queue_timeout=5)
+    order = []
+
+    def wait_turn(i):
+        with controller.slot():
+            order.append(i)
+
+    waiters = []
+    for i in range(4):
+        waiter = threading.Thread(target=wait_turn, args=(i,))
+        waiter.start()
+        waiters.append(waiter)
+        # Queue them one at a time so arrival order is known
+        while controller.status()['waiting'] < i + 1:
+            time.sleep(0.001)
+    release.set()
+    holder.join()
+    for waiter in waiters:
+        waiter.join()
+    assert order == [0, 1, 2, 3]
+    assert controller.status()['active'] == 0
@@ -0,0 +1,47 @@
+import threading
+import numpy as np
+from face_recognition.batching import MicroBatcher
+from face_recognition.gallery import GallerySnapshot
+
+
+def snapshot(version, seed):
+    rng = np.random.default_rng(seed)
+    count = 40
+    return GallerySnapshot.from_arrays(version, rng.normal(size=(count, 128)),
+                                       np.arange(count), np.arange(count) % 8,
+                                       {i: {'person_id': i, 'name': str(i)} for i in range(8)})
+
+
+def test_concurrent_requests_get_their_own_results():
+    batcher = MicroBatcher(window_ms=20, max_batch=64)
+    snapshots = [snapshot(1, 0), snapshot(2, 1)]
+    rng = np.random.default_rng(2)
+    requests = [(snapshots[i % 2], rng.normal(size=(1 + i % 3, 128)), 1 + i % 2) for i in range(12)]
+    results = [None] * len(requests)
+    start = threading.Barrier(len(requests))
+
+    def run(i):
+        target, encodings, k = requests[i]
+        start.wait()
+        results[i] = batcher.nearest(target, encodings, k)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for (target, encodings, k), result in zip(requests, results):
+        expected = target.nearest_batch(encodings, k)
+        assert len(result) == len(expected)
+        for (indices, distances), (expected_indices, expected_distances) in zip(result, expected):
+            np.testing.assert_array_equal(indices, expected_indices)
+            np.testing.assert_allclose(distances, expected_distances)
+    # Requests were actually combined
+    assert batcher.batches < len(requests)
+    # Counted per encoding, not per request
+    assert batcher.status()['queries'] == sum(len(encodings) for _, encodings, _ in requests)
+
+
+def test_empty_request_returns_immediately():
+    assert MicroBatcher(window_ms=1).nearest(snapshot(1, 0), np.empty((0, 128))) == []
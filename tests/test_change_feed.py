@@ -0,0 +1,152 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from face_recognition import change_feed
+from face_recognition.change_feed import GalleryChangeFeed, GalleryDelta, apply_delta_to_arrays
+
+
+def change(change_id, entity, entity_id, person_id, operation):
+    return {'id': change_id, 'entity': entity, 'entity_id': entity_id, 'person_id': person_id,
+            'operation': operation, 'changed_at': datetime.now()}
+
+
+def row(encoding_id, person_id, name='a', site=None):
+    return {'encoding_id': encoding_id, 'person_id': person_id, 'name': name, 'age': None,
+            'gender': None, 'phone': None, 'email': None, 'address': None, 'site': site,
+            'face_encoding': np.full(128, float(encoding_id))}
+
+
+class FakeDB:
+    def __init__(self, changes=(), rows=(), persons=None):
+        self.changes = list(changes)
+        self.rows = {r['encoding_id']: r for r in rows}
+        self.persons = persons or {}
+        self.fail = False
+
+    def get_gallery_changes(self, since_id, limit):
+        return [c for c in self.changes if c['id'] > since_id][:limit]
+
+    def get_face_encodings_by_ids(self, encoding_ids):
+        if self.fail:
+            return None
+        return [self.rows[i] for i in encoding_ids if i in self.rows]
+
+    def get_persons_by_ids(self, person_ids):
+        if self.fail:
+            return None
+        return {i: self.persons[i] for i in person_ids if i in self.persons}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(change_feed.time, 'time', lambda: now[0])
+    return now
+
+
+def test_poll_applies_contiguous_changes_and_advances_watermark(clock):
+    db = FakeDB([change(1, 'encoding', 10, 1, 'insert'), change(2, 'person', 1, 1, 'update')],
+                rows=[row(10, 1)], persons={1: {'person_id': 1, 'name': 'b'}})
+    feed = GalleryChangeFeed(db)
+    delta = feed.poll()
+    assert [r['encoding_id'] for r in delta.added_rows] == [10]
+    assert delta.updated_persons == {1: {'person_id': 1, 'name': 'b'}}
+    assert feed.watermark == 2
+
+
+def test_poll_stops_at_gap_until_timeout(clock):
+    db = FakeDB([change(1, 'encoding', 10, 1, 'insert'), change(3, 'encoding', 30, 1, 'insert')],
+                rows=[row(10, 1), row(30, 1)])
+    feed = GalleryChangeFeed(db)
+    delta = feed.poll()
+    assert [r['encoding_id'] for r in delta.added_rows] == [10]
+    assert feed.watermark == 1
+    assert feed.status()['waiting_on_gap']
+
+    # Still inside gap_timeout: keep waiting for change 2
+    clock[0] += change_feed.CHANGE_FEED_CONFIG['gap_timeout'] / 2
+    assert feed.poll().is_empty()
+    assert feed.watermark == 1
+
+    # Change 2 never commits: skip it once gap_timeout has passed
+    clock[0] += change_feed.CHANGE_FEED_CONFIG['gap_timeout']
+    delta = feed.poll()
+    assert [r['encoding_id'] for r in delta.added_rows] == [30]
+    assert feed.watermark == 3
+    assert not feed.status()['waiting_on_gap']
+
+
+def test_gap_filled_before_timeout(clock):
+    db = FakeDB([change(1, 'encoding', 10, 1, 'insert'), change(3, 'encoding', 30, 1, 'insert')],
+                rows=[row(10, 1), row(20, 1), row(30, 1)])
+    feed = GalleryChangeFeed(db)
+    feed.poll()
+    db.changes.insert(1, change(2, 'encoding', 20, 1, 'insert'))
+    clock[0] += 1
+    delta = feed.poll()
+    assert [r['encoding_id'] for r in delta.added_rows] == [20, 30]
+    assert feed.watermark == 3
+
+
+def test_failed_fetch_keeps_watermark(clock):
+    db = FakeDB([change(1, 'encoding', 10, 1, 'insert')], rows=[row(10, 1)])
+    feed = GalleryChangeFeed(db)
+    db.fail = True
+    assert feed.poll() is None
+    assert feed.watermark == 0
+    db.fail = False
+    delta = feed.poll()
+    assert [r['encoding_id'] for r in delta.added_rows] == [10]
+    assert feed.watermark == 1
+
+
+def test_insert_then_delete_nets_out(clock):
+    db = FakeDB([change(1, 'encoding', 10, 1, 'insert'), change(2, 'encoding', 10, 1, 'delete')],
+                rows=[row(10, 1)])
+    delta = GalleryChangeFeed(db).poll()
+    assert delta.added_rows == []
+    assert delta.removed_encoding_ids == {10}
+
+
+def test_person_delete_cancels_pending_update(clock):
+    db = FakeDB([change(1, 'person', 1, 1, 'update'), change(2, 'person', 1, 1, 'delete')],
+                persons={1: {'person_id': 1, 'name': 'b'}})
+    delta = GalleryChangeFeed(db).poll()
+    assert delta.removed_person_ids == {1}
+    assert delta.updated_persons == {}
+
+
+def test_reload_change_skips_row_fetches(clock):
+    db = FakeDB([change(1, 'encoding', 10, 1, 'insert'), change(2, 'gallery', 2, 0, 'reload')])
+    db.fail = True
+    delta = GalleryChangeFeed(db).poll()
+    assert delta.reload and not delta.is_empty()
+
+
+def arrays(rows):
+    return {
+        'encodings': np.array([r['face_encoding'] for r in rows]),
+        'encoding_ids': np.array([r['encoding_id'] for r in rows], dtype=np.int64),
+        'person_ids': np.array([r['person_id'] for r in rows], dtype=np.int64),
+        'persons': {r['person_id']: {'person_id': r['person_id'], 'name': r['name'], 'site': r['site']}
+                    for r in rows}
+    }
+
+
+def test_apply_delta_to_arrays_is_idempotent():
+    gallery = arrays([row(1, 1), row(2, 2), row(3, 3)])
+    delta = GalleryDelta()
+    delta.removed_person_ids = {2}
+    delta.removed_encoding_ids = {3}
+    delta.updated_persons = {1: {'person_id': 1, 'name': 'renamed'}}
+    delta.added_rows = [row(4, 1)]
+    once = apply_delta_to_arrays(gallery, delta)
+    twice = apply_delta_to_arrays(once, delta)
+    for result in (once, twice):
+        assert result['encoding_ids'].tolist() == [1, 4]
+        assert result['person_ids'].tolist() == [1, 1]
+        assert result['encodings'][:, 0].tolist() == [1.0, 4.0]
+        # Person 3 lost its only encoding
+        assert set(result['persons']) == {1}
+        assert result['persons'][1]['name'] == 'renamed'
+    assert gallery['encoding_ids'].tolist() == [1, 2, 3]
@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+from face_recognition import gallery as gallery_module
+from face_recognition.change_feed import GalleryDelta
+from face_recognition.gallery import GallerySnapshot
+
+
+def make_row(encoding_id, person_id, encoding, site=None, name=None):
+    return {'encoding_id': encoding_id, 'person_id': person_id, 'face_encoding': encoding,
+            'name': name or f'p{person_id}', 'age': None, 'gender': None, 'phone': None,
+            'email': None, 'address': None, 'site': site}
+
+
+@pytest.fixture
+def rows():
+    """Three encodings each for six persons around well-separated centres, on two sites"""
+    rng = np.random.default_rng(0)
+    rows = []
+    for person_id in range(1, 7):
+        centre = rng.normal(size=128) * 0.3
+        site = 'north' if person_id <= 2 else 'south' if person_id <= 4 else None
+        for j in range(3):
+            rows.append(make_row(person_id * 10 + j, person_id,
+                                 centre + rng.normal(size=128) * 0.01, site))
+    return rows
+
+
+def encoding_of(snapshot, encoding_id):
+    return snapshot.encodings[list(snapshot.encoding_ids).index(encoding_id)]
+
+
+def test_rows_are_grouped_by_site_with_partitions(rows):
+    snapshot = GallerySnapshot.from_rows(1, rows[::-1])
+    assert set(snapshot.partitions) == {'north', 'south'}
+    assert sorted(snapshot.partitions['north'].person_ids.tolist()) == [1] * 3 + [2] * 3
+    for index in range(len(snapshot)):
+        assert snapshot.info(index)['person_id'] == snapshot.person_ids[index]
+
+
+def test_scoped(rows):
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    assert set(snapshot.scoped(['north']).person_ids.tolist()) == {1, 2}
+    assert set(snapshot.scoped(['north', 'south']).person_ids.tolist()) == {1, 2, 3, 4}
+    assert len(snapshot.scoped(['nowhere'])) == 0
+    # Cached per scope
+    assert snapshot.scoped(['south', 'north']) is snapshot.scoped(['north', 'south'])
+
+
+def test_with_delta_leaves_original_untouched(rows):
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    delta = GalleryDelta()
+    delta.removed_person_ids = {2}
+    delta.removed_encoding_ids = {30}
+    delta.updated_persons = {1: dict(snapshot.info(0), person_id=1, name='renamed', site='south')}
+    delta.added_rows = [make_row(99, 7, np.ones(128), 'north', 'new'),
+                        make_row(31, 3, np.full(128, 2.0), 'south')]
+    updated = snapshot.with_delta(2, delta)
+
+    assert updated.version == 2
+    ids = set(updated.encoding_ids.tolist())
+    assert not ids & {20, 21, 22, 30}
+    assert {99, 31, 10, 32} <= ids
+    np.testing.assert_array_equal(encoding_of(updated, 31), np.full(128, 2.0))
+    names = {updated.info(i)['person_id']: updated.info(i)['name'] for i in range(len(updated))}
+    assert names[1] == 'renamed' and names[7] == 'new'
+    # Moved site follows the updated info
+    assert 1 in updated.partitions['south'].person_ids.tolist()
+
+    assert snapshot.version == 1 and len(snapshot) == len(rows)
+    assert 20 in snapshot.encoding_ids.tolist()
+    assert snapshot.info(list(snapshot.person_ids).index(1))['name'] == 'p1'
+
+
+def test_with_delta_is_idempotent(rows):
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    delta = GalleryDelta()
+    delta.added_rows = [make_row(99, 7, np.ones(128))]
+    delta.removed_encoding_ids = {10}
+    once = snapshot.with_delta(2, delta)
+    twice = once.with_delta(3, delta)
+    assert sorted(once.encoding_ids.tolist()) == sorted(twice.encoding_ids.tolist())
+
+
+def test_search_returns_one_hit_per_person(rows):
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    query = encoding_of(snapshot, 30)
+    hits = snapshot.search(query, 3)
+    persons = [snapshot.info(index)['person_id'] for index, _ in hits]
+    assert persons[0] == 3
+    assert len(set(persons)) == 3
+    assert [d for _, d in hits] == sorted(d for _, d in hits)
+
+
+def test_search_widens_past_crowding_person(rows):
+    # One person with many more encodings than the initial shortlist
+    crowd = [make_row(1000 + i, 50, np.full(128, 0.01 * i / 100)) for i in range(100)]
+    snapshot = GallerySnapshot.from_rows(1, rows + crowd)
+    hits = snapshot.search(np.zeros(128), 4)
+    persons = [snapshot.info(index)['person_id'] for index, _ in hits]
+    assert persons[0] == 50 and len(set(persons)) == 4
+
+
+def test_search_edge_cases(rows):
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    assert snapshot.search(np.zeros(128), 0) == []
+    assert len(snapshot.search(np.zeros(128), 100)) == 6
+    assert GallerySnapshot.empty().search(np.zeros(128), 5) == []
+
+
+@pytest.mark.parametrize('quantization', [None, 'float16', 'int8'])
+def test_nearest_batch_matches_exact_scan(monkeypatch, rows, quantization):
+    monkeypatch.setitem(gallery_module.GALLERY_CONFIG, 'quantization', quantization)
+    monkeypatch.setitem(gallery_module.GALLERY_CONFIG, 'scan_block_size', 5)
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    rng = np.random.default_rng(1)
+    queries = np.array([encoding_of(snapshot, eid) + rng.normal(size=128) * 0.005
+                        for eid in (10, 21, 32, 40, 51, 62)])
+
+    for query, (indices, distances) in zip(queries, snapshot.nearest_batch(queries, 3)):
+        exact = np.linalg.norm(snapshot.encodings - query, axis=1)
+        expected = np.argsort(exact)[:3]
+        np.testing.assert_array_equal(np.sort(indices), np.sort(expected))
+        np.testing.assert_allclose(distances, exact[expected], rtol=1e-6)
+        single_indices, single_distances = snapshot.nearest(query, 3)
+        np.testing.assert_array_equal(indices, single_indices)
+        np.testing.assert_allclose(distances, single_distances)
+
+
+def test_nearest_batch_edge_cases(rows):
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    assert [len(i) for i, _ in snapshot.nearest_batch(np.zeros((2, 128)), 0)] == [0, 0]
+    results = GallerySnapshot.empty().nearest_batch(np.zeros((2, 128)))
+    assert [len(i) for i, _ in results] == [0, 0]
+    indices, _ = snapshot.nearest_batch(np.zeros((1, 128)), 1000)[0]
+    assert len(indices) == len(rows)
+
+
+@pytest.mark.parametrize('quantization', ['float16', 'int8'])
+def test_with_delta_quantizes_only_added_rows(monkeypatch, rows, quantization):
+    monkeypatch.setitem(gallery_module.GALLERY_CONFIG, 'quantization', quantization)
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    delta = GalleryDelta()
+    delta.removed_person_ids = {2}
+    delta.removed_encoding_ids = {30}
+    delta.added_rows = [make_row(99, 7, encoding_of(snapshot, 40) * 0.5, 'north')]
+    monkeypatch.setattr(gallery_module.QuantizedEncodings, '__init__',
+                        lambda *args: pytest.fail("whole gallery quantized again"))
+    updated = snapshot.with_delta(2, delta)
+
+    assert updated.quantized.scale is snapshot.quantized.scale
+    old_rows = {eid: i for i, eid in enumerate(snapshot.encoding_ids.tolist())}
+    for i, encoding_id in enumerate(updated.encoding_ids.tolist()):
+        if encoding_id in old_rows:
+            np.testing.assert_array_equal(updated.quantized.codes[i],
+                                          snapshot.quantized.codes[old_rows[encoding_id]])
+            assert updated.quantized.norms[i] == snapshot.quantized.norms[old_rows[encoding_id]]
+    query = encoding_of(updated, 99)
+    indices, distances = updated.nearest_batch(query[None, :], 1)[0]
+    assert updated.encoding_ids[indices[0]] == 99 and distances[0] < 1e-6
+
+
+def test_with_delta_requantizes_when_int8_scale_overflows(monkeypatch, rows):
+    monkeypatch.setitem(gallery_module.GALLERY_CONFIG, 'quantization', 'int8')
+    snapshot = GallerySnapshot.from_rows(1, rows)
+    delta = GalleryDelta()
+    delta.added_rows = [make_row(99, 7, np.full(128, 100.0))]
+    updated = snapshot.with_delta(2, delta)
+    assert updated.quantized.scale is not snapshot.quantized.scale
+    indices, _ = updated.nearest(np.full(128, 100.0))
+    assert updated.encoding_ids[indices[0]] == 99
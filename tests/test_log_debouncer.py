@@ -0,0 +1,84 @@
+import threading
+import pytest
+from face_recognition import log_debouncer
+from face_recognition.log_debouncer import RecognitionLogDebouncer
+
+
+class FakeDB:
+    def __init__(self):
+        self.records = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def add_recognition_logs(self, records):
+        self.gate.wait()
+        self.records.extend(records)
+        return True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(log_debouncer.time, 'time', lambda: now[0])
+    return now
+
+
+def by_person(records):
+    return {(r[0], r[3]): r for r in records}
+
+
+def test_repeat_sightings_merge_into_one_record(clock):
+    db = FakeDB()
+    debouncer = RecognitionLogDebouncer(db, window=30, max_pending=100)
+    debouncer.record(1, 0.5, 'a.jpg', 'cam1')
+    clock[0] += 5
+    debouncer.record(1, 0.8, 'b.jpg', 'cam1')
+    clock[0] += 5
+    debouncer.record(1, 0.6, 'c.jpg', 'cam1')
+    debouncer.record(1, 0.9, 'd.jpg', 'cam2')
+    debouncer.flush()
+
+    records = by_person(db.records)
+    assert len(db.records) == 2
+    person_id, confidence, image_path, source, first_seen, last_seen, hits = records[(1, 'cam1')]
+    assert (confidence, image_path, hits) == (0.8, 'b.jpg', 3)
+    assert (last_seen - first_seen).total_seconds() == 10
+    assert records[(1, 'cam2')][6] == 1
+    assert debouncer.status()['written'] == 2
+
+
+def test_sighting_after_window_opens_new_record(clock):
+    db = FakeDB()
+    debouncer = RecognitionLogDebouncer(db, window=30, max_pending=100)
+    debouncer.record(1, 0.5, 'a.jpg', 'cam1')
+    clock[0] += 31
+    debouncer.record(1, 0.6, 'b.jpg', 'cam1')
+    debouncer.flush()
+    assert sorted(r[6] for r in db.records) == [1, 1]
+    assert sorted(r[2] for r in db.records) == ['a.jpg', 'b.jpg']
+
+
+def test_max_pending_closes_oldest_early(clock):
+    db = FakeDB()
+    debouncer = RecognitionLogDebouncer(db, window=30, max_pending=2)
+    for person_id in (1, 2, 3):
+        debouncer.record(person_id, 0.5, 'a.jpg', 'cam1')
+    assert debouncer.status()['pending'] == 2
+    debouncer.record(1, 0.7, 'b.jpg', 'cam1')
+    debouncer.flush()
+    # Person 1's first record was closed early, so the later sighting opened another
+    assert sorted(r[0] for r in db.records) == [1, 1, 2, 3]
+
+
+def test_backlog_is_shed_when_database_stalls(clock):
+    db = FakeDB()
+    db.gate.clear()
+    debouncer = RecognitionLogDebouncer(db, window=30, max_pending=2)
+    for person_id in range(1, 11):
+        debouncer.record(person_id, 0.5, 'a.jpg', 'cam1')
+    db.gate.set()
+    debouncer.flush()
+    status = debouncer.status()
+    assert status['dropped'] > 0
+    assert status['written'] + status['dropped'] == 10
+    assert len(db.records) == status['written']
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from face_recognition import unknown_clustering
+from face_recognition.unknown_clustering import blocked_neighbors, cluster_encodings
+
+
+def brute_force(queries, targets, threshold, max_neighbors, same_set):
+    expected = {}
+    for i, query in enumerate(queries):
+        distances = np.linalg.norm(targets - query, axis=1)
+        candidates = [(d, j) for j, d in enumerate(distances)
+                      if d <= threshold and (not same_set or j > i)]
+        if candidates:
+            expected[i] = sorted(candidates)[:max_neighbors]
+    return expected
+
+
+@pytest.mark.parametrize('same_set', [False, True])
+def test_blocked_neighbors_matches_brute_force(monkeypatch, same_set):
+    monkeypatch.setitem(unknown_clustering.UNKNOWN_FACES_CONFIG, 'block_size', 7)
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(30, 128)) * 0.03
+    targets = queries if same_set else rng.normal(size=(45, 128)) * 0.03
+    threshold = float(np.median(np.linalg.norm(targets - queries[0], axis=1)))
+
+    found = {index: (list(neighbors), list(distances)) for index, neighbors, distances
+             in blocked_neighbors(queries, targets, threshold, 4, same_set=same_set)}
+    expected = brute_force(queries, targets, threshold, 4, same_set)
+    assert set(found) == set(expected)
+    for index, hits in expected.items():
+        neighbors, distances = found[index]
+        assert neighbors == [j for _, j in hits]
+        np.testing.assert_allclose(distances, [d for d, _ in hits], atol=1e-4)
+
+
+def test_blocked_neighbors_keeps_at_most_max_neighbors_for_crowded_queries(monkeypatch):
+    monkeypatch.setitem(unknown_clustering.UNKNOWN_FACES_CONFIG, 'block_size', 16)
+    # A frequent visitor: far more near-identical sightings than max_neighbors
+    rng = np.random.default_rng(1)
+    sightings = np.ones(128) * 0.1 + rng.normal(size=(100, 128)) * 1e-3
+    for _, neighbors, distances in blocked_neighbors(sightings[:1], sightings, 0.5, 3):
+        assert len(neighbors) == 3
+        assert list(distances) == sorted(distances)
+
+
+def test_cluster_encodings_separates_people():
+    rng = np.random.default_rng(2)
+    a = rng.normal(size=128) * 0.1
+    b = a + 1.0
+    encodings = np.vstack([a + rng.normal(size=(5, 128)) * 0.005,
+                           b + rng.normal(size=(4, 128)) * 0.005])
+    labels = cluster_encodings(encodings, threshold=0.3, max_neighbors=2)
+    assert len(set(labels[:5])) == 1 and len(set(labels[5:])) == 1
+    assert labels[0] != labels[5]
@@ -1,12 +1,20 @@
 # Flask web application
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, make_response, g
 from flask_cors import CORS
-import os
+import functools
+import io
+import json
+import time
 import uuid
-from werkzeug.utils import secure_filename
 from face_recognition.face_detector import FaceDetector
+from face_recognition.image_io import (LRUCache, render_annotated, validate_face_locations,
+                                       decode_image)
+from face_recognition.profiles import get_profile
+from face_recognition.admission import AdmissionController, Overloaded, DeadlineExpired
 from database.db_manager import DatabaseManager
-from config import UPLOAD_FOLDER, FLASK_CONFIG
+from database.upload_store import UploadStore
+from config import (UPLOAD_FOLDER, FLASK_CONFIG, ANNOTATION_CONFIG, GALLERY_CONFIG,
+                    UNKNOWN_FACES_CONFIG)
 
 app = Flask(__name__)
 CORS(app)
@@ -25,12 +33,97 @@ def allowed_file(filename):
 face_detector = FaceDetector()
 db_manager = DatabaseManager()
 
+# Content-addressed upload files; the cleaner gets its own connection
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'])
+upload_store.start_cleaner(DatabaseManager())
+
+# Bounded queue in front of detection
+admission = AdmissionController()
+
+# Recent upload results (for re-rendering) and rendered annotated images
+recent_uploads = LRUCache(ANNOTATION_CONFIG['cache_size'])
+annotated_images = LRUCache(ANNOTATION_CONFIG['cache_size'])
+
+def parse_scope(value):
+    """Sites from a comma-separated string or a JSON list; None when absent"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    sites = [str(site).strip() for site in value if str(site).strip()]
+    return sites or None
+
+def request_deadline():
+    """time.monotonic() deadline from the X-Request-Timeout header (seconds), if any"""
+    timeout = request.headers.get('X-Request-Timeout', type=float)
+    if timeout is None:
+        return None
+    return time.monotonic() + timeout
+
+def admission_controlled(view):
+    """Run a view inside an admission slot; overload is answered at once with
+    429 (queue full) or 503 (queue wait timed out) and a Retry-After header"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            with admission.slot(request_deadline()) as queue_wait:
+                g.queue_wait = queue_wait
+                g.admitted_at = time.monotonic()
+                response = make_response(view(*args, **kwargs))
+                processing = time.monotonic() - g.admitted_at
+        except Overloaded as e:
+            response = make_response(jsonify({'error': str(e), 'retry_after': e.retry_after}),
+                                     429 if e.queue_full else 503)
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        except DeadlineExpired as e:
+            return jsonify({'error': str(e)}), 504
+        response.headers['Server-Timing'] = (f"queue;dur={queue_wait * 1000:.1f}, "
+                                             f"process;dur={processing * 1000:.1f}")
+        return response
+    return wrapper
+
+def request_timing():
+    """Queue wait and processing time so far for an admission-controlled request"""
+    return {
+        'queue_wait_ms': round(g.queue_wait * 1000, 1),
+        'processing_ms': round((time.monotonic() - g.admitted_at) * 1000, 1)
+    }
+
+def annotation_options(args):
+    """Read and clamp annotation output options from query/form arguments"""
+    image_format = args.get('format', ANNOTATION_CONFIG['format']).lower()
+    if image_format not in ('jpeg', 'webp'):
+        image_format = ANNOTATION_CONFIG['format']
+    quality = min(max(args.get('quality', ANNOTATION_CONFIG['quality'], type=int), 1), 100)
+    max_size = min(max(args.get('max_size', ANNOTATION_CONFIG['max_size'], type=int), 64),
+                   ANNOTATION_CONFIG['max_size'])
+    return image_format, quality, max_size
+
+def get_annotated_image(upload_id, image_format, quality, max_size):
+    """Rendered annotated image for an upload, from cache when possible"""
+    key = (upload_id, image_format, quality, max_size)
+    cached = annotated_images.get(key)
+    if cached is not None:
+        return cached
+    
+    upload = recent_uploads.get(upload_id)
+    if upload is None:
+        return None
+    filepath, results = upload
+    # Decode straight to the output size; no re-detection
+    image, scale, _ = decode_image(filepath, max_size)
+    rendered = render_annotated(image, results, image_format, quality, max_size, image_scale=scale)
+    annotated_images.put(key, rendered)
+    return rendered
+
 @app.route('/')
 def index():
     """Home"""
     return render_template('index.html')
 
 @app.route('/upload', methods=['POST'])
+@admission_controlled
 def upload_file():
     """Upload image and recognize faces"""
     try:
@@ -41,28 +134,118 @@ def upload_file():
         if file.filename == '':
             return jsonify({'error': '没有选择文件'}), 400
         
+        # Named speed/accuracy profile
+        profile = request.values.get('profile') or None
+        try:
+            get_profile(profile)
+        except ValueError:
+            return jsonify({'error': f'未知的识别档位: {profile}'}), 400
+        
+        # Optional caller-supplied face boxes: JSON [[top, right, bottom, left], ...]
+        face_locations = None
+        if request.values.get('face_locations'):
+            try:
+                face_locations = validate_face_locations(json.loads(request.values['face_locations']))
+            except ValueError as e:
+                return jsonify({'error': f'无效的人脸框: {str(e)}'}), 400
+        
+        # Optional gallery partitions to search, e.g. scope=site-a,site-b
+        scope = parse_scope(request.values.get('scope'))
+        fallback = None
+        if request.values.get('fallback'):
+            fallback = request.values['fallback'].lower() == 'true'
+        
         if file and allowed_file(file.filename):
-            # Generate unique filename
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
+            # Identical uploads share one stored file; upload_id names this request
+            upload_id = str(uuid.uuid4())
+            filepath = upload_store.save(file.stream, file.filename)
             
-            # Recognize faces
-            results = face_detector.recognize_faces(filepath)
+            # Recognize faces (decodes at the profile's working size)
+            # Repeat sightings per source are merged in the recognition log
+            source = request.values.get('source') or request.remote_addr
+            results, gallery_version = face_detector.recognize_faces(
+                filepath, profile=profile, face_locations=face_locations,
+                scope=scope, fallback=fallback, source=source, with_version=True
+            )
+            recent_uploads.put(upload_id, (filepath, results))
             
-            return jsonify({
+            response = {
                 'success': True,
                 'results': results,
-                'image_path': filepath
-            })
+                'gallery_version': gallery_version,
+                'image_path': filepath,
+                'upload_id': upload_id
+            }
+            
+            if request.values.get('annotate', '').lower() == 'true':
+                image_format, quality, max_size = annotation_options(request.values)
+                get_annotated_image(upload_id, image_format, quality, max_size)
+                response['annotated_url'] = (f"/annotated/{upload_id}?format={image_format}"
+                                             f"&quality={quality}&max_size={max_size}")
+            
+            response['timing'] = request_timing()
+            
+            return jsonify(response)
         else:
             return jsonify({'error': '不支持的文件类型'}), 400
     
     except Exception as e:
         return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
 
+@app.route('/search', methods=['POST'])
+def search():
+    """Top-k persons for one or more 128-d face encodings (no detection)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        encodings = data.get('encodings')
+        if encodings is None and 'encoding' in data:
+            encodings = [data['encoding']]
+        if not encodings:
+            return jsonify({'error': '缺少人脸编码 (encoding 或 encodings)'}), 400
+        
+        try:
+            k = int(data.get('k', 5))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'k 必须是整数'}), 400
+        if k < 1 or k > GALLERY_CONFIG['search_max_k']:
+            return jsonify({'error': f"k 必须在 1-{GALLERY_CONFIG['search_max_k']} 之间"}), 400
+        
+        try:
+            results, gallery_version, shards = face_detector.search(
+                encodings, k, scope=parse_scope(data.get('scope'))
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'无效的人脸编码: {str(e)}'}), 400
+        
+        response = {
+            'success': True,
+            'results': results,
+            'gallery_version': gallery_version
+        }
+        if shards is not None:
+            response['shards'] = shards
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': f'搜索时出错: {str(e)}'}), 500
+
+@app.route('/annotated/<upload_id>', methods=['GET'])
+def annotated_image(upload_id):
+    """Annotated image for a recent upload"""
+    try:
+        image_format, quality, max_size = annotation_options(request.args)
+        rendered = get_annotated_image(upload_id, image_format, quality, max_size)
+        if rendered is None:
+            return jsonify({'error': '未找到该上传记录'}), 404
+        
+        data, mimetype = rendered
+        response = send_file(io.BytesIO(data), mimetype=mimetype)
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        return response
+    except Exception as e:
+        return jsonify({'error': f'生成标注图片时出错: {str(e)}'}), 500
+
 @app.route('/add_person', methods=['POST'])
+@admission_controlled
 def add_person():
     """Add new person"""
     try:
@@ -74,10 +257,7 @@ def add_person():
         file = request.files['file']
         if file and allowed_file(file.filename):
             # Save file
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
+            filepath = upload_store.save(file.stream, file.filename)
             
             # Add person info
             success, message = face_detector.add_new_person(filepath, data)
@@ -107,7 +287,11 @@ def get_recognition_logs():
     """获取识别记录"""
     try:
         limit = request.args.get('limit', 50, type=int)
-        logs = db_manager.get_recognition_logs(limit)
+        logs = db_manager.get_recognition_logs(
+            limit,
+            after_id=request.args.get('after_id', type=int),
+            before_id=request.args.get('before_id', type=int)
+        )
         return jsonify({'logs': logs})
     except Exception as e:
         return jsonify({'error': f'获取识别记录时出错: {str(e)}'}), 500
@@ -118,8 +302,8 @@ def delete_person(person_id):
     try:
         success = db_manager.delete_person(person_id)
         if success:
-            # 重新加载已知人脸
-            face_detector.load_known_faces()
+            # 同步人脸库变更
+            face_detector.sync_gallery_changes()
             return jsonify({'success': True, 'message': '删除成功'})
         else:
             return jsonify({'error': '删除失败'}), 500
@@ -134,14 +318,69 @@ def update_person(person_id):
         success = db_manager.update_person(person_id, **data)
         
         if success:
-            # 重新加载已知人脸
-            face_detector.load_known_faces()
+            # 同步人脸库变更
+            face_detector.sync_gallery_changes()
             return jsonify({'success': True, 'message': '更新成功'})
         else:
             return jsonify({'error': '更新失败'}), 500
     except Exception as e:
         return jsonify({'error': f'更新人员信息时出错: {str(e)}'}), 500
 
+@app.route('/unknown_clusters', methods=['GET'])
+def get_unknown_clusters():
+    """未识别人脸聚类候选（由 cluster_unknowns.py 生成）"""
+    try:
+        min_size = request.args.get('min_size', UNKNOWN_FACES_CONFIG['min_cluster_size'], type=int)
+        limit = request.args.get('limit', 50, type=int)
+        samples = request.args.get('samples', 3, type=int)
+        clusters = db_manager.get_unknown_clusters(min_size, limit)
+        if clusters is None:
+            return jsonify({'error': '获取聚类失败'}), 500
+        
+        result = []
+        for cluster in clusters:
+            faces = db_manager.get_unknown_cluster_faces(cluster['id'], samples)
+            result.append({
+                'id': cluster['id'],
+                'size': cluster['size'],
+                'created_at': cluster['created_at'],
+                'updated_at': cluster['updated_at'],
+                'samples': [{'image_path': face['image_path'],
+                             'face_location': face['face_location']} for face in faces]
+            })
+        return jsonify({'clusters': result})
+    except Exception as e:
+        return jsonify({'error': f'获取聚类时出错: {str(e)}'}), 500
+
+@app.route('/unknown_clusters/<int:cluster_id>/enroll', methods=['POST'])
+def enroll_unknown_cluster(cluster_id):
+    """将未识别人脸聚类一键登记为人员"""
+    try:
+        data = request.get_json(silent=True) or request.form.to_dict()
+        if not data.get('name'):
+            return jsonify({'error': '缺少姓名'}), 400
+        
+        success, message = face_detector.enroll_unknown_cluster(cluster_id, data)
+        if success:
+            return jsonify({'success': True, 'message': message})
+        else:
+            return jsonify({'error': message}), 400
+    except Exception as e:
+        return jsonify({'error': f'登记聚类时出错: {str(e)}'}), 500
+
+@app.route('/admission_status', methods=['GET'])
+def admission_status():
+    """识别请求的并发与排队状态"""
+    return jsonify(admission.status())
+
+@app.route('/gallery_status', methods=['GET'])
+def gallery_status():
+    """人脸库状态与同步延迟"""
+    try:
+        return jsonify(face_detector.gallery_status())
+    except Exception as e:
+        return jsonify({'error': f'获取人脸库状态时出错: {str(e)}'}), 500
+
 if __name__ == '__main__':
     app.run(
         host=FLASK_CONFIG['host'],